@@ -1,5 +1,6 @@
-import networkx as nx, uuid, schema as S
-import re
+import random, schema as S
+from core.graph import ProblemGraph
+import re, bisect
 
 # === Mode alias & canonicalization (add this near the top of builder.py) ===
 MODE_ALIAS = {
@@ -10,6 +11,9 @@ MODE_ALIAS = {
     # ("tree", "loop_closed_cnt") 等
 }
 
+def _is_dyn_type(t: str) -> bool:
+    return bool(re.fullmatch(r'(Length|Interval)\d+', t))
+
 def _canonical_mode(topic: str, mode: str) -> str:
     """将 (topic, mode) 归一到模板库用的规范名"""
     if not topic or not mode:
@@ -17,9 +21,22 @@ def _canonical_mode(topic: str, mode: str) -> str:
     return MODE_ALIAS.get((topic, mode), mode)
 
 class GraphBuilder:
-    def __init__(self):
-        self.G = nx.MultiDiGraph()
+    def __init__(self, *, id_seed=None):
+        """id_seed：None -> 节点 id 按类型顺序编号（Length_1、Length_2…）；
+        给定种子 -> 4 位十六进制伪随机后缀，同一种子每次运行结果相同"""
+        self.G = ProblemGraph()
+        self._id_seed = id_seed
+        self._id_rng = None if id_seed is None else random.Random(id_seed)
+        self._id_cnt: dict[str, int] = {}
         self.last_map: dict[str, str] = {} # 记录最新节点 id
+        # 节点索引：type -> 按加入顺序的 id 列表；(type, value) -> id 列表
+        self._seq: dict[str, int] = {}
+        self._next_seq = 0
+        self._by_type: dict[str, list] = {}
+        self._by_tv: dict[tuple, list] = {}
+        # 边索引：(u, v, type) -> 条数；type -> {(u, v): None}（按加入顺序）
+        self._edge_cnt: dict[tuple, int] = {}
+        self._by_etype: dict[str, dict] = {}
 
     # === 2025-10-27 新增：候选题型池 ===
     def add_candidate(self, topic, mode=None, confidence=1.0, source=None, notes=None):
@@ -33,8 +50,8 @@ class GraphBuilder:
 
     def clone_empty(self):
         """为某个候选 topic 重新抽取时，复制一个‘空图’（仅保留文本等图级元数据）"""
-        nb = GraphBuilder()
-        for k in ("raw_text", "target"):
+        nb = GraphBuilder(id_seed=self._id_seed)
+        for k in ("raw_text", "spans", "target"):
             if k in self.G.graph:
                 nb.G.graph[k] = self.G.graph[k]
         return nb
@@ -46,6 +63,103 @@ class GraphBuilder:
         """返回最近加入的同类型节点 id；若不存在返回 None"""
         return self.last_map.get(type_)
 
+    def _new_id(self, type_: str) -> str:
+        """新节点 id：同一 builder 内单调、不重复，跨运行可复现"""
+        if self._id_rng is None:
+            # 直接往 G 里加的节点（如 graph_debugger）也用 Type_k 格式，跳过已被占用的编号
+            while True:
+                n = self._id_cnt[type_] = self._id_cnt.get(type_, 0) + 1
+                nid = f"{type_}_{n}"
+                if nid not in self.G.nodes: return nid
+        while True:
+            nid = f"{type_}_{self._id_rng.getrandbits(16):04x}"
+            if nid not in self.G.nodes: return nid
+
+    # === 节点索引 ===
+    @staticmethod
+    def _tv_key(type_, value):
+        """(type, value) 索引键；value 不可哈希时返回 None（只进 type 索引）"""
+        try:
+            hash(value)
+        except TypeError:
+            return None
+        return (type_, value)
+
+    def _index_put(self, table, key, nid):
+        if key is None: return
+        ids = table.setdefault(key, [])
+        if not ids or self._seq[ids[-1]] < self._seq[nid]:
+            ids.append(nid)
+        else:
+            bisect.insort(ids, nid, key=self._seq.__getitem__)
+
+    def _index_drop(self, table, key, nid):
+        if key is None: return
+        ids = table.get(key)
+        if ids and nid in ids:
+            ids.remove(nid)
+            if not ids: del table[key]
+
+    def _index_node(self, nid, data):
+        self._index_put(self._by_type, data.get("type"), nid)
+        self._index_put(self._by_tv, self._tv_key(data.get("type"), data.get("value")), nid)
+
+    def _reindex(self):
+        """按 G 当前内容重建节点索引（外部直接改了 G 时兜底）"""
+        self._seq = {nid: i for i, nid in enumerate(self.G.nodes)}
+        self._next_seq = len(self._seq)
+        self._by_type, self._by_tv = {}, {}
+        for nid, data in self.G.nodes(data=True):
+            self._index_node(nid, data)
+
+    def _first_tv(self, type_, value):
+        """第一个 type/value 都相等的节点；索引与图不一致时重建一次"""
+        key = self._tv_key(type_, value)
+        if key is None:
+            return next((nid for nid in self._by_type.get(type_, ())
+                         if self.G.nodes[nid].get("value") == value), None)
+        for retry in (False, True):
+            ids = self._by_tv.get(key)
+            if not ids: return None
+            d = self.G.nodes.get(ids[0])
+            if d is not None and d.get("type") == type_ and d.get("value") == value:
+                return ids[0]
+            if retry: return None
+            self._reindex()
+
+    def nodes_of(self, type_) -> list:
+        """某类型节点 id（按加入顺序），只读用"""
+        return self._by_type.get(type_, [])
+
+    def set_value(self, nid, value):
+        """改节点 value，并同步 (type, value) 索引"""
+        d = self.G.nodes[nid]
+        self._index_drop(self._by_tv, self._tv_key(d.get("type"), d.get("value")), nid)
+        d["value"] = value
+        self._index_put(self._by_tv, self._tv_key(d.get("type"), value), nid)
+
+    def retype(self, nid, type_):
+        """原地改节点类型（如 Length -> Length1），同步索引；last_map 不动，与原地改名的旧行为一致"""
+        if type_ not in S.NODE_TYPES and _is_dyn_type(type_):
+            S.NODE_TYPES.add(type_)
+        d = self.G.nodes[nid]
+        self._index_drop(self._by_type, d.get("type"), nid)
+        self._index_drop(self._by_tv, self._tv_key(d.get("type"), d.get("value")), nid)
+        d["type"] = type_
+        self._index_node(nid, d)
+
+    def remove_node(self, nid):
+        """删节点（连带其边），同步索引"""
+        incident = list(self.G.out_edges(nid, data="type"))
+        incident += [(u, v, et) for u, v, et in self.G.in_edges(nid, data="type") if u != v]
+        for u, v, et in incident:
+            self._edge_drop(u, v, et)
+        d = self.G.nodes[nid]
+        self._index_drop(self._by_type, d.get("type"), nid)
+        self._index_drop(self._by_tv, self._tv_key(d.get("type"), d.get("value")), nid)
+        self.G.remove_node(nid)
+        del self._seq[nid]
+
     # def _ensure_topic(self, topic):
     #     """若图里还没有 topic，就写入；已有则保持原值"""
     #     if "topic" not in self.G.graph:
@@ -143,40 +257,36 @@ class GraphBuilder:
             for base in ["Length", "Interval", "Width", "Height"]:
                 if ref == base:
                     # 找属于该族的最后一个
-                    cands = [n for n, d in self.G.nodes(data=True) if str(d.get("type")).startswith(base)]
-                    if cands: return cands[-1]
+                    cands = [ids[-1] for t, ids in self._by_type.items() if str(t).startswith(base)]
+                    if cands: return max(cands, key=self._seq.__getitem__)
             raise ValueError(f"_resolve_ref: 无法解析引用 '{ref}'")
     
     # 创建动态编号时，同时更新“基类”的 last_map，便于 add_edge 用基类名引用
     def add_node(self, *, type, value=None, **attrs):
             # ... (前面的代码保持不变: 动态类型处理等) ...
-            def _is_dyn_type(t: str) -> bool:
-                return bool(re.fullmatch(r'(Length|Interval)\d+', t))
-
             if type not in S.NODE_TYPES and _is_dyn_type(type):
                 S.NODE_TYPES.add(type)
 
             assert type in S.NODE_TYPES, f"未知节点类型: {type}"
 
-            # 检查已有节点
-            for nid, data in self.G.nodes(data=True):
-                if data.get("type") != type: continue
-                
-                # 判断值是否匹配 (None 匹配 None, 具体值匹配具体值)
-                if data.get("value") == value:
-                    # 【修复核心 Bug】：找到已有节点时，更新/合并新的属性（如 role）
-                    if attrs: self.G.nodes[nid].update(attrs)
-                    return nid
-                
+            # 检查已有节点（走索引）：同值节点 / 无值节点，取先加入的那个
+            same = self._first_tv(type, value)
+            empty = self._first_tv(type, None) if value is not None else None
+            if empty is not None and (same is None or self._seq[empty] < self._seq[same]):
                 # 特殊情况：已有节点无值，但新节点有值 → 更新值和属性
-                if data.get("value") is None and value is not None:
-                    self.G.nodes[nid]["value"] = value
-                    if attrs: self.G.nodes[nid].update(attrs)
-                    return nid 
+                self.set_value(empty, value)
+                if attrs: self.G.nodes[empty].update(attrs)
+                return empty
+            if same is not None:
+                # 【修复核心 Bug】：找到已有节点时，更新/合并新的属性（如 role）
+                if attrs: self.G.nodes[same].update(attrs)
+                return same
 
             # 否则创建新节点
-            nid = f"{type}_{uuid.uuid4().hex[:4]}"
+            nid = self._new_id(type)
             self.G.add_node(nid, type=type, value=value, **attrs)
+            self._seq[nid] = self._next_seq; self._next_seq += 1
+            self._index_node(nid, self.G.nodes[nid])
             self.last_map[type] = nid
 
             # # ... (后面的代码保持不变: 处理动态类型引用) ...
@@ -204,10 +314,42 @@ class GraphBuilder:
     #         )
     #     self.G.add_edge(u, v, type=type, op=op)
 
-    def add_edge(self, uType, vType, *, type, op=None):
+    def add_edge(self, uType, vType, *, type, op=None, **attrs):
             u = self._resolve_ref(uType)
             v = self._resolve_ref(vType)
-            self.G.add_edge(u, v, type=type, op=op)
+            self.G.add_edge(u, v, type=type, op=op, **attrs)
+            k = (u, v, type)
+            self._edge_cnt[k] = self._edge_cnt.get(k, 0) + 1
+            self._by_etype.setdefault(type, {})[(u, v)] = None
+
+    def _edge_drop(self, u, v, type_):
+        k = (u, v, type_)
+        n = self._edge_cnt.get(k, 0) - 1
+        if n > 0:
+            self._edge_cnt[k] = n
+            return
+        self._edge_cnt.pop(k, None)
+        pairs = self._by_etype.get(type_)
+        if pairs is not None:
+            pairs.pop((u, v), None)
+            if not pairs: del self._by_etype[type_]
+
+    def remove_edge(self, u, v, type=None):
+        """删一条 u->v 边；给了 type 就删该类型的那条，否则同 networkx（删最后加入的）"""
+        keys = self.G.get_edge_data(u, v)
+        key = next(reversed(keys)) if type is None else \
+            next(k for k in reversed(keys) if keys[k].get("type") == type)
+        self._edge_drop(u, v, keys[key].get("type"))
+        self.G.remove_edge(u, v, key)
+
+    def has_typed_edge(self, u, v, type_, *, undirected=False) -> bool:
+        """是否已有 u->v 的某类型边；undirected=True 时两个方向都算（divides 常用）"""
+        return (u, v, type_) in self._edge_cnt or \
+            (undirected and (v, u, type_) in self._edge_cnt)
+
+    def edges_of_type(self, type_) -> list:
+        """某类型边的 (u, v) 列表（按加入顺序，同一对只出现一次）"""
+        return list(self._by_etype.get(type_, ()))
 
     def set_pattern(self, topic, mode, *, override: bool = False,
                     canonicalize: bool = True, validate: bool = True):
@@ -245,6 +387,14 @@ class GraphBuilder:
             - True  -> 判断 type 是否存在且有非 None 的 value。
             - 其他值 -> 判断 type 是否存在且 value 等于该值。
         """        
+        if type is not None:
+            ids = self._by_type.get(type)
+            if not ids: return False
+            if value is None: return True
+            if value is True:
+                return len(ids) > len(self._by_tv.get((type, None), ()))
+            if self._tv_key(type, value) is not None:
+                return self._first_tv(type, value) is not None
         for _, data in self.G.nodes(data=True):
             if type is not None and data.get("type") != type: continue
             if value is not None:
@@ -343,8 +493,8 @@ class GraphBuilder:
         """有 Length 和 Interval 就兜底补一条 divides（若不存在）。"""
         L = self.last_of("Length")
         I = self.last_of("Interval")
-        if L and I and not self.G.has_edge(L, I):
-            self.G.add_edge(L, I, type="divides", op=None)
+        if L and I and not self.has_typed_edge(L, I, "divides", undirected=True):
+            self.add_edge(L, I, type="divides", op=None)
 
     def normalize_mode_by_knowns(self):
         """
@@ -0,0 +1,316 @@
+"""
+模板编译：registry 加载模板时，把每个模板变体的结构约束生成一段专用的 Python 匹配函数。
+
+生成的函数是按节点类型分桶的回溯搜索：
+  - 模板节点按“选择性”排序（带 role 的优先，其次是模板里同类型节点少的、连边多的）；
+  - 每层只遍历题目图里同类型的节点，role / 边 (type, op) / 边条数 全部内联判断；
+  - 语义与 matcher 里 VF2（DiGraphMatcher 的诱导子图同构 + _node_match/_edge_match）一致，
+    产出同样的 mapping_inv：{模板节点 id: 题目节点 id}；
+  - 模板里可互换的节点组（registry.interchangeable_classes）只产出题目节点按加入顺序递增的那一种，
+    同一轨道上的其余置换在回溯里直接剪掉。
+
+模板的 guards 也在这里编译成闭包（compile_guard），匹配时只需代值；
+validate_template 在加载时对照 schema.py 做静态校验。
+"""
+import ast as _ast
+import operator as _op
+import re
+import schema as S
+
+
+def graph_context(G):
+    """题目图一次性整理成生成函数要的四张表：类型桶、role 表、(u, v) -> [边属性…]、节点加入顺序"""
+    by_type, role, pos = {}, {}, {}
+    for nid, d in G.nodes(data=True):
+        by_type.setdefault(d.get("type"), []).append(nid)
+        role[nid] = d.get("role")
+        pos[nid] = len(pos)
+    adj = {}
+    for u, v, d in G.edges(data=True):
+        adj.setdefault((u, v), []).append(d)
+    return by_type, role, adj, pos
+
+
+def _node_order(tpl: dict) -> list:
+    nodes = tpl["nodes"]
+    type_cnt = {}
+    for n in nodes:
+        type_cnt[n["type"]] = type_cnt.get(n["type"], 0) + 1
+    degree = {n["id"]: 0 for n in nodes}
+    for e in tpl.get("edges", []):
+        degree[e["u"]] = degree.get(e["u"], 0) + 1
+        degree[e["v"]] = degree.get(e["v"], 0) + 1
+    rank = {n["id"]: i for i, n in enumerate(nodes)}
+
+    # 先排最有选择性的节点，之后尽量挑和已排节点相连的，让边约束尽早剪枝
+    remaining = sorted(nodes, key=lambda n: (n.get("role") is None, type_cnt[n["type"]],
+                                             -degree[n["id"]], rank[n["id"]]))
+    linked = {}
+    for e in tpl.get("edges", []):
+        linked.setdefault(e["u"], set()).add(e["v"])
+        linked.setdefault(e["v"], set()).add(e["u"])
+    order = []
+    while remaining:
+        placed = {n["id"] for n in order}
+        nxt = next((n for n in remaining if linked.get(n["id"], set()) & placed), remaining[0])
+        order.append(nxt)
+        remaining.remove(nxt)
+    return order
+
+
+def _edge_test(var: str, want: list) -> str:
+    """对 adj 取出的边列表 var 生成内联判断：条数相等，且模板每条边都能在其中找到 type/op 相符的题目边"""
+    conds = [f"len({var}) == {len(want)}"]
+    for e in want:
+        c = f'd.get("type") == {e.get("type")!r}'
+        if e.get("op") is not None:
+            c += f' and d.get("op") == {e.get("op")!r}'
+        conds.append(f"any({c} for d in {var})")
+    return " and ".join(conds)
+
+
+def _pair_checks(order, var, pair_edges, k, ind, fail):
+    """第 k 个节点与自身、与之前各节点之间两个方向的边检查（诱导子图：模板里没有的边，题目里也不能有）"""
+    lines = []
+    n = order[k]
+    for m in order[:k + 1]:
+        pairs = [(m, n)] if m is n else [(m, n), (n, m)]
+        for a, b in pairs:
+            key = f"({var[a['id']]}, {var[b['id']]})"
+            want = pair_edges.get((a["id"], b["id"]), [])
+            if not want:
+                lines.append(f"{ind}if {key} in adj: {fail}")
+            else:
+                lines.append(f"{ind}e = adj.get({key})")
+                lines.append(f"{ind}if e is None or not ({_edge_test('e', want)}): {fail}")
+    return lines
+
+
+def _symmetry_checks(order, var, symmetric, k, ind, fail):
+    """可互换组内：第 k 个节点与之前已排的同组节点比较加入顺序，只留组内按模板顺序递增的映射"""
+    lines = []
+    n = order[k]["id"]
+    for cls in symmetric:
+        if n not in cls:
+            continue
+        for m in order[:k]:
+            if m["id"] in cls:
+                lo, hi = (m["id"], n) if cls.index(m["id"]) < cls.index(n) else (n, m["id"])
+                lines.append(f"{ind}if pos[{var[lo]}] > pos[{var[hi]}]: {fail}")
+    return lines
+
+
+def generate_matcher_source(tpl: dict, name: str = "_match", symmetric=()) -> str:
+    """
+    生成模板变体的专用匹配函数源码：def name(by_type, role, adj, pos) -> 迭代 mapping_inv。
+    附带快路径 name_forced：每个模板节点的 (type, role) 在题目图里恰有一个候选时直接查表定映射、
+    只核对边；有歧义（某类型多个候选）才走完整回溯。
+    symmetric：可互换节点组（每组按模板节点顺序），每个轨道只产出一个代表。
+    """
+    order = _node_order(tpl)
+    var = {n["id"]: f"p{i}" for i, n in enumerate(order)}
+    pair_edges = {}
+    for e in tpl.get("edges", []):
+        pair_edges.setdefault((e["u"], e["v"]), []).append(e)
+    body = ", ".join(f"{n['id']!r}: {var[n['id']]}" for n in tpl["nodes"])
+
+    # —— 快路径：唯一候选直接查表；返回 None 表示有歧义，() 表示无解 ——
+    lines = [f"def {name}_forced(by_type, role, adj, pos):"]
+    ind = "    "
+    for n in order:
+        p = var[n["id"]]
+        if n.get("role") is not None:
+            lines.append(f"{ind}c = [p for p in by_type.get({n['type']!r}, ()) if role[p] == {n['role']!r}]")
+        else:
+            lines.append(f"{ind}c = by_type.get({n['type']!r}, ())")
+        lines.append(f"{ind}if len(c) != 1: return None if c else ()")
+        lines.append(f"{ind}{p} = c[0]")
+    if len(order) > 1:
+        lines.append(f"{ind}if len({{{', '.join(var[n['id']] for n in order)}}}) != {len(order)}: return ()")
+    for k in range(len(order)):
+        lines += _pair_checks(order, var, pair_edges, k, ind, "return ()")
+        lines += _symmetry_checks(order, var, symmetric, k, ind, "return ()")
+    lines.append(f"{ind}return ({{{body}}},)")
+    lines.append("")
+
+    # —— 完整回溯：按类型分桶逐层展开 ——
+    lines.append(f"def {name}(by_type, role, adj, pos):")
+    lines.append(f"{ind}forced = {name}_forced(by_type, role, adj, pos)")
+    lines.append(f"{ind}if forced is not None:")
+    lines.append(f"{ind}    yield from forced")
+    lines.append(f"{ind}    return")
+    for k, n in enumerate(order):
+        p = var[n["id"]]
+        lines.append(f"{ind}for {p} in by_type.get({n['type']!r}, ()):")
+        ind += "    "
+        earlier = [var[m["id"]] for m in order[:k]]
+        if earlier:
+            lines.append(f"{ind}if {' or '.join(f'{p} == {q}' for q in earlier)}: continue")
+        if n.get("role") is not None:
+            lines.append(f"{ind}if role[{p}] != {n['role']!r}: continue")
+        lines += _symmetry_checks(order, var, symmetric, k, ind, "continue")
+        lines += _pair_checks(order, var, pair_edges, k, ind, "continue")
+    lines.append(f"{ind}yield {{{body}}}")
+    return "\n".join(lines) + "\n"
+
+
+def compile_matcher(tpl: dict, symmetric=()):
+    """生成并编译模板变体的匹配函数；源码挂在函数的 __source__ 上便于排查"""
+    src = generate_matcher_source(tpl, symmetric=symmetric)
+    ns = {}
+    exec(compile(src, f"<matcher:{tpl.get('id')}>", "exec"), ns)
+    fn = ns["_match"]
+    fn.__source__ = src
+    return fn
+
+
+# ---------- guards：加载时把守卫表达式编译成闭包 ----------
+_BIN = {_ast.Add: _op.add, _ast.Sub: _op.sub, _ast.Mult: _op.mul, _ast.Div: _op.truediv,
+        _ast.Pow: _op.pow, _ast.Mod: _op.mod}
+_UNARY = {_ast.USub: _op.neg, _ast.UAdd: _op.pos, _ast.Not: _op.not_}
+_CMP = {_ast.Gt: _op.gt, _ast.GtE: _op.ge, _ast.Lt: _op.lt, _ast.LtE: _op.le,
+        _ast.Eq: _op.eq, _ast.NotEq: _op.ne}
+
+
+class _NoValue(Exception):
+    """守卫里引用的节点没有数值（或不是数）：整条守卫判为不通过"""
+
+
+def _num(v):
+    if v is None or isinstance(v, bool):
+        raise _NoValue
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        raise _NoValue
+
+
+def _guard_node(node, names):
+    """把表达式 AST 递归转成 env -> 值 的闭包；出现白名单以外的语法即报错"""
+    if isinstance(node, _ast.BoolOp):
+        parts = [_guard_node(v, names) for v in node.values]
+        if isinstance(node.op, _ast.And):
+            return lambda env: all(p(env) for p in parts)
+        return lambda env: any(p(env) for p in parts)
+    if isinstance(node, _ast.Compare):
+        items = [_guard_node(node.left, names)] + [_guard_node(c, names) for c in node.comparators]
+        ops = []
+        for o in node.ops:
+            if type(o) not in _CMP:
+                raise ValueError(f"不支持的比较运算 {type(o).__name__}")
+            ops.append(_CMP[type(o)])
+
+        def cmp(env):
+            # 单个比较里有节点无值 / 除零，只让这一项不成立，and/or 照常组合
+            try:
+                vals = [it(env) for it in items]
+            except (_NoValue, ZeroDivisionError, OverflowError):
+                return False
+            return all(f(a, b) for f, a, b in zip(ops, vals, vals[1:]))
+        return cmp
+    if isinstance(node, _ast.BinOp) and type(node.op) in _BIN:
+        f, l, r = _BIN[type(node.op)], _guard_node(node.left, names), _guard_node(node.right, names)
+        return lambda env: f(l(env), r(env))
+    if isinstance(node, _ast.UnaryOp) and type(node.op) in _UNARY:
+        f, x = _UNARY[type(node.op)], _guard_node(node.operand, names)
+        return lambda env: f(x(env))
+    if isinstance(node, _ast.Name):
+        if node.id not in names:
+            raise ValueError(f"未知节点 {node.id}")
+        nid = node.id
+        return lambda env: _num(env.get(nid))
+    if isinstance(node, _ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        c = float(node.value)
+        return lambda env: c
+    raise ValueError(f"不支持的语法 {type(node).__name__}")
+
+
+def compile_guard(expr: str, names):
+    """
+    编译一条守卫（如 "Vf>Vs"、"L>0 and DT>=0"、"Y > X*Z"）：返回 env -> bool，env 为 {模板节点 id: 数值}。
+    支持 and/or/not、比较（可连写）、+ - * / ** % 与数字常量；节点无值、非数或除零的比较项判为不成立。
+    语法不合法或引用了模板里没有的节点时抛 ValueError。
+    """
+    try:
+        fn = _guard_node(_ast.parse(expr.strip(), mode="eval").body, set(names))
+    except SyntaxError as e:
+        raise ValueError(f"语法错误：{e.msg}") from None
+
+    def guard(env):
+        try:
+            return bool(fn(env))
+        except (_NoValue, ZeroDivisionError, OverflowError):
+            return False
+    guard.__source__ = expr
+    return guard
+
+
+# ---------- 模板静态校验：registry 加载时对照 schema.py 检查 ----------
+_DYN_TYPE = re.compile(r"(Length|Interval)\d+")  # 与 GraphBuilder.add_node 一致：多段题的编号类型视为合法
+
+
+def _formula_names(side: str) -> set:
+    """公式一侧用到的变量名（被调用的函数名如 floor 不算）"""
+    tree = _ast.parse(side.strip(), mode="eval")
+    called = {id(n.func) for n in _ast.walk(tree) if isinstance(n, _ast.Call)}
+    return {n.id for n in _ast.walk(tree) if isinstance(n, _ast.Name) and id(n) not in called}
+
+
+def validate_template(tpl: dict):
+    """
+    对照 schema 静态检查一个模板，返回 (errors, warnings) 两个字符串列表。
+    errors：缺 id/topic、节点 id 重复、节点/边类型或 op 不在枚举里、边端点不存在、
+            公式不是“左 = 右”或用了模板里没有的符号、unknowns 不是节点或没有出现在任何公式里、guards 无法编译；
+    warnings：mode 不在 schema.PAT_MODE 里（builder 也只是暂缓校验，不拒绝）。
+    """
+    errors, warnings = [], []
+    if not tpl.get("id"):
+        errors.append("缺少 id")
+    topic = tpl.get("topic")
+    if topic not in S.PAT_TOPIC:
+        errors.append(f"未知 topic: {topic}")
+    elif tpl.get("mode") not in S.PAT_MODE.get(topic, ()):
+        warnings.append(f"mode {tpl.get('mode')!r} 不在 schema.PAT_MODE[{topic!r}] 里")
+
+    ids = [n.get("id") for n in tpl.get("nodes", [])]
+    if len(set(ids)) != len(ids):
+        errors.append(f"节点 id 重复: {sorted({i for i in ids if ids.count(i) > 1})}")
+    for n in tpl.get("nodes", []):
+        t = n.get("type")
+        if t not in S.NODE_TYPES and not _DYN_TYPE.fullmatch(str(t)):
+            errors.append(f"节点 {n.get('id')} 的类型 {t!r} 不在 schema.NODE_TYPES 里")
+    for e in tpl.get("edges", []):
+        for end in ("u", "v"):
+            if e.get(end) not in ids:
+                errors.append(f"边 {e.get('u')}->{e.get('v')} 的端点 {e.get(end)!r} 不是模板节点")
+        if e.get("type") not in S.EDGE_TYPES:
+            errors.append(f"边 {e.get('u')}->{e.get('v')} 的类型 {e.get('type')!r} 不在 schema.EDGE_TYPES 里")
+        if e.get("op") is not None and e.get("op") not in S.OP_ENUM:
+            errors.append(f"边 {e.get('u')}->{e.get('v')} 的 op {e.get('op')!r} 不在 schema.OP_ENUM 里")
+
+    used = set()
+    for f in tpl.get("formula", []):
+        sides = f.split("=")
+        if len(sides) != 2:
+            errors.append(f"公式 {f!r} 不是“左 = 右”的形式")
+            continue
+        try:
+            names = _formula_names(sides[0]) | _formula_names(sides[1])
+        except SyntaxError:
+            errors.append(f"公式 {f!r} 无法解析")
+            continue
+        if names - set(ids):
+            errors.append(f"公式 {f!r} 用到模板里没有的符号 {sorted(names - set(ids))}")
+        used |= names
+    for u in tpl.get("unknowns", []):
+        if u not in ids:
+            errors.append(f"unknown {u!r} 不是模板节点")
+        elif u not in used:
+            errors.append(f"unknown {u!r} 没有出现在任何公式里")
+
+    for g in tpl.get("guards") or []:
+        try:
+            compile_guard(g, ids)
+        except ValueError as e:
+            errors.append(f"guard {g!r} 无效：{e}")
+    return errors, warnings
@@ -10,7 +10,9 @@ This module exposes:
 - export_mermaid(G, mapping=None, solved=None): produce a mermaid flowchart string.
 
 Assumptions:
-- tpl: a template dict with keys: id, nodes, edges, formula, unknowns, mode (optional)
+- tpl: a template with keys: id, nodes, edges, formula, unknowns, mode (optional) -- either a
+  plain dict or a registry CompiledTemplate (read-only mapping), whose precompiled symbol table
+  and equations are reused instead of re-parsing the formulas
 - mapping: dict of {template_node_id -> problem_graph_node_id}
 - G: a networkx.DiGraph with node attributes: {"type": str, "value": (int/float/None)}
        and edge attributes: {"type": str, "op": Optional[str]}
@@ -46,9 +48,13 @@ def explain_equation(tpl: dict, mapping: dict, G) -> dict:
         # mapping is reversed -> flip to tpl_id -> prob_id
         mapping = {tpl_id: prob_id for prob_id, tpl_id in mapping.items()}
 
-    # ---- 1) symbols / node type map ----
-    symtab = {n["id"]: symbols(n["id"]) for n in tpl["nodes"]}
-    node_type_map = {n["id"]: n["type"] for n in tpl["nodes"]}
+    # ---- 1) symbols / node type map (reuse the compiled plan when given a CompiledTemplate) ----
+    plan = getattr(tpl, "plan", None)
+    if plan is not None:
+        symtab, node_type_map = plan.symtab, plan.types
+    else:
+        symtab = {n["id"]: symbols(n["id"]) for n in tpl["nodes"]}
+        node_type_map = {n["id"]: n["type"] for n in tpl["nodes"]}
 
     # ---- 2) collect known values (coerce 20.0 -> 20 when integral) ----
     def _coerce_num(val):
@@ -62,7 +68,10 @@ def explain_equation(tpl: dict, mapping: dict, G) -> dict:
             given[symtab[tpl_id]] = _coerce_num(G.nodes[prob_id]["value"])
 
     # ---- 3) build equations ----
-    eqs_raw = [Eq(*[sympify(side.strip(), locals=symtab) for side in f.split("=")]) for f in tpl["formula"]]
+    if plan is not None:
+        eqs_raw = list(plan.eqs)
+    else:
+        eqs_raw = [Eq(*[sympify(side.strip(), locals=symtab) for side in f.split("=")]) for f in tpl["formula"]]
     eqs_sub = [e.subs(given) for e in eqs_raw]
 
     # ---- 4) solve unknowns ----
@@ -92,12 +101,12 @@ def explain_equation(tpl: dict, mapping: dict, G) -> dict:
     pkg = {
         "template_id": tpl.get("id"),
         "mode": G.graph.get("mode"),
-        "nodes": [(nid, deepcopy(G.nodes[nid])) for nid in G.nodes()],
-        "edges": [(u, v, deepcopy(d)) for u, v, d in G.edges(data=True)],
-        "formulas": tpl["formula"],
+        "nodes": [(nid, deepcopy(dict(G.nodes[nid]))) for nid in G.nodes()],
+        "edges": [(u, v, deepcopy(dict(d))) for u, v, d in G.edges(data=True)],
+        "formulas": list(tpl["formula"]),
         "given": {str(k): v for k, v in given.items()},
         "instantiated": [str(e) for e in eqs_sub],
-        "unknowns": tpl["unknowns"],
+        "unknowns": list(tpl["unknowns"]),
         "solved": solved_int,
         "mapping": mapping,
         "notes": [],
@@ -318,14 +327,13 @@ def export_mermaid_cn(G, mapping=None, solved=None, *, show_ids=False) -> str:
     ]
 
     for nid, d in G.nodes(data=True):
-        ntype = d.get("type", "")
         label = node_label(nid, d)
         if nid in solved_nodes:
             klass = "solved"
         else:
             klass = "known" if d.get("value") is not None else "unknown"
-        # 用节点类型+自增索引做“可读 id”，避免长 uuid
-        readable_id = f"{ntype}_{str(nid)[-4:]}"
+        # builder 的节点 id 本身就是“类型_序号”，只把 Mermaid 不认的字符换掉
+        readable_id = re.sub(r"\W", "_", str(nid))
         lines.append(f'{readable_id}["{label}"]:::{klass}')
         d["_readable_id"] = readable_id  # 暂存映射
 
@@ -0,0 +1,262 @@
+"""
+题目图的轻量实现：节点/边属性是 __slots__ 记录，边存成一张数组。
+只实现 builder、规则、matcher、solver、导出函数实际用到的那部分 nx.MultiDiGraph 接口；
+要用 networkx 算法（vf2 匹配、临时调试）时再 to_networkx() 转一份。
+"""
+from collections.abc import MutableMapping
+import networkx as nx
+
+
+class _Unset:
+    """属性未设置的占位（和“设成 None”区分开，保持 dict 的 in / KeyError 语义）"""
+    __slots__ = ()
+    def __repr__(self): return "_UNSET"
+    def __reduce__(self): return "_UNSET"
+
+_UNSET = _Unset()
+
+
+class _Attrs(MutableMapping):
+    """固定字段放槽位，其余放 _extra；对外表现为普通属性 dict"""
+    __slots__ = ("_extra",)
+    _FIELDS = ()
+
+    def __getitem__(self, k):
+        if k in self._FIELDS:
+            v = getattr(self, k)
+            if v is _UNSET: raise KeyError(k)
+            return v
+        if self._extra is None: raise KeyError(k)
+        return self._extra[k]
+
+    def get(self, k, default=None):
+        if k in self._FIELDS:
+            v = getattr(self, k)
+            return default if v is _UNSET else v
+        return default if self._extra is None else self._extra.get(k, default)
+
+    def __contains__(self, k):
+        if k in self._FIELDS: return getattr(self, k) is not _UNSET
+        return self._extra is not None and k in self._extra
+
+    def __setitem__(self, k, v):
+        if k in self._FIELDS:
+            setattr(self, k, v)
+        elif self._extra is None:
+            self._extra = {k: v}
+        else:
+            self._extra[k] = v
+
+    def __delitem__(self, k):
+        if k in self._FIELDS:
+            if getattr(self, k) is _UNSET: raise KeyError(k)
+            setattr(self, k, _UNSET)
+        else:
+            if self._extra is None: raise KeyError(k)
+            del self._extra[k]
+
+    def __iter__(self):
+        for k in self._FIELDS:
+            if getattr(self, k) is not _UNSET: yield k
+        if self._extra: yield from self._extra
+
+    def __len__(self):
+        return sum(getattr(self, k) is not _UNSET for k in self._FIELDS) + len(self._extra or ())
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class NodeAttrs(_Attrs):
+    __slots__ = ("type", "value", "role", "unit", "_seq")
+    _FIELDS = ("type", "value", "role", "unit")
+
+    def __init__(self, seq, attrs):
+        # attrs 是调用方的 **kwargs，可以直接 pop
+        self.type = attrs.pop("type", _UNSET)
+        self.value = attrs.pop("value", _UNSET)
+        self.role = attrs.pop("role", _UNSET)
+        self.unit = attrs.pop("unit", _UNSET)
+        self._extra, self._seq = attrs or None, seq
+
+
+class EdgeAttrs(_Attrs):
+    __slots__ = ("u", "v", "key", "type", "op")
+    _FIELDS = ("type", "op")
+
+    def __init__(self, u, v, key, attrs):
+        self.u, self.v, self.key = u, v, key
+        self.type = attrs.pop("type", _UNSET)
+        self.op = attrs.pop("op", _UNSET)
+        self._extra = attrs or None
+
+
+class _NodeView:
+    """G.nodes：既能 G.nodes[nid] / nid in G.nodes / 迭代，也能 G.nodes(data=True)"""
+    __slots__ = ("_nodes",)
+
+    def __init__(self, nodes): self._nodes = nodes
+    def __getitem__(self, n): return self._nodes[n]
+    def __contains__(self, n): return n in self._nodes
+    def __iter__(self): return iter(self._nodes)
+    def __len__(self): return len(self._nodes)
+    def get(self, n, default=None): return self._nodes.get(n, default)
+
+    def __call__(self, data=False, default=None):
+        if data is False:
+            return list(self._nodes)
+        if data is True:
+            return list(self._nodes.items())
+        return [(n, d.get(data, default)) for n, d in self._nodes.items()]
+
+    def __repr__(self): return f"NodeView({tuple(self._nodes)})"
+
+
+def _edge_tuple(e, data, keys, default):
+    t = (e.u, e.v, e.key) if keys else (e.u, e.v)
+    if data is False: return t
+    return t + ((e if data is True else e.get(data, default)),)
+
+
+def _nbunch(nbunch):
+    return set(nbunch) if isinstance(nbunch, (list, tuple, set, frozenset)) else {nbunch}
+
+
+class _EdgeView:
+    """G.edges：迭代得 (u, v)，G.edges(nbunch, data=..., keys=...) 同 nx"""
+    __slots__ = ("_g",)
+
+    def __init__(self, g): self._g = g
+    def __iter__(self): return iter(self())
+    def __len__(self): return len(self._g._edges)
+
+    def __call__(self, nbunch=None, data=False, keys=False, default=None):
+        es = self._g._ordered_edges()
+        if nbunch is not None:
+            ns = _nbunch(nbunch)
+            es = [e for e in es if e.u in ns]
+        return [_edge_tuple(e, data, keys, default) for e in es]
+
+
+class ProblemGraph:
+    """
+    题目图（有向多重图）。节点按加入顺序存在 dict 里，边是 EdgeAttrs 数组；
+    边的迭代顺序与 nx.MultiDiGraph 一致：按 u 的加入顺序，同一 u 下按 v 首次相连的顺序，再按 key。
+    """
+    __slots__ = ("graph", "_nodes", "_edges", "_next_seq", "_dirty", "nodes", "edges")
+
+    def __init__(self):
+        self.graph = {}
+        self._nodes = {}
+        self._edges = []
+        self._next_seq = 0
+        self._dirty = False
+        self.nodes = _NodeView(self._nodes)
+        self.edges = _EdgeView(self)
+
+    def __getstate__(self):
+        return self.graph, self._nodes, self._edges, self._next_seq
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.graph, nodes, self._edges, self._next_seq = state
+        self._nodes.update(nodes)
+        self._dirty = True
+
+    def __contains__(self, n): return n in self._nodes
+    def __iter__(self): return iter(self._nodes)
+    def __len__(self): return len(self._nodes)
+    def is_directed(self): return True
+    def is_multigraph(self): return True
+    def number_of_nodes(self): return len(self._nodes)
+    def number_of_edges(self): return len(self._edges)
+
+    # —— 节点 ——
+    def add_node(self, n, **attrs):
+        d = self._nodes.get(n)
+        if d is None:
+            self._nodes[n] = NodeAttrs(self._next_seq, attrs)
+            self._next_seq += 1
+        else:
+            d.update(attrs)
+
+    def remove_node(self, n):
+        if n not in self._nodes:
+            raise nx.NetworkXError(f"The node {n} is not in the graph.")
+        del self._nodes[n]
+        self._edges = [e for e in self._edges if e.u != n and e.v != n]
+
+    # —— 边 ——
+    def _ordered_edges(self):
+        if self._dirty:
+            first = {}
+            for i, e in enumerate(self._edges):
+                first.setdefault((e.u, e.v), i)
+            nodes = self._nodes
+            self._edges.sort(key=lambda e: (nodes[e.u]._seq, first[(e.u, e.v)]))
+            self._dirty = False
+        return self._edges
+
+    def _pair(self, u, v):
+        return [e for e in self._edges if e.u == u and e.v == v]
+
+    def add_edge(self, u, v, key=None, **attrs):
+        for n in (u, v):
+            if n not in self._nodes: self.add_node(n)
+        if key is None:
+            used = {e.key for e in self._edges if e.u == u and e.v == v}
+            key = len(used)
+            while key in used: key += 1
+        else:
+            old = next((e for e in self._pair(u, v) if e.key == key), None)
+            if old is not None:
+                old.update(attrs)
+                return key
+        self._edges.append(EdgeAttrs(u, v, key, attrs))
+        self._dirty = True
+        return key
+
+    def remove_edge(self, u, v, key=None):
+        pair = [e for e in self._ordered_edges() if e.u == u and e.v == v]
+        if key is not None:
+            pair = [e for e in pair if e.key == key]
+        if not pair:
+            raise nx.NetworkXError(f"The edge {u}-{v} not in graph.")
+        dead = pair[-1]
+        self._edges = [e for e in self._edges if e is not dead]  # 按身份删：属性相同的边 == 也成立
+
+    def has_edge(self, u, v, key=None):
+        return any(e.u == u and e.v == v and (key is None or e.key == key) for e in self._edges)
+
+    def get_edge_data(self, u, v, key=None, default=None):
+        pair = [e for e in self._ordered_edges() if e.u == u and e.v == v]
+        if key is None:
+            return {e.key: e for e in pair} if pair else default
+        return next((e for e in pair if e.key == key), default)
+
+    def out_edges(self, nbunch=None, data=False, keys=False, default=None):
+        return self.edges(nbunch, data=data, keys=keys, default=default)
+
+    def in_edges(self, nbunch=None, data=False, keys=False, default=None):
+        es = self._ordered_edges()
+        if nbunch is not None:
+            ns = _nbunch(nbunch)
+            es = [e for e in es if e.v in ns]
+        return [_edge_tuple(e, data, keys, default) for e in es]
+
+    def to_networkx(self) -> nx.MultiDiGraph:
+        G = nx.MultiDiGraph()
+        G.graph.update(self.graph)
+        for n, d in self._nodes.items():
+            G.add_node(n, **d)
+        for e in self._ordered_edges():
+            G.add_edge(e.u, e.v, key=e.key, **e)
+        return G
+
+    def __repr__(self):
+        return f"ProblemGraph({len(self._nodes)} nodes, {len(self._edges)} edges)"
+
+
+def to_networkx(G):
+    """ProblemGraph 转 nx.MultiDiGraph；本来就是 networkx 图则原样返回"""
+    return G.to_networkx() if isinstance(G, ProblemGraph) else G
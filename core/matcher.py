@@ -42,11 +42,13 @@
 #     return None, None
 
 # matcher.py
-import copy
+from collections import OrderedDict
+import heapq
 import networkx as nx, core.registry as R
 from networkx.algorithms.isomorphism import DiGraphMatcher
+from core.compiler import graph_context
+from core.graph import to_networkx
 
-import operator as _op
 
 # 检查模板的 forbid_roles 是否在问题图里出现（出现则拒绝该模板）
 def _violates_forbid_roles(problemG, tpl) -> bool:
@@ -67,36 +69,20 @@ def _build_env_from_mapping(problemG, tpl, mapping: dict) -> dict:
             env[var] = problemG.nodes[nid].get("value")
     return env
 
-# 解析并判断一条简单守卫表达式（如 "Vf>Vs", "DT>0", "L>=0"）
-_OPS = {">":_op.gt, ">=":_op.ge, "<":_op.lt, "<=":_op.le, "==":_op.eq, "!=":_op.ne}
-def _eval_guard(expr: str, env: dict) -> bool:
-    for sym in (">=", "<=", "==", "!=", ">", "<"):
-        if sym in expr:
-            left, right = expr.split(sym, 1)
-            left = left.strip(); right = right.strip()
-            if left not in env or env[left] is None:
-                return False
-            try:
-                rv = float(env[right]) if right in env else float(right)
-            except Exception:
-                return False
-            try:
-                lv = float(env[left])
-            except Exception:
-                return False
-            return _OPS[sym](lv, rv)
-    return False
-
-# --- helpers: 获取模板节点类型；对 TreeCnt 值做偏好打分 ---
+# --- helpers: 每题一次的打分上下文；对 TreeCnt 值做偏好打分 ---
 
-def _tpl_node_type(tpl: dict, tpl_id: str) -> str | None:
-    """从模板里取节点类型（通过模板节点的 id 匹配）。"""
-    for n in tpl.get("nodes", []):
-        if n.get("id") == tpl_id:
-            return n.get("type")
-    return None
+def _score_context(problemG) -> dict:
+    """打分要用的题目图统计只扫一遍：节点类型/数值表、target、是否存在 value>1 的 TreeCnt"""
+    types, values = {}, {}
+    exist_gt1 = False
+    for nid, d in problemG.nodes(data=True):
+        types[nid] = d.get("type")
+        val = values[nid] = d.get("value")
+        if d.get("type") == "TreeCnt" and isinstance(val, (int, float)) and val > 1:
+            exist_gt1 = True
+    return {"types": types, "values": values, "target": problemG.graph.get("target"), "exist_gt1": exist_gt1}
 
-def _pref_score_for_treecnt(problemG, prob_id: str) -> int:
+def _pref_score_for_treecnt(sctx: dict, prob_id: str) -> int:
     """
     偏好总数（>1），厌恶“每隔…1个”的 1。
     规则：
@@ -104,45 +90,18 @@ def _pref_score_for_treecnt(problemG, prob_id: str) -> int:
       - 如果当前选择的 TreeCnt 的 value>1，则小幅加分（偏好“共 N 个”这种）。
       - 否则不加不减。
     """
-    node = problemG.nodes.get(prob_id, {})
-    val = node.get("value", None)
-
-    # 是否存在其它 "更像总数" 的 TreeCnt（>1）
-    exist_gt1 = any(
-        n.get("type") == "TreeCnt" and isinstance(n.get("value"), (int, float)) and n.get("value", 0) > 1
-        for _, n in problemG.nodes(data=True)
-    )
-
+    val = sctx["values"].get(prob_id)
     if isinstance(val, (int, float)):
-        if val == 1 and exist_gt1:
+        if val == 1 and sctx["exist_gt1"]:
             return -2000   # 强惩罚“1 个”（通常来自“每隔…1个”）
         if val > 1:
             return +200    # 偏好“共 N 个”
     return 0
 
-def _tpl_to_graph(tpl: dict) -> nx.MultiDiGraph:
-    G = nx.MultiDiGraph()
-    for n in tpl["nodes"]:
-        G.add_node(n["id"], **n)  # id/type/...
-    for e in tpl["edges"]:
-        G.add_edge(e["u"], e["v"], **e)  # type/op/optional?
-    G.graph.update(topic=tpl.get("topic"), mode=tpl.get("mode"))
-    return G
-
-def _tpl_variants_with_optional(tpl: dict):
-    """生成模板变体：原模板 + 去掉所有 optional 边 的版本。
-       如需更细粒度（任意子集），可扩展为幂集，但二合一通常足够。"""
-    yield tpl
-    opt = [e for e in tpl.get("edges", []) if e.get("optional")]
-    if opt:
-        t2 = copy.deepcopy(tpl)
-        t2["edges"] = [e for e in t2["edges"] if not e.get("optional")]
-        yield t2
-
 # 新增一个打分函数
-def _score_match(problemG, tpl, mapping) -> int:
+def _score_match(sctx: dict, tpl, mapping) -> int:
     """
-    评分规则：
+    评分规则（sctx 由 _score_context 每题算一次，模板节点类型/未知量取自 registry 编译好的表）：
       +1000 : 模板的 unknown 对应的问题图节点类型 == 目标量 target（gb.G.graph["target"]）
        + 50 : unknown 映射到的节点当前“无值”（确实是未知）
        -200 : unknown 映射到的节点已“有值”（说明可能选错模板）
@@ -153,107 +112,389 @@ def _score_match(problemG, tpl, mapping) -> int:
     """
 
     s = 0
-    target = problemG.graph.get("target")
-    unk = set(tpl.get("unknowns", []))
+    plan = R.compile_template(tpl)
+    ttypes, unk = plan.types, plan.unknowns
+    types, values, target = sctx["types"], sctx["values"], sctx["target"]
 
     # 目标量强优先
     if target:
         for u in unk:
             pid = mapping.get(u)
-            if pid and problemG.nodes[pid].get("type") == target:
+            if pid and types.get(pid) == target:
                 s += 1000
                 break
 
     # 未知量是否真的未知
     for u in unk:
-        pid = mapping.get(u)
-        val = problemG.nodes.get(pid, {}).get("value") if pid in problemG.nodes else None
-        s += 50 if val is None else -200
+        s += 50 if values.get(mapping.get(u)) is None else -200
 
     # 已知量覆盖度
-    for n in tpl.get("nodes", []):
-        if n.get("id") in unk:
+    for tid in ttypes:
+        if tid in unk:
             continue
-        pid = mapping.get(n.get("id"))
-        if pid and problemG.nodes.get(pid, {}).get("value") is not None:
+        pid = mapping.get(tid)
+        if pid and values.get(pid) is not None:
             s += 10
 
     # —— 新增：对 TreeCnt 的“1 vs >1”偏好打分（放在最后，作为微调/否决项）——
     for tpl_id, prob_id in mapping.items():
-        ttype = _tpl_node_type(tpl, tpl_id)
-        if ttype == "TreeCnt":
-            s += _pref_score_for_treecnt(problemG, prob_id)
+        if ttypes.get(tpl_id) == "TreeCnt":
+            s += _pref_score_for_treecnt(sctx, prob_id)
 
     return s
 
-def match(problemG: nx.MultiDiGraph):
-    topic = problemG.graph.get("topic")
-    mode  = problemG.graph.get("mode")
-
-    candidates = [tpl for tpl in R.SUBGRAPH_REGISTRY
-                  if tpl.get("topic") == topic and tpl.get("mode") == mode]
+# 节点只比较 type（节点没有 op）
+# nm = lambda a, b: a.get("type") == b.get("type")
+def _node_match(a, b):
+    # type 必须相同；若模板节点声明了 role，则也必须匹配
+    if a.get("type") != b.get("type"):
+        return False
+    brole = b.get("role", None)
+    if brole is not None and a.get("role", None) != brole:
+        return False
+    return True
 
-    # 节点只比较 type（节点没有 op）
-    # nm = lambda a, b: a.get("type") == b.get("type")
-    def nm(a, b):
-        # type 必须相同；若模板节点声明了 role，则也必须匹配
-        if a.get("type") != b.get("type"):
-            return False
-        brole = b.get("role", None)
-        if brole is not None and a.get("role", None) != brole:
+# 边匹配：type 必须相等；若模板边明确给了 op，则必须相等；否则忽略 op
+def _em1(a, b):
+    if a.get("type") != b.get("type"):
+        return False
+    bop = b.get("op", None)
+    if bop is not None and a.get("op", None) != bop:
+        return False
+    return True
+
+def _edge_match(a, b):
+    # MultiDiGraph 下 VF2 传进来的是 {key: 边属性}，需逐条比较（模板每条边都要有对应的题目边）
+    return all(any(_em1(ea, eb) for ea in a.values()) for eb in b.values())
+
+# ---------- 结构匹配缓存：按题目图“形状”记住 VF2 结果 ----------
+class _ShapeCache:
+    """有界 LRU：shape key -> 结构命中列表（节点以规范序号表示）；带命中/未命中统计"""
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key in self.data:
+            self.data.move_to_end(key)
+            self.hits += 1
+            return self.data[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def info(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.data), "maxsize": self.maxsize}
+
+    def clear(self):
+        self.data.clear()
+        self.hits = self.misses = 0
+
+_SHAPE_CACHE = _ShapeCache()
+
+def match_cache_info() -> dict:
+    """结构匹配缓存统计：{"hits", "misses", "size", "maxsize"}"""
+    return _SHAPE_CACHE.info()
+
+def match_cache_clear():
+    _SHAPE_CACHE.clear()
+
+def _shape_key(problemG):
+    """
+    题目图的规范形状：抽掉 GraphBuilder 生成的节点 id 与数值，只保留 topic/mode、
+    节点 (type, role) 和边 (u序号, v序号, type, op)。
+    返回 (key, order)，order[i] 为序号 i 对应的节点 id。
+    节点按“自身标签 + 出入边标签”排序，同标签按加入顺序；排序有歧义时最多导致缓存未命中，不会错配。
+    key 里带上当前 MATCH_BACKEND，切换后端后不会拿到另一后端的缓存结果。
+    """
+    lab = {nid: (str(d.get("type") or ""), str(d.get("role") or "")) for nid, d in problemG.nodes(data=True)}
+    inv = {nid: [lab[nid], [], []] for nid in lab}
+    for u, v, d in problemG.edges(data=True):
+        e = (str(d.get("type") or ""), str(d.get("op") or ""))
+        inv[u][1].append(e + lab[v])
+        inv[v][2].append(e + lab[u])
+    pos0 = {nid: i for i, nid in enumerate(lab)}
+    order = sorted(lab, key=lambda n: (inv[n][0], sorted(inv[n][1]), sorted(inv[n][2]), pos0[n]))
+    pos = {nid: i for i, nid in enumerate(order)}
+    edges = sorted((pos[u], pos[v]) + (str(d.get("type") or ""), str(d.get("op") or ""))
+                   for u, v, d in problemG.edges(data=True))
+    key = (MATCH_BACKEND, problemG.graph.get("topic"), problemG.graph.get("mode"),
+           tuple(lab[n] for n in order), tuple(edges))
+    return key, order
+
+# 结构搜索后端："codegen" = registry 加载时为每个模板变体生成的专用回溯匹配（默认）；
+# "vf2" = networkx DiGraphMatcher，作为参照实现保留，可用 compare_backends() 核对两者结果
+MATCH_BACKEND = "codegen"
+
+def _is_canonical(mapping_inv, symmetry, pos) -> bool:
+    """可互换节点组内，题目节点按模板节点顺序递增的映射才是该轨道的代表"""
+    return all(pos[mapping_inv[a]] < pos[mapping_inv[b]] for cls in symmetry for a, b in zip(cls, cls[1:]))
+
+def _iter_mappings(problemG, variant, backend, ctx):
+    """按后端枚举变体在题目图上的映射 {模板节点 id: 题目节点 id}（可互换节点的每个轨道只出一个代表）"""
+    if backend == "vf2":
+        GM = DiGraphMatcher(problemG, variant.pattern, node_match=_node_match, edge_match=_edge_match)
+        for mapping_raw in GM.subgraph_isomorphisms_iter():
+            mapping_inv = {tpl_id: prob_id for prob_id, tpl_id in mapping_raw.items()}
+            if _is_canonical(mapping_inv, variant.symmetry, ctx[3]):
+                yield mapping_inv
+    else:
+        yield from variant.match_fn(*ctx)
+
+def _binds_params(adj, ptpl, mapping_inv, params) -> bool:
+    """族模式的映射是否落在该成员上：每条参数边在题目图对应位置上都有 type 相同、op 等于成员参数的边"""
+    for e in ptpl["edges"]:
+        name = e.get("param")
+        if name and not any(d.get("type") == e.get("type") and d.get("op") == params.get(name)
+                            for d in adj.get((mapping_inv[e["u"]], mapping_inv[e["v"]]), ())):
             return False
-        return True
+    return True
+
+def _entry_hits(problemG, entry, gsig, ctx, backend):
+    found = []
+    pos = ctx[3]
+    matched = []  # 已命中变体保留的 optional 边集合；其真子集（更不具体的变体）不再搜索
+    for vi, variant in enumerate(entry.variants):
+        if any(variant.kept < k for k in matched):
+            continue
+        tvar = variant.tpl
+        if not R.signature_contains(gsig, variant.signature):
+            continue
 
-    # 边匹配：type 必须相等；若模板边明确给了 op，则必须相等；否则忽略 op
-    def em(a, b):
-        if a.get("type") != b.get("type"):
-            return False
-        bop = b.get("op", None)
-        if bop is not None and a.get("op", None) != bop:
-            return False
+        # 先看 forbid_roles（有就直接跳过）
+        if _violates_forbid_roles(problemG, tvar):
+            continue
+
+        maps = list(_iter_mappings(problemG, variant, backend, ctx))
+        if maps:
+            matched.append(variant.kept)
+        # 同一变体的多个映射按题目图节点加入顺序排序，使结果与后端的枚举顺序无关
+        maps.sort(key=lambda m: [pos[m[n["id"]]] for n in tvar["nodes"]])
+        for seq, mapping_inv in enumerate(maps):
+            found.append(((entry.rank, vi, seq), tvar, mapping_inv))
+    return found
+
+def _family_hits(problemG, family, members, gsig, ctx, backend):
+    """模板族：结构模式（参数边不限 op）每个变体只搜一次，再按参数边处的实际 op 把映射分派给成员"""
+    found = []
+    adj, pos = ctx[2], ctx[3]
+    members = [e for e in members if not _violates_forbid_roles(problemG, e.tpl)]
+    matched = {e.rank: [] for e in members}
+    for vi, pvar in enumerate(family.variants):
+        todo = [e for e in members if not any(pvar.kept < k for k in matched[e.rank])]
+        if not todo or not R.signature_contains(gsig, pvar.signature):
+            continue
+        maps = list(_iter_mappings(problemG, pvar, backend, ctx))
+        if not maps:
+            continue
+        maps.sort(key=lambda m: [pos[m[n["id"]]] for n in pvar.tpl["nodes"]])
+        for e in todo:
+            mvar = e.variants[vi]
+            mine = [m for m in maps
+                    if _binds_params(adj, pvar.tpl, m, e.tpl.get("params", {}))
+                    and _is_canonical(m, mvar.symmetry, pos)]
+            if mine:
+                matched[e.rank].append(pvar.kept)
+            found.extend(((e.rank, vi, seq), mvar.tpl, m) for seq, m in enumerate(mine))
+    return found
+
+def _structural_hits(problemG, candidates, backend=None, order=None):
+    """
+    签名预筛 + forbid_roles + 结构搜索：返回 [((rank, 变体序, 映射序), tvar, mapping_inv), …]，与数值无关。
+    order：节点的规范顺序（_shape_key 给出）；给了就按它挑轨道代表、排映射，使同形状的图结果一致，
+    否则按节点加入顺序。
+    """
+    backend = backend or MATCH_BACKEND
+    if backend == "vf2":
+        problemG = to_networkx(problemG)  # DiGraphMatcher 要真正的 networkx 图
+    # 题目图结构签名只算一次；模板所需的节点类型/角色、边 (type, op) 不被包含时直接跳过结构搜索
+    gsig = R.signature_of((d for _, d in problemG.nodes(data=True)),
+                          (d for _, _, d in problemG.edges(data=True)))
+    ctx = graph_context(problemG)
+    if order is not None:
+        ctx = ctx[:3] + ({nid: i for i, nid in enumerate(order)},)
+
+    # 候选里同族成员有两个以上时，整族只做一次结构搜索
+    by_family = {}
+    for entry in candidates:
+        if entry.family is not None:
+            by_family.setdefault(entry.family.name, []).append(entry)
+
+    found = []
+    for entry in candidates:
+        members = by_family.get(entry.family.name) if entry.family is not None else None
+        if members and len(members) > 1:
+            if members[0] is entry:
+                found.extend(_family_hits(problemG, entry.family, members, gsig, ctx, backend))
+            continue
+        found.extend(_entry_hits(problemG, entry, gsig, ctx, backend))
+    return found
+
+def compare_backends(problemG, candidates=None) -> list:
+    """
+    用 VF2 参照实现核对生成匹配函数：返回两者结构命中不一致的 (rank, 变体序, 模板 id) 列表，空表示一致。
+    candidates：要核对的模板索引项，缺省为该图 (topic, mode, target) 的候选；传 R.all_candidates() 则核对全部模板
+    """
+    if candidates is None:
+        topic, mode = problemG.graph.get("topic"), problemG.graph.get("mode")
+        candidates = R.candidates_for(topic, mode, problemG.graph.get("target"))
+    # 映射是 dict，冻结后才能做对称差（不一致时要逐项哈希）
+    a = {rk: (tvar["id"], frozenset(m.items())) for rk, tvar, m in _structural_hits(problemG, candidates, "codegen")}
+    b = {rk: (tvar["id"], frozenset(m.items())) for rk, tvar, m in _structural_hits(problemG, candidates, "vf2")}
+    return sorted({rk[:2] + (v[0],) for rk, v in (a.items() ^ b.items())})
+
+def _cached_structural_hits(problemG, candidates, shape=None):
+    """
+    同形状的题目共用一次结构搜索：缓存里存序号化的映射，取出时换回本图的节点 id。
+    轨道代表与映射顺序按规范顺序 order 定，命中缓存与重新搜索得到的结果相同。
+    """
+    key, order = shape or _shape_key(problemG)
+    cached = _SHAPE_CACHE.get(key)
+    if cached is None:
+        pos = {nid: i for i, nid in enumerate(order)}
+        found = _structural_hits(problemG, candidates, order=order)
+        cached = [(rk, tvar, {t: pos[p] for t, p in m.items()}) for rk, tvar, m in found]
+        _SHAPE_CACHE.put(key, cached)
+    return [(rk, tvar, {t: order[i] for t, i in m.items()}) for rk, tvar, m in cached]
+
+def _guards_ok(problemG, tpl, mapping_inv) -> bool:
+    # guards 已在 registry 加载时编译成闭包，这里只代值
+    guards = R.compile_template(tpl).guards
+    if not guards:
         return True
-    
-    # hits = []
-    # for tpl in candidates:
-    #     for tvar in _tpl_variants_with_optional(tpl):
-    #         GM = DiGraphMatcher(problemG, _tpl_to_graph(tvar), node_match=nm, edge_match=em)
-    #         if GM.subgraph_is_isomorphic():
-    #             mapping_raw = next(GM.subgraph_isomorphisms_iter())
-    #             mapping_inv = {tpl_id: prob_id for prob_id, tpl_id in mapping_raw.items()}
-    #             hits.append((tvar, mapping_inv))
-
-    hits = []
-    for tpl in candidates:
-        for tvar in _tpl_variants_with_optional(tpl):
-            # 先看 forbid_roles（有就直接跳过）
-            if _violates_forbid_roles(problemG, tvar):
-                continue
-
-            GM = DiGraphMatcher(problemG, _tpl_to_graph(tvar), node_match=nm, edge_match=em)
-            if not GM.subgraph_is_isomorphic():
-                continue
-
-            # 遍历所有映射；每个映射都做一次 guards 校验，通过的才收集
-            for mapping_raw in GM.subgraph_isomorphisms_iter():
-                mapping_inv = {tpl_id: prob_id for prob_id, tpl_id in mapping_raw.items()}
-                guards = tvar.get("guards") or []
-                if guards:
-                    env = _build_env_from_mapping(problemG, tvar, mapping_inv)
-                    ok = True
-                    for gexpr in guards:
-                        if not _eval_guard(gexpr, env):
-                            ok = False
-                            break
-                    if not ok:
-                        continue  # 换下一种映射
-                # 通过了（或没有 guards）→ 计入候选
-                hits.append((tvar, mapping_inv))
-
-
-    if not hits:
+    env = _build_env_from_mapping(problemG, tpl, mapping_inv)
+    return all(g(env) for g in guards)
+
+def _score_bound(sctx: dict, tpl, mapping) -> int:
+    """_score_match 的上界：target 加分按类型精确算（不依赖数值），其余各项都按最好情况计"""
+    plan = R.compile_template(tpl)
+    ttypes, unk = plan.types, plan.unknowns
+    target = sctx["target"]
+    s = 0
+    if target and any(sctx["types"].get(mapping.get(u)) == target for u in unk):
+        s += 1000
+    for tid, ttype in ttypes.items():
+        s += 50 if tid in unk else 10
+        if ttype == "TreeCnt" and tid in mapping:
+            s += 200
+    return s
+
+# mode 未定（推测匹配）时，各模式的先验加分 = 权重 × 该模式在 G.graph["mode_prior"] 里的置信度（0~1），
+# 只在结构打分相同或接近时起作用，不会压过 target 的 +1000
+MODE_PRIOR_SCALE = 100
+# 推测匹配的胜者若没有该 mode 的先验，分数须比其他 mode 的最好命中至少高这么多才采纳（与满置信度先验同量级）
+SPECULATIVE_MARGIN = 100
+
+def _mode_prior(problemG) -> dict:
+    if problemG.graph.get("mode") is not None:
+        return {}
+    return {m: MODE_PRIOR_SCALE * w for m, w in (problemG.graph.get("mode_prior") or {}).items()}
+
+def _ranked(problemG, structural):
+    """
+    分支定界：按分数从高到低惰性产出 (score, tvar, mapping_inv)。
+    命中先按上界入队，出队时才做 guards 与精确打分；已打分的最优项只要不低于剩余上界就可以先产出。
+    同分按 (rank, 变体序, 映射序) 取先，与“按加载顺序排序后取 max”一致。
+    mode 未定时候选跨模式，分数另加该模板 mode 的先验。
+    """
+    sctx = _score_context(problemG)
+    prior = _mode_prior(problemG)
+    pending = [(-_score_bound(sctx, tvar, m) - prior.get(tvar.get("mode"), 0), rk, i)
+               for i, (rk, tvar, m) in enumerate(structural)]
+    heapq.heapify(pending)
+    ready = []
+    while pending or ready:
+        while pending and (not ready or pending[0][:2] < ready[0][:2]):
+            _, rk, i = heapq.heappop(pending)
+            _, tvar, m = structural[i]
+            if not _guards_ok(problemG, tvar, m):
+                continue  # 换下一种映射
+            heapq.heappush(ready, (-_score_match(sctx, tvar, m) - prior.get(tvar.get("mode"), 0), rk, i))
+        if ready:
+            s, _, i = heapq.heappop(ready)
+            yield -s, structural[i][1], structural[i][2]
+
+def _speculative_rejection(problemG, best, ranked):
+    """
+    推测匹配（mode 未定）的胜者要有依据才采纳，返回不采纳的原因，None 表示通过：
+      1) 模板能回答 target：某个 unknown 映射到 target 类型的节点；
+      2) 胜出 mode 在 mode_prior 里有置信度，或比其他 mode 的最好命中高出 SPECULATIVE_MARGIN 分。
+    ranked 是同一次 _ranked 的剩余部分（分数从高到低），只取到第一个其他 mode 的命中为止。
+    """
+    score, tvar, mapping_inv = best
+    target = problemG.graph.get("target")
+    unk = R.compile_template(tvar).unknowns
+    if not target:
+        return "题目没有 target"
+    if not any(problemG.nodes[mapping_inv[u]].get("type") == target for u in unk if u in mapping_inv):
+        return f"模板不回答 target={target}"
+    mode = tvar.get("mode")
+    if (problemG.graph.get("mode_prior") or {}).get(mode):
+        return None
+    rival = next((s for s, t, _ in ranked if t.get("mode") != mode), None)
+    if rival is not None and score - rival < SPECULATIVE_MARGIN:
+        return f"领先其他 mode 仅 {score - rival} 分"
+    return None
+
+def _pick_best(problemG, structural):
+    """与数值相关的部分：guards 校验 + _score_match 取最优（上界剪枝，拿到第一名即停）"""
+    ranked = _ranked(problemG, structural)
+    best = next(ranked, None)
+    if best is None:
         return None, None
+    _, tvar, mapping_inv = best
+    if problemG.graph.get("mode") is None:
+        # 推测匹配：有依据才采纳，并记下胜出模板的 mode，调用方据此定下题图模式
+        why = _speculative_rejection(problemG, best, ranked)
+        if why:
+            print(f"推测匹配未采纳：{tvar['id']}（{why}）")
+            return None, None
+        problemG.graph["matched_mode"] = tvar.get("mode")
+    print(f"匹配到子图模板：{tvar['id']}，映射：{mapping_inv}（已按 target 优选）")
+    return tvar, mapping_inv
+
+def _candidates(problemG):
+    # 模板索引在 registry 加载时已建好（含模式图与 optional 变体），能回答 target 的模板排在前面；
+    # mode 为 None 时取该 topic 的全部模板（同族成员合并为一次结构搜索）
+    return R.candidates_for(problemG.graph.get("topic"), problemG.graph.get("mode"), problemG.graph.get("target"))
+
+def match(problemG: nx.MultiDiGraph):
+    # 结构部分（VF2）按形状缓存；guards / 打分依赖数值，每题重新算
+    return _pick_best(problemG, _cached_structural_hits(problemG, _candidates(problemG)))
 
-    best = max(hits, key=lambda hm: _score_match(problemG, hm[0], hm[1]))
-    print(f"匹配到子图模板：{best[0]['id']}，映射：{best[1]}（已按 target 优选）")
-    return best
-    
\ No newline at end of file
+def match_topk(problemG: nx.MultiDiGraph, k: int):
+    """按分数从高到低惰性产出至多 k 个 (tpl, mapping_inv, score)，供需要备选模板的调用方使用（mode 未定时不做推测采纳校验）"""
+    ranked = _ranked(problemG, _cached_structural_hits(problemG, _candidates(problemG)))
+    for _, (score, tvar, mapping_inv) in zip(range(k), ranked):
+        yield tvar, mapping_inv, score
+
+def match_batch(graphs):
+    """
+    批量匹配：按形状分组，每组只做一次结构搜索（不依赖 LRU 是否还留着），
+    再逐题套 guards / 打分。返回与 graphs 对齐的 [(tpl, mapping) | (None, None), …]
+    """
+    groups = {}
+    for i, G in enumerate(graphs):
+        key, order = _shape_key(G)
+        groups.setdefault(key, []).append((i, order))
+
+    results = [None] * len(graphs)
+    for key, members in groups.items():
+        i0, order0 = members[0]
+        G0 = graphs[i0]
+        structural = _cached_structural_hits(G0, _candidates(G0), shape=(key, order0))
+        pos0 = {nid: k for k, nid in enumerate(order0)}
+        for i, order in members:
+            if i != i0:
+                structural_i = [(rk, tvar, {t: order[pos0[p]] for t, p in m.items()}) for rk, tvar, m in structural]
+            else:
+                structural_i = structural
+            results[i] = _pick_best(graphs[i], structural_i)
+    return results
@@ -4,18 +4,128 @@
 
 2025-10-27新增：先路由收集候选 → 再逐候选抽取/匹配/求解 → 按统一评分选最优，天然支持扩题 & 混合题
 """
-import pathlib, json, pkgutil, importlib
+import pathlib, json, pkgutil, importlib, ast, hashlib, re
+from collections import namedtuple
+from collections.abc import Mapping
+from itertools import combinations
+from types import MappingProxyType
+import networkx as nx
+from sympy import symbols, Eq, sympify, solve, lambdify, expand
+from core.compiler import compile_matcher, compile_guard, validate_template
+from core.scanner import RuleScanner, RouteScanner, required_literals, STR_RULE_FLAGS
+from core.rulespec import RuleSpec, RuleRef, SpecAction, spec_hash, legacy_hash
+from core.spans import SpanQuery
 
 ROOT = pathlib.Path(__file__).resolve().parent.parent
 SUBGRAPH_DIR = ROOT / "subgraphs"
 
 # ---------- 规则 ----------
 RULE_REGISTRY = {} # 全局 dict {"tree":[(regex,action)…]}，在 rules 文件里调用 register_rule(rule) 即可加入
-def register_rule(topic: str, rule):
+# 与 RULE_REGISTRY 一一对应：每条规则的必需字面量（frozenset，任一匹配必含其一）；None = 推不出，总要跑
+RULE_LITERALS = {}
+# 与 RULE_REGISTRY 一一对应：声明式规则的 RuleSpec（旧 lambda 规则为 None）与内容哈希
+RULE_SPECS = {}
+RULE_HASHES = {}
+
+def compile_rule_spec(spec: RuleSpec):
+    """RuleSpec -> (编译后的 regex, SpecAction)；flags 缺省同字符串规则（re.I | re.S）；pattern 为 SpanQuery 时原样保留"""
+    if isinstance(spec.pattern, SpanQuery):
+        return spec.pattern, SpecAction(spec)
+    flags = STR_RULE_FLAGS if spec.flags is None else spec.flags
+    return re.compile(spec.pattern, flags), SpecAction(spec)
+
+def register_rule(topic: str, rule, *, literals=None):
     """
-    在各 rules_*.py 中调用： register_rule(topic, (regex, action_fn))
+    在各 rules_*.py 中调用： register_rule(topic, (regex, action_fn)) 或 register_rule(topic, RuleSpec(...))；
+    “关键词 + 数 + 单位”的规则把 regex 换成 SpanQuery（查共享的数值跨度表，见 core.spans）
+    RuleSpec 在这里编译成 (regex, SpecAction)，RULE_REGISTRY 里两种规则形状相同，下游照常 for rx, fn in ...。
+    注册时从 regex 推导必需字面量；推不出来（如 r'.+' 之类靠动作内部再判断的规则）时，
+    可用 literals=[...] 手工指定“不含其中任何一个就不可能生效”的词；literals=() 表示总要跑。
     """
+    spec = rule if isinstance(rule, RuleSpec) else None
+    if spec is not None:
+        rule = compile_rule_spec(spec)
+    rx = rule[0]
+    if literals is not None:
+        lits = frozenset(literals) or None
+    elif rx == "__AUTO__":
+        lits = None
+    else:
+        lits = required_literals(re.compile(rx, STR_RULE_FLAGS) if isinstance(rx, str) else rx)
     RULE_REGISTRY.setdefault(topic, []).append(rule)
+    RULE_LITERALS.setdefault(topic, []).append(lits)
+    RULE_SPECS.setdefault(topic, []).append(spec)
+    RULE_HASHES.setdefault(topic, []).append(spec_hash(spec) if spec is not None else legacy_hash(rule))
+    _SCANNERS.pop(topic, None)
+
+def ruleset_hash(topic: str) -> str:
+    """该 topic 整套规则（含顺序与手工字面量）的哈希，规则一改就变，可作规则级缓存的失效键"""
+    h = hashlib.sha1()
+    for rh, lits in zip(RULE_HASHES.get(topic, []), RULE_LITERALS.get(topic, [])):
+        h.update(f"{rh}:{sorted(lits) if lits else ''};".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+def duplicate_rules(topic: str) -> list:
+    """内容完全相同（哈希相同）的规则组 [[序号…]…]；规则顺序有语义，这里只报告，不自动去重"""
+    groups = {}
+    for i, rh in enumerate(RULE_HASHES.get(topic, [])):
+        groups.setdefault(rh, []).append(i)
+    return [ids for ids in groups.values() if len(ids) > 1]
+
+def export_rules(topic: str) -> tuple:
+    """
+    可 pickle 的规则集（交给 spawn 出来的工作进程）：声明式规则带 RuleSpec 本身，
+    旧 lambda 规则只带 RuleRef（对方进程 import core.registry 时会注册同一批规则，按序号取回并核对哈希）
+    """
+    return tuple((spec if spec is not None else RuleRef(topic, i, rh), lits)
+                 for i, (spec, rh, lits) in enumerate(zip(RULE_SPECS.get(topic, []), RULE_HASHES.get(topic, []),
+                                                          RULE_LITERALS.get(topic, []))))
+
+def import_rules(items) -> RuleScanner:
+    """export_rules 的结果还原成扫描器；RuleRef 对应的本地规则哈希不一致时报错（两边规则代码不同步）"""
+    rules, lits = [], []
+    for item, ls in items:
+        if isinstance(item, RuleRef):
+            hashes = RULE_HASHES.get(item.topic, [])
+            rh = hashes[item.index] if item.index < len(hashes) else None
+            if rh != item.hash:
+                raise ValueError(f"规则 {item.topic}#{item.index} 与本进程不一致（{item.hash} != {rh}）")
+            rules.append(RULE_REGISTRY[item.topic][item.index])
+        else:
+            rules.append(compile_rule_spec(item))
+        lits.append(ls)
+    return RuleScanner(rules, lits)
+
+_SCANNERS = {}  # topic -> RuleScanner，按需编译；该 topic 再注册规则时作废
+def rule_scanner(topic: str) -> RuleScanner:
+    """该 topic 全部抽取规则（不含 __AUTO__ hook）合成的单遍扫描器，按必需字面量门控"""
+    sc = _SCANNERS.get(topic)
+    if sc is None:
+        sc = _SCANNERS[topic] = RuleScanner(RULE_REGISTRY.get(topic, []), RULE_LITERALS.get(topic, []))
+    return sc
+
+def rule_skip_stats(topic: str = None) -> list:
+    """
+    每条抽取规则被字面量门控跳过的统计：[{topic, index, pattern, literals, scans, skipped}]。
+    skipped/scans 接近 0 的规则（literals 为 None 或太常见）每题都要跑，是收紧的对象。
+    """
+    rows = []
+    for t in ([topic] if topic else list(_SCANNERS)):
+        sc = _SCANNERS.get(t)
+        if sc is None:
+            continue
+        for i, ((rx, _), lits) in enumerate(zip(sc.rules, sc.literals)):
+            rows.append({"topic": t, "index": i, "pattern": rx.pattern,
+                         "literals": sorted(lits) if lits else None,
+                         "scans": sc.scans, "skipped": sc.skipped[i]})
+    return rows
+
+def print_rule_skip_stats(topic: str = None):
+    for row in rule_skip_stats(topic):
+        rate = row["skipped"] / row["scans"] if row["scans"] else 0.0
+        pat = row["pattern"] if len(row["pattern"]) <= 40 else row["pattern"][:37] + "..."
+        print(f"[{row['topic']}#{row['index']:02d}] 跳过 {row['skipped']}/{row['scans']} ({rate:.0%})"
+              f"  字面量={row['literals']}  {pat}")
 
 # ---------- 新增路由（Phase-1）:在现有内容基础上，新增路由规则池和 register_route ---------
 
@@ -26,6 +136,14 @@ def register_route(topic: str, rule):
     action(m, g) 里只调用 g.add_candidate(...)，不要写 g.set_pattern(...)
     """
     ROUTE_REGISTRY.setdefault(topic, []).append(rule)
+    _ROUTE_SCANNER.clear()
+
+_ROUTE_SCANNER = []  # [RouteScanner]，跨全部 topic 只建一个；再注册路由规则时作废
+def route_scanner() -> RouteScanner:
+    """全部路由规则（按 topic 注册顺序）合成的关键词门控扫描器"""
+    if not _ROUTE_SCANNER:
+        _ROUTE_SCANNER.append(RouteScanner([rule for rules in ROUTE_REGISTRY.values() for rule in rules]))
+    return _ROUTE_SCANNER[0]
 
 # 动态 import rules/*.py，文件名格式必须 `rules_<topic>.py`
 for mod in pkgutil.iter_modules([str(ROOT / "rules")]):
@@ -36,10 +154,438 @@ for mod in pkgutil.iter_modules([str(ROOT / "rules")]):
 # ---------- 子图模板 ----------
 # load templates，循环 subgraphs/*.json 读成 dict，后续 matcher.py 直接遍历此列表做同构匹配
 SUBGRAPH_REGISTRY = []
+# 模板族：一个结构模式 + 成员参数表（{"family", "nodes", "edges", ..., "members": [{"id", "mode", "params", "formula"}…]}），
+# 边上写 "op": "$名字" 的由成员 params 绑定；读盘时展开成普通模板（带 family / params 字段），原始族定义留在这里
+TEMPLATE_FAMILIES = {}
+
+def _bind_params(e: dict, params: dict, family: str) -> dict:
+    e = dict(e)
+    for k, v in e.items():
+        if isinstance(v, str) and v.startswith("$"):
+            if k != "op":
+                raise ValueError(f"模板族 {family}：只支持参数化边的 op，不支持 {k}={v}")
+            if v[1:] not in params:
+                raise ValueError(f"模板族 {family} 的成员缺少参数 {v[1:]}")
+            e[k] = params[v[1:]]
+    return e
+
+def _expand_family(fam: dict) -> list:
+    shared = {k: v for k, v in fam.items() if k not in ("family", "members")}
+    out = []
+    for m in fam["members"]:
+        tpl = dict(shared, **m, family=fam["family"])
+        tpl["edges"] = [_bind_params(e, m.get("params", {}), fam["family"]) for e in fam.get("edges", [])]
+        out.append(tpl)
+    return out
+
+# 加载时对照 schema.py 静态校验（core.compiler.validate_template）：有错误的模板不进注册表，
+# 连同文件名、id 记在 TEMPLATE_ERRORS 里并打印一次，不会拖到每道题求解时才在 try/except 里失败
+TEMPLATE_ERRORS = []
+
+def _admit(tpl: dict, source: str):
+    errors, warnings = validate_template(tpl)
+    for w in warnings:
+        print(f"[模板校验] {source} / {tpl.get('id')}：{w}")
+    if errors:
+        for e in errors:
+            print(f"[模板校验] {source} / {tpl.get('id')}：{e}（已跳过该模板）")
+        TEMPLATE_ERRORS.append((source, tpl.get("id"), tuple(errors)))
+        return
+    SUBGRAPH_REGISTRY.append(tpl)
+
 # for fp in pathlib.Path("subgraphs").glob("*.json"):
 for fp in SUBGRAPH_DIR.glob("*.json"):
     data = json.load(fp.open(encoding="utf-8"))
-    SUBGRAPH_REGISTRY.extend(data if isinstance(data,list) else [data])
+    for item in (data if isinstance(data,list) else [data]):
+        if "family" in item:
+            TEMPLATE_FAMILIES[item["family"]] = item
+            for tpl in _expand_family(item):
+                _admit(tpl, fp.name)
+        else:
+            _admit(item, fp.name)
+
+# ---------- 结构签名 / 模式图 ----------
+def signature_of(nodes, edges) -> dict:
+    """
+    结构签名（多重集计数）：节点 type、(type, role)，边 type、(type, op)。
+    nodes / edges 为属性 dict 的可迭代对象，模板与题目图共用同一算法。
+    """
+    sig = {"node_types": {}, "node_roles": {}, "edge_types": {}, "edge_ops": {}}
+    for d in nodes:
+        t = d.get("type")
+        sig["node_types"][t] = sig["node_types"].get(t, 0) + 1
+        if d.get("role") is not None:
+            k = (t, d.get("role"))
+            sig["node_roles"][k] = sig["node_roles"].get(k, 0) + 1
+    for d in edges:
+        t = d.get("type")
+        sig["edge_types"][t] = sig["edge_types"].get(t, 0) + 1
+        if d.get("op") is not None:
+            k = (t, d.get("op"))
+            sig["edge_ops"][k] = sig["edge_ops"].get(k, 0) + 1
+    return sig
+
+def signature_contains(big: dict, small: dict) -> bool:
+    """small（模板）所需的每一类计数都不超过 big（题目图）时返回 True；模板未声明的 role / op 视为通配"""
+    for part, need in small.items():
+        have = big[part]
+        for k, n in need.items():
+            if have.get(k, 0) < n:
+                return False
+    return True
+
+def _tpl_to_graph(tpl: dict) -> nx.MultiDiGraph:
+    G = nx.MultiDiGraph()
+    for n in tpl["nodes"]:
+        G.add_node(n["id"], **n)  # id/type/...
+    for e in tpl["edges"]:
+        G.add_edge(e["u"], e["v"], **e)  # type/op/optional?
+    G.graph.update(topic=tpl.get("topic"), mode=tpl.get("mode"))
+    return nx.freeze(G)
+
+# ---------- 公式预编译 ----------
+# 每个模板的公式只 sympify 一次；按 (未知量, 已知量) 划分的闭式解在首次用到时符号求解一次，
+# 转成纯 Python 函数（lambdify, math 模块）缓存在模板上，solver 运行时直接代值即可。
+# 编译结果是不可变的 CompiledPlan：符号表、Eq 元组、节点 id->type、unknowns、guards 闭包、
+# 整模板的模式图（已 freeze）与结构签名；forms 是按 (未知量, 已知量) 划分惰性填充的闭式解缓存。
+CompiledPlan = namedtuple("CompiledPlan", "symtab eqs types unknowns guards pattern signature forms")
+
+def _compile_guards(tpl: dict, names) -> tuple:
+    out = []
+    for g in tpl.get("guards") or []:
+        try:
+            out.append(compile_guard(g, names))
+        except ValueError as e:
+            raise ValueError(f"模板 {tpl.get('id')} 的 guard {g!r} 无效：{e}") from None
+    return tuple(out)
+
+def _build_plan(tpl) -> CompiledPlan:
+    symtab = {n["id"]: symbols(n["id"]) for n in tpl["nodes"]}
+    eqs = tuple(
+        Eq(*[sympify(side.strip(), locals=symtab) for side in f.split("=")])
+        for f in tpl.get("formula", [])
+    )
+    return CompiledPlan(
+        symtab=MappingProxyType(symtab), eqs=eqs,
+        # types / unknowns 供 matcher 打分直接查表
+        types=MappingProxyType({n["id"]: n.get("type") for n in tpl["nodes"]}),
+        unknowns=frozenset(tpl.get("unknowns", [])),
+        guards=_compile_guards(tpl, symtab),
+        pattern=_tpl_to_graph(tpl),
+        signature=signature_of(tpl["nodes"], tpl["edges"]),
+        forms={},
+    )
+
+def compile_template(tpl) -> CompiledPlan:
+    """
+    取模板的编译结果：注册表里的 CompiledTemplate 直接返回其 plan；
+    临时传入的 dict 模板编译一次，挂在 tpl["__compiled__"] 上，重复调用直接返回。
+    """
+    if isinstance(tpl, CompiledTemplate):
+        return tpl.plan
+    plan = tpl.get("__compiled__")
+    if plan is None:
+        plan = tpl["__compiled__"] = _build_plan(tpl)
+    return plan
+
+def _solve_closed_form(plan: CompiledPlan, unknown_ids: frozenset, given_ids: frozenset):
+    """
+    对一组未知量做一次符号求解，返回
+      {"given": (id…), "unknowns": (id…), "fn": f(*given) -> [值…], "check": f(*given) -> [(lhs, rhs)…] | None,
+       "args"/"exprs"/"constraints": 原始符号表达式，供 solver 生成 NumPy 向量化版本}
+    解不唯一 / 含未知自由符号 / SymPy 解不出（如 floor 里的未知量）时返回 None，由调用方回退 SymPy。
+    """
+    symtab, eqs = plan.symtab, plan.eqs
+    unknown_syms = {symtab[u] for u in unknown_ids if u in symtab}
+    given_order = sorted(g for g in given_ids if g in symtab)
+    given_syms = [symtab[g] for g in given_order]
+    if not unknown_syms:
+        return None
+
+    # 不含未知量的方程只是约束：运行时校验，矛盾时交给 SymPy 原路径处理
+    system = [e for e in eqs if e.free_symbols & unknown_syms]
+    constraints = [e for e in eqs if not (e.free_symbols & unknown_syms)]
+    if not system:
+        return None
+
+    try:
+        sols = solve(system, sorted(unknown_syms, key=str), dict=True)
+    except Exception:
+        return None
+    if len(sols) != 1:
+        return None
+
+    sol = sols[0]
+    if any(not (v.free_symbols <= set(given_syms)) for v in sol.values()):
+        return None
+
+    return {
+        "given": tuple(given_order),
+        "unknowns": tuple(str(k) for k in sol),
+        "args": given_syms,
+        "exprs": list(sol.values()),
+        "constraints": constraints,
+        "fn": lambdify(given_syms, list(sol.values()), modules="math"),
+        "check": (lambdify(given_syms, [(e.lhs, e.rhs) for e in constraints], modules="math")
+                  if constraints else None),
+    }
+
+def solved_form(tpl: dict, unknown_ids, given_ids):
+    """取模板在 (未知量, 已知量) 划分下的闭式解；同一划分只求解一次"""
+    plan = compile_template(tpl)
+    sig = (frozenset(unknown_ids), frozenset(given_ids))
+    if sig not in plan.forms:
+        plan.forms[sig] = _solve_closed_form(plan, *sig)
+    return plan.forms[sig]
+
+# ---------- 模板对象 ----------
+# 注册表里的模板是只读的 CompiledTemplate：内容深度冻结（dict -> MappingProxy，list -> tuple），
+# 仍可按 dict 方式读（tpl["id"] / tpl.get("mode")），但不能改；带稳定的内容哈希与版本号，可作缓存键，
+# fork 出的工作进程直接共享同一份注册表，无需防御性拷贝。
+def _freeze(x):
+    if isinstance(x, Mapping):
+        return MappingProxyType({k: _freeze(v) for k, v in x.items()})
+    if isinstance(x, (list, tuple)):
+        return tuple(_freeze(v) for v in x)
+    return x
+
+def _thaw(x):
+    if isinstance(x, Mapping):
+        return {k: _thaw(v) for k, v in x.items()}
+    if isinstance(x, tuple):
+        return [_thaw(v) for v in x]
+    return x
+
+def content_hash(tpl) -> str:
+    """模板内容的稳定哈希（与进程、PYTHONHASHSEED 无关）：规范化 JSON 的 sha1 前 16 位"""
+    raw = {k: v for k, v in _thaw(tpl).items() if not k.startswith("__")}
+    return hashlib.sha1(json.dumps(raw, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+class CompiledTemplate(Mapping):
+    __slots__ = ("_data", "id", "topic", "mode", "family", "version", "content_hash", "plan", "_hash")
+
+    def __init__(self, tpl, plan: CompiledPlan = None):
+        data = _freeze({k: v for k, v in tpl.items() if not k.startswith("__")})
+        for k, v in (("_data", data), ("id", data.get("id")), ("topic", data.get("topic")),
+                     ("mode", data.get("mode")), ("family", data.get("family")),
+                     ("version", int(data.get("version", 1))), ("content_hash", content_hash(data))):
+            object.__setattr__(self, k, v)
+        object.__setattr__(self, "_hash", hash(self.content_hash))
+        object.__setattr__(self, "plan", plan or _build_plan(self))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"CompiledTemplate 只读：不能设置 {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"CompiledTemplate 只读：不能删除 {name}")
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if isinstance(other, CompiledTemplate):
+            return self.content_hash == other.content_hash
+        return Mapping.__eq__(self, other)
+
+    def __repr__(self):
+        return f"<CompiledTemplate {self.id} v{self.version} #{self.content_hash}>"
+
+    def __reduce__(self):
+        # 跨进程传递只带原始内容；接收方注册表里有同哈希的模板就直接复用
+        return (_template_from_raw, (_thaw(self._data),))
+
+    def derive(self, **changes) -> "CompiledTemplate":
+        """派生变体（如去掉部分 optional 边）：公式、guards、闭式解缓存与原模板共享，模式图/签名按新结构重建"""
+        raw = dict(_thaw(self._data), **changes)
+        return CompiledTemplate(raw, self.plan._replace(pattern=_tpl_to_graph(raw),
+                                                        signature=signature_of(raw["nodes"], raw["edges"])))
+
+TEMPLATES_BY_HASH = {}
+
+def _template_from_raw(raw: dict) -> CompiledTemplate:
+    return TEMPLATES_BY_HASH.get(content_hash(raw)) or CompiledTemplate(raw)
+
+SUBGRAPH_REGISTRY[:] = [CompiledTemplate(tpl) for tpl in SUBGRAPH_REGISTRY]
+for tpl in SUBGRAPH_REGISTRY:
+    TEMPLATES_BY_HASH.setdefault(tpl.content_hash, tpl)
+
+def template_key(tpl):
+    """缓存键：注册表模板用内容哈希；临时 dict 模板退回 (id, 公式)"""
+    if isinstance(tpl, CompiledTemplate):
+        return tpl.content_hash
+    return (tpl.get("id"), tuple(tpl.get("formula", [])))
+
+# ---------- 模板自同构 ----------
+# V1/V2 这类同类型节点交换后公式、guards 都不变时，VF2 会把同一组题目节点的每种排列都当成一个命中。
+# 这里找出“两两交换不改变模板”的节点，按交换关系连成可互换组；matcher 每个轨道只产出一个代表。
+class _Rename(ast.NodeTransformer):
+    def __init__(self, perm):
+        self.perm = perm
+
+    def visit_Name(self, node):
+        return ast.copy_location(ast.Name(id=self.perm.get(node.id, node.id), ctx=node.ctx), node)
+
+def _swap_invariant(tpl: dict, a: str, b: str) -> bool:
+    """交换模板节点 a、b 后：边、unknowns、公式（方程组，允许移项变号）、guards 是否都不变"""
+    perm = {a: b, b: a}
+    edge_key = lambda e, p: (p.get(e["u"], e["u"]), p.get(e["v"], e["v"]), e.get("type"), e.get("op"), bool(e.get("optional")))
+    edges = tpl.get("edges", [])
+    if sorted(edge_key(e, {}) for e in edges) != sorted(edge_key(e, perm) for e in edges):
+        return False
+    unk = set(tpl.get("unknowns", []))
+    if unk != {perm.get(u, u) for u in unk}:
+        return False
+
+    plan = compile_template(tpl)
+    sa, sb = plan.symtab[a], plan.symtab[b]
+    exprs = [expand(e.lhs - e.rhs) for e in plan.eqs if isinstance(e, Eq)]
+    for e in exprs:
+        e2 = expand(e.xreplace({sa: sb, sb: sa}))
+        if not any(e2 == f or e2 == -f for f in exprs):
+            return False
+
+    guards = [ast.parse(g.strip(), mode="eval") for g in tpl.get("guards") or []]
+    if sorted(ast.dump(g) for g in guards) != sorted(ast.dump(_Rename(perm).visit(g)) for g in guards):
+        return False
+    return True
+
+def interchangeable_classes(tpl: dict) -> tuple:
+    """可互换节点组：同 type/role 且两两交换后模板不变的节点（按交换关系取连通分量），每组按模板节点顺序"""
+    ids = [n["id"] for n in tpl["nodes"]]
+    label = {n["id"]: (n.get("type"), n.get("role")) for n in tpl["nodes"]}
+    parent = {i: i for i in ids}
+
+    def find(x):
+        while parent[x] != x:
+            x = parent[x]
+        return x
+    for a, b in combinations(ids, 2):
+        if label[a] == label[b] and find(a) != find(b) and _swap_invariant(tpl, a, b):
+            parent[find(b)] = find(a)
+    groups = {}
+    for i in ids:
+        groups.setdefault(find(i), []).append(i)
+    return tuple(tuple(g) for g in groups.values() if len(g) > 1)
+
+# ---------- 模板索引 ----------
+# 加载时一次建好：(topic, mode) -> 模板条目；每个条目带 optional 边子集格（_VariantLattice），
+# 各变体的 VF2 模式图（已 freeze）、结构签名、生成的专用匹配函数在首次用到时构建并缓存；
+# matcher 每题只做字典查找，不再扫 SUBGRAPH_REGISTRY、不再建图 / deepcopy。
+TemplateEntry = namedtuple("TemplateEntry", "rank tpl variants family")
+# 模板族的共享结构：族名、结构模式模板（参数边 op 不限，带 "param" 标记）、其 optional 边子集格
+TemplateFamily = namedtuple("TemplateFamily", "name tpl variants")
+# 单个变体：变体模板 dict、VF2 模式图、结构签名、生成的专用匹配函数（core.compiler）、
+# 保留的 optional 边序号集合 kept（frozenset，越大越具体）、可互换节点组 symmetry
+TemplateVariant = namedtuple("TemplateVariant", "tpl pattern signature match_fn kept symmetry")
+
+class _VariantLattice:
+    """
+    模板 optional 边的全部子集，按保留的 optional 边从多到少（同样多按序号字典序）排列，第 0 个即原模板。
+    变体按下标惰性构建并缓存（CompiledTemplate.derive，公式预编译结果共享）；matcher 在更具体的变体命中后不再取其子集。
+    """
+    __slots__ = ("tpl", "_opt", "_subsets", "_built", "_symmetric")
+
+    def __init__(self, tpl: dict, symmetric: bool = True):
+        self.tpl = tpl
+        self._symmetric = symmetric  # 族的结构模式没有公式，不做自同构剪枝（由各成员自己判断）
+        self._opt = [i for i, e in enumerate(tpl.get("edges", [])) if e.get("optional")]
+        n = len(self._opt)
+        self._subsets = [frozenset(c) for r in range(n, -1, -1) for c in combinations(range(n), r)]
+        self._built = {}
+
+    def __len__(self):
+        return len(self._subsets)
+
+    def __getitem__(self, i):
+        v = self._built.get(i)
+        if v is None:
+            kept = self._subsets[i]
+            if len(kept) == len(self._opt):
+                tvar = self.tpl
+            else:
+                drop = {self._opt[j] for j in range(len(self._opt)) if j not in kept}
+                edges = [e for k, e in enumerate(self.tpl["edges"]) if k not in drop]
+                tvar = (self.tpl.derive(edges=edges) if isinstance(self.tpl, CompiledTemplate)
+                        else dict(self.tpl, edges=edges))
+            if isinstance(tvar, CompiledTemplate):
+                pattern, sig = tvar.plan.pattern, tvar.plan.signature
+            else:
+                pattern, sig = _tpl_to_graph(tvar), signature_of(tvar["nodes"], tvar["edges"])
+            sym = interchangeable_classes(tvar) if self._symmetric else ()
+            v = self._built[i] = TemplateVariant(tvar, pattern, sig, compile_matcher(tvar, sym), kept, sym)
+        return v
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+def _answer_types(tpl: dict) -> set:
+    """模板能回答的目标量类型：unknowns 对应的节点类型；未写 unknowns 时任一节点都可能是未知量"""
+    types = {n["id"]: n.get("type") for n in tpl.get("nodes", [])}
+    unk = tpl.get("unknowns")
+    return {types.get(u) for u in unk} if unk else set(types.values())
+
+def _family_pattern(fam: dict) -> dict:
+    """族的结构模式：参数边的 op 置空（匹配任意 op），记下参数名供 matcher 按实际 op 分派成员"""
+    edges = []
+    for e in fam.get("edges", []):
+        v = e.get("op")
+        if isinstance(v, str) and v.startswith("$"):
+            e = dict(e, op=None, param=v[1:])
+        edges.append(e)
+    return {"id": fam["family"], "topic": fam.get("topic"), "mode": None,
+            "nodes": fam["nodes"], "edges": edges}
+
+def _build_template_index(templates):
+    families = {name: TemplateFamily(name, pat, _VariantLattice(pat, symmetric=False))
+                for name, pat in ((n, _family_pattern(f)) for n, f in TEMPLATE_FAMILIES.items())}
+    by_mode = {}
+    for rank, tpl in enumerate(templates):
+        by_mode.setdefault((tpl.get("topic"), tpl.get("mode")), []).append(
+            TemplateEntry(rank, tpl, _VariantLattice(tpl), families.get(tpl.get("family"))))
+
+    # mode 未定时按 topic 整体检索：(topic, None) -> 该 topic 全部模板（加载顺序）
+    by_topic = {}
+    for rank, tpl in enumerate(templates):
+        entry = next(e for e in by_mode[(tpl.get("topic"), tpl.get("mode"))] if e.rank == rank)
+        by_topic.setdefault((tpl.get("topic"), None), []).append(entry)
+
+    # 二级索引：(topic, mode, 目标类型) -> 能回答该类型的模板在前、其余在后（各自保持加载顺序）
+    by_target = {}
+    for key, entries in list(by_mode.items()) + list(by_topic.items()):
+        for t in {t for e in entries for t in _answer_types(e.tpl)}:
+            first = [e for e in entries if t in _answer_types(e.tpl)]
+            by_target[key + (t,)] = tuple(first + [e for e in entries if t not in _answer_types(e.tpl)])
+    return (MappingProxyType({k: tuple(v) for k, v in by_mode.items()}),
+            MappingProxyType({k: tuple(v) for k, v in by_topic.items()}),
+            MappingProxyType(by_target))
+
+TEMPLATE_INDEX, TEMPLATE_INDEX_BY_TOPIC, TEMPLATE_INDEX_BY_TARGET = _build_template_index(SUBGRAPH_REGISTRY)
+
+def candidates_for(topic, mode, target=None) -> tuple:
+    """
+    (topic, mode) 下的模板条目；mode 为 None（模式没定下来）时返回该 topic 的全部模板。
+    给了 target 时，能回答 target 的模板排在前面（其余保持加载顺序）。
+    """
+    if target:
+        entries = TEMPLATE_INDEX_BY_TARGET.get((topic, mode, target))
+        if entries is not None:
+            return entries
+    if mode is None:
+        return TEMPLATE_INDEX_BY_TOPIC.get((topic, None), ())
+    return TEMPLATE_INDEX.get((topic, mode), ())
+
+def all_candidates() -> tuple:
+    """全部模板条目（加载顺序，不分 topic / mode），供跨题型核对用"""
+    return tuple(sorted((e for es in TEMPLATE_INDEX_BY_TOPIC.values() for e in es), key=lambda e: e.rank))
 
 print("子图模板数:", len(SUBGRAPH_REGISTRY))
 print("已加载题型:", list(RULE_REGISTRY.keys()))
@@ -0,0 +1,159 @@
+"""
+声明式抽取规则：RuleSpec 只含数据（regex 文本、捕获组 → 节点、set_pattern、图属性、条件），
+可 pickle、可按内容哈希、可静态分析；core.registry 注册时把它编译成 SpecAction（普通的 action(m, g)）。
+旧的 (regex, lambda) 规则照常注册，只是不能跨进程传递，只能用 RuleRef 按 (topic, 序号) 在对方进程里取回。
+
+写法示例：
+    RuleSpec(r'(\\d+(?:\\.\\d+)?)\\s*(小时|h)', re.I,
+             nodes=(NodeSpec("Time", "$1", unit="h", conv="float"),))
+    RuleSpec(r'(周长|全长)\\s*(\\d+)\\s*米', nodes=(NodeSpec("Length", "$2"),), set_pattern=("tree", "loop_closed"))
+    RuleSpec(SpanQuery(("小时", "h")), nodes=(NodeSpec("Time", "$1", unit="h", conv="float"),))
+pattern 为 core.spans.SpanQuery 时查数值跨度表，组号固定：$1 数字、$2 单位、$3 分母单位。
+
+NodeSpec 字段：
+    type   节点类型
+    value  "$1" / "$name" 取捕获组（按 conv 转换），("$1", "$2") 为各组之和，None 表示未知量，其余原样作为值
+    unit   单位：字面值，或 "$n" 取捕获组原文
+    role   角色（字面值）
+    attrs  其余属性 ((键, 值), ...)，原样传给 add_node（值为 None 也传，会覆盖同值节点上的属性）
+    conv   捕获组的转换："num"（有小数点为 float，否则 int）、"float"、"int"、"str"
+    how    "add"  直接 add_node
+           "last" 已有同类型节点则改最近那个的值，否则新建
+           "fill" 最近那个同类型节点值为空时补上，否则新建
+RuleSpec.when：条件元组，全部成立才执行；"last_of:T" / "!last_of:T"（有 / 没有 T 类型节点），
+    "graph:k" / "!graph:k"（图属性 k 为真 / 为假）
+执行顺序：条件 → nodes（按序）→ set_pattern → graph 属性赋值（如 lock_mode、target）。
+"""
+import hashlib, json
+from collections import namedtuple
+
+NodeSpec = namedtuple("NodeSpec", "type value unit role conv how attrs",
+                      defaults=(None, None, None, "num", "add", ()))
+RuleSpec = namedtuple("RuleSpec", "pattern flags nodes set_pattern graph when",
+                      defaults=(None, (), None, (), ()))
+# 旧 lambda 规则的跨进程引用：对方进程 import 规则模块后按 (topic, index) 取回，hash 对不上说明规则已改
+RuleRef = namedtuple("RuleRef", "topic index hash")
+
+_CONV = {
+    "num": lambda s: float(s) if "." in s else int(s),  # 同 rules_tree_basic._num
+    "float": float,
+    "int": int,
+    "str": str,
+}
+
+
+def _group(ref):
+    """'$1' -> 1，'$name' -> 'name'；不是捕获组引用返回 None"""
+    if isinstance(ref, str) and ref.startswith("$"):
+        return int(ref[1:]) if ref[1:].isdigit() else ref[1:]
+    return None
+
+
+def _compile_node(ns: NodeSpec):
+    if ns.how not in ("add", "last", "fill"):
+        raise ValueError(f"NodeSpec.how 只能是 add/last/fill：{ns.how!r}")
+    if ns.conv not in _CONV:
+        raise ValueError(f"NodeSpec.conv 未知：{ns.conv!r}")
+    gu, conv = _group(ns.unit), _CONV[ns.conv]
+    if isinstance(ns.value, tuple):
+        gs = tuple(_group(r) for r in ns.value)
+        if None in gs:
+            raise ValueError(f"NodeSpec.value 求和只能引用捕获组：{ns.value!r}")
+        value = lambda m: sum(conv(m.group(i)) for i in gs)
+    else:
+        gv = _group(ns.value)
+        value = (lambda m: conv(m.group(gv))) if gv is not None else (lambda m: ns.value)
+    T, how = ns.type, ns.how
+    fixed = dict(ns.attrs)  # 不随命中变化的属性
+    if ns.unit is not None and gu is None:
+        fixed["unit"] = ns.unit
+    if ns.role is not None:
+        fixed["role"] = ns.role
+
+    def step(m, g):
+        v = value(m)
+        attrs = dict(fixed, unit=m.group(gu)) if gu is not None else fixed
+        if how != "add":
+            last = g.last_of(T)
+            if last and (how == "last" or g.G.nodes[last].get("value") is None):
+                g.set_value(last, v)
+                return
+        g.add_node(type=T, value=v, **attrs)
+    return step
+
+
+def _compile_cond(c: str):
+    neg = c.startswith("!")
+    kind, _, arg = c.lstrip("!").partition(":")
+    if kind == "last_of":
+        test = lambda g: bool(g.last_of(arg))
+    elif kind == "graph":
+        test = lambda g: bool(g.G.graph.get(arg))
+    else:
+        raise ValueError(f"RuleSpec.when 条件未知：{c!r}")
+    return (lambda g: not test(g)) if neg else test
+
+
+class SpecAction:
+    """RuleSpec 编译成的 action(m, g)：捕获组号、转换函数、条件在编译时解析好；pickle 时只带 spec"""
+    __slots__ = ("spec", "_when", "_steps")
+
+    def __init__(self, spec: RuleSpec):
+        self.spec = spec
+        self._when = tuple(_compile_cond(c) for c in spec.when)
+        self._steps = tuple(_compile_node(ns) for ns in spec.nodes)
+
+    def __call__(self, m, g):
+        for ok in self._when:
+            if not ok(g):
+                return
+        for step in self._steps:
+            step(m, g)
+        if self.spec.set_pattern:
+            g.set_pattern(*self.spec.set_pattern)
+        for k, v in self.spec.graph:
+            g.G.graph[k] = v
+
+    def __reduce__(self):
+        return SpecAction, (self.spec,)
+
+    def __repr__(self):
+        return f"<SpecAction {self.spec.pattern!r}>"
+
+
+def spec_hash(spec: RuleSpec) -> str:
+    """规则内容的稳定哈希（与进程、PYTHONHASHSEED 无关）：规范化 JSON 的 sha1 前 16 位"""
+    raw = json.dumps(spec, ensure_ascii=False, default=repr)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _stable(x, _seen=()) -> str:
+    """哈希用的稳定表示：与检出位置、行号、PYTHONHASHSEED、对象地址无关"""
+    if hasattr(x, "co_code"):
+        return "code(%s|%s|%s|%s)" % (x.co_code.hex(), ",".join(_stable(c) for c in x.co_consts),
+                                      ",".join(x.co_names), ",".join(x.co_varnames))
+    if callable(x) and hasattr(x, "__code__"):
+        if id(x) in _seen:  # 递归闭包
+            return "fn(...)"
+        seen = _seen + (id(x),)
+        cells = tuple(c.cell_contents for c in (x.__closure__ or ()))
+        return "fn(%s|%s|%s)" % (_stable(x.__code__), _stable(x.__defaults__ or (), seen), _stable(cells, seen))
+    if isinstance(x, (tuple, list)):
+        return "(" + ",".join(_stable(v, _seen) for v in x) + ")"
+    if isinstance(x, (set, frozenset)):
+        return "{" + ",".join(sorted(_stable(v, _seen) for v in x)) + "}"
+    if isinstance(x, dict):
+        return "{" + ",".join(sorted(f"{_stable(k, _seen)}:{_stable(v, _seen)}" for k, v in x.items())) + "}"
+    if hasattr(x, "pattern") and hasattr(x, "flags"):
+        return f"re({x.pattern!r},{int(x.flags)})"
+    return repr(x)
+
+
+def legacy_hash(rule) -> str:
+    """
+    (regex, action) 规则的哈希：regex 文本 + flags + action 的字节码、常量（含嵌套 lambda）、
+    引用的名字、默认参数与闭包内容；不含文件名与行号，仓库挪位置或上方加行不会变
+    """
+    rx, fn = rule
+    pat, flags = (rx, 0) if isinstance(rx, str) else (rx.pattern, int(getattr(rx, "flags", 0)))
+    return hashlib.sha1(f"{pat}\x00{flags}\x00{_stable(fn)}".encode("utf-8")).hexdigest()[:16]
@@ -0,0 +1,450 @@
+"""
+抽取规则的单遍扫描器：一个 topic 的全部 (regex, action) 编译成一个 RuleScanner。
+
+做法：解析每条规则 regex 的“首字符集合”，把所有规则的首字符并成一个字符类，
+对题目文本只扫一遍得到候选起点；每个起点只尝试首字符对得上的规则（rx.match）。
+首字符无法确定（开头是 . / [^…] / 可选前缀等）或可能匹配空串的规则，仍逐条匹配；
+其中“可选字面量前缀 + [^S]*? / .*”开头的，起点失败后直接跳到下一个 S 字符（见 segment_stops），不再逐位重试。
+剩余开销仍与规则数有关：每个候选起点对首字符相同的每条规则各做一次 rx.match。
+每条规则的命中与单独 finditer 完全相同（最左、不重叠），动作按“规则顺序 → 命中顺序”回调，
+与逐条 finditer 的旧流程语义一致。
+SpanQuery 规则（core.spans）不走 regex：直接查题目的数值跨度表，命中顺序同样按出现顺序。
+每条规则另带“必需字面量”集合（注册时推导或手工指定）：扫描前用关键词自动机查一遍字面量，
+一个都没出现的规则直接跳过，并按规则累计跳过次数。
+"""
+import re
+from core.spans import SpanQuery, SpanTable
+
+try:
+    from re import _parser as _sre_parse, _constants as _sre_c
+    from re._casefix import _EXTRA_CASES
+except ImportError:  # Python < 3.11
+    import sre_parse as _sre_parse, sre_constants as _sre_c
+    _EXTRA_CASES = {}
+
+STR_RULE_FLAGS = re.I | re.S  # 规则写成字符串时的编译选项（与旧的 re.finditer(rx, text, flags=…) 一致）
+_RANGE_MAX = 64                # 字符区间超过这么宽就不展开，按“任意首字符”处理
+
+
+class _Any(Exception):
+    """首字符集合无法确定"""
+
+
+def _first_chars(items, chars):
+    """
+    items 的可能首字符并入 chars（\\d 记作特殊键 "\\d"）；返回 items 能否匹配空串。
+    零宽断言（^、$、前后瞻）当作可空跳过——只会让候选集变大，不会漏。
+    """
+    for op, av in items:
+        if op is _sre_c.LITERAL:
+            chars.add(chr(av)); return False
+        if op is _sre_c.IN:
+            for iop, iav in av:
+                if iop is _sre_c.LITERAL:
+                    chars.add(chr(iav))
+                elif iop is _sre_c.RANGE and iav[1] - iav[0] <= _RANGE_MAX:
+                    chars.update(chr(c) for c in range(iav[0], iav[1] + 1))
+                elif iop is _sre_c.CATEGORY and iav is _sre_c.CATEGORY_DIGIT:
+                    chars.add("\\d")
+                else:
+                    raise _Any
+            return False
+        if op is _sre_c.BRANCH:
+            nullable = False
+            for alt in av[1]:
+                nullable |= _first_chars(alt, chars)
+            if not nullable: return False
+        elif op is _sre_c.SUBPATTERN:
+            _, add_flags, del_flags, sub = av
+            if add_flags or del_flags: raise _Any
+            if not _first_chars(sub, chars): return False
+        elif op in (_sre_c.MAX_REPEAT, _sre_c.MIN_REPEAT):
+            lo, _, sub = av
+            if not _first_chars(sub, chars) and lo > 0: return False
+        elif op in (_sre_c.AT, _sre_c.ASSERT, _sre_c.ASSERT_NOT):
+            continue
+        else:
+            raise _Any
+    return True
+
+
+def first_char_set(rx: re.Pattern):
+    """规则的首字符集合（忽略大小写时含大小写两种）；无法确定或可匹配空串时返回 None"""
+    try:
+        chars = set()
+        if _first_chars(_sre_parse.parse(rx.pattern, rx.flags), chars):
+            return None
+    except _Any:
+        return None
+    if rx.flags & re.I:
+        chars = {f for c in chars for f in (_case_variants(c) if len(c) == 1 else (c,))}
+    return chars
+
+
+_LOWER_INV = None
+
+def _case_variants(c: str) -> set:
+    """忽略大小写时能与 c 匹配的全部字符（同 sre：小写相同，或在 _EXTRA_CASES 里）"""
+    global _LOWER_INV
+    low = c.lower()
+    if low == c.upper() and len(low) == 1 and ord(low) not in _EXTRA_CASES:
+        return {c}
+    if _LOWER_INV is None:
+        _LOWER_INV = {}
+        for x in range(0x10000):
+            ch = chr(x)
+            if ch.lower() != ch:
+                _LOWER_INV.setdefault(ch.lower(), set()).add(ch)
+    out = {c, low, c.upper()} | _LOWER_INV.get(low, set())
+    if len(low) == 1:
+        out |= {chr(x) for x in _EXTRA_CASES.get(ord(low), ())}
+    return {x for x in out if len(x) == 1}
+
+
+def _char_class(chars) -> str:
+    parts = sorted(re.escape(c) if c != "\\d" else c for c in chars)
+    return "[" + "".join(parts) + "]"
+
+
+def _lit_chars(items):
+    """items 只由字面量 / 字面量分支 / 字面量字符集 / 非捕获组 / 它们的重复组成时，返回可能用到的全部字符，否则 None"""
+    chars = set()
+    for op, av in items:
+        if op is _sre_c.LITERAL:
+            chars.add(chr(av))
+        elif op is _sre_c.IN and all(iop is _sre_c.LITERAL for iop, _ in av):
+            chars.update(chr(iav) for _, iav in av)
+        elif op is _sre_c.BRANCH:
+            for alt in av[1]:
+                sub = _lit_chars(alt)
+                if sub is None: return None
+                chars |= sub
+        elif op is _sre_c.SUBPATTERN and av[0] is None and not (av[1] or av[2]):
+            sub = _lit_chars(av[3])
+            if sub is None: return None
+            chars |= sub
+        elif op in (_sre_c.MAX_REPEAT, _sre_c.MIN_REPEAT):
+            sub = _lit_chars(av[2])
+            if sub is None: return None
+            chars |= sub
+        else:
+            return None
+    return chars
+
+
+def segment_stops(rx: re.Pattern):
+    """
+    形如 “可选字面量前缀 + [^S]*?（或 .*）+ 其余” 的规则：从 p 起匹配失败，则到下一个 S 字符之前的任何起点都失败
+    （后面起点能走通的路，从 p 起让 [^S]* 多吞几个字符同样走通）。返回 S（frozenset，可为空 = 整段文本），
+    不是这种形状、前缀字符与 S 相交、可匹配空串时返回 None。
+    """
+    try:
+        items = _sre_parse.parse(rx.pattern, rx.flags)
+        if items.getwidth()[0] == 0:
+            return None
+    except Exception:
+        return None
+    fold = (lambda cs: {v for c in cs for v in _case_variants(c)}) if rx.flags & re.I else set
+    prefix = set()
+    for op, av in items:
+        if op not in (_sre_c.MAX_REPEAT, _sre_c.MIN_REPEAT) or av[0] != 0:
+            return None
+        sub = av[2]
+        if av[1] is _sre_c.MAXREPEAT and len(sub) == 1:
+            sop, sav = sub[0]
+            stops = None
+            if sop is _sre_c.ANY:
+                stops = set() if rx.flags & re.S else {"\n"}
+            elif (sop is _sre_c.IN and sav and sav[0][0] is _sre_c.NEGATE
+                  and all(iop is _sre_c.LITERAL for iop, _ in sav[1:])):
+                stops = {chr(iav) for _, iav in sav[1:]}
+            if stops is not None:
+                stops = fold(stops)
+                return None if fold(prefix) & stops else frozenset(stops)
+        chars = _lit_chars(sub)
+        if chars is None:
+            return None
+        prefix |= chars
+    return None
+
+
+def _segment_finditer(rx, stops, text):
+    """同 rx.finditer(text)（rx 无空匹配）：起点匹配失败就跳到下一个 S 字符，不再逐位重试"""
+    p, n = 0, len(text)
+    while p < n:
+        m = rx.match(text, p)
+        if m:
+            yield m
+            p = m.end()
+        elif stops is None:
+            return
+        elif stops.match(text, p):
+            p += 1
+        else:
+            s = stops.search(text, p + 1)
+            if s is None:
+                return
+            p = s.start()
+
+
+class RuleScanner:
+    """一个 topic 的全部抽取规则；scan(text) 按规则顺序产出 (action, match)"""
+
+    def __init__(self, rules, literals=None):
+        """literals：与 rules 一一对应的必需字面量（None 表示不能据此跳过）；不给则逐条自动推导"""
+        self.rules = []       # [(编译后的 regex, action)]，与注册顺序一致
+        self.literals = []    # 每条规则的必需字面量
+        self.fallback = []    # 只能走 finditer 的规则序号
+        by_char = {}          # 首字符 -> [规则序号]
+        self._segments = {}   # 可分段跳过的 fallback 规则：序号 -> S 字符类（None = 整段文本）
+        self._span = []       # SpanQuery 规则序号：查跨度表
+        for k, (rx, fn) in enumerate(rules):
+            if rx == "__AUTO__":
+                continue
+            if isinstance(rx, str):
+                rx = re.compile(rx, STR_RULE_FLAGS)
+            i = len(self.rules)
+            self.rules.append((rx, fn))
+            self.literals.append(required_literals(rx) if literals is None else literals[k])
+            if isinstance(rx, SpanQuery):
+                self._span.append(i)
+                continue
+            chars = first_char_set(rx)
+            if chars is None:
+                self.fallback.append(i)
+                stops = segment_stops(rx)
+                if stops is not None:
+                    self._segments[i] = re.compile(_char_class(stops)) if stops else None
+                continue
+            for c in chars:
+                by_char.setdefault(c, []).append(i)
+        self._by_char = by_char
+        self._digit = by_char.pop("\\d", [])
+        heads = set(by_char)
+        trigger = (_char_class(heads) if heads else "") + ("|\\d" if self._digit else "")
+        self._trigger = re.compile(trigger.lstrip("|")) if trigger else None
+        self._headed = sorted({i for ids in by_char.values() for i in ids} | set(self._digit))
+        self.gate = LiteralGate(self.literals)
+        self.scans = 0                          # matches() 调用次数
+        self.skipped = [0] * len(self.rules)    # 每条规则因字面量缺席被跳过的次数
+
+    def __len__(self):
+        return len(self.rules)
+
+    def _candidates(self, ch):
+        ids = self._by_char.get(ch, ())
+        if self._digit and ch.isdecimal():
+            ids = [*ids, *self._digit]
+        return ids
+
+    def live(self, text: str) -> list:
+        """每条规则在 text 上还有没有可能命中（字面量只查一遍）；顺带累计跳过次数"""
+        found = self.gate.found(text)
+        live = [self.gate.may_fire(i, found) for i in range(len(self.rules))]
+        self.scans += 1
+        for i, ok in enumerate(live):
+            if not ok:
+                self.skipped[i] += 1
+        return live
+
+    def matches(self, text: str, spans=None):
+        """
+        每条规则的命中列表（与各自 rx.finditer(text) 相同；必需字面量缺席的规则直接给空）。
+        spans：text 的 SpanTable，SpanQuery 规则查它；不给则在这里建一张，所有 SpanQuery 规则共用
+        """
+        live = self.live(text)
+        if spans is None and any(live[i] for i in self._span):
+            spans = SpanTable(text)
+        hits = [[] for _ in self.rules]
+        for i in self._span:
+            if live[i]:
+                hits[i] = list(self.rules[i][0].finditer(text, spans))
+        for i in self.fallback:
+            if not live[i]:
+                continue
+            rx = self.rules[i][0]
+            if i in self._segments:
+                hits[i] = list(_segment_finditer(rx, self._segments[i], text))
+            else:
+                hits[i] = list(rx.finditer(text))
+        if self._trigger is not None and any(live[i] for i in self._headed):
+            nxt = [0] * len(self.rules)  # 每条规则下一个允许的起点（不重叠）
+            for t in self._trigger.finditer(text):
+                p = t.start()
+                for i in self._candidates(t.group()):
+                    if p < nxt[i] or not live[i]:
+                        continue
+                    m = self.rules[i][0].match(text, p)
+                    if m:
+                        hits[i].append(m)
+                        nxt[i] = m.end()
+        return hits
+
+    def scan(self, text: str, spans=None):
+        """按 规则顺序 → 命中顺序 产出 (action, match)；一遍匹配完再回调，动作之间互不影响匹配"""
+        for (_, fn), ms in zip(self.rules, self.matches(text, spans)):
+            for m in ms:
+                yield fn, m
+
+
+# ---------------- 必需字面量 + 关键词自动机 ----------------
+_LIT_ALTS_MAX = 32  # 字面量展开（分支 × 字符集）最多保留这么多种写法
+
+
+def _literal_alts(items):
+    """items 若只由字面量/字面量分支/字面量字符集组成，返回它能匹配的全部字符串，否则 None"""
+    alts = {""}
+    for op, av in items:
+        if op is _sre_c.LITERAL:
+            nxt = {chr(av)}
+        elif op is _sre_c.IN and all(iop is _sre_c.LITERAL for iop, _ in av):
+            nxt = {chr(iav) for _, iav in av}
+        elif op is _sre_c.BRANCH:
+            nxt = set()
+            for alt in av[1]:
+                sub = _literal_alts(alt)
+                if sub is None: return None
+                nxt |= sub
+        elif op is _sre_c.SUBPATTERN and not (av[1] or av[2]):
+            nxt = _literal_alts(av[3])
+            if nxt is None: return None
+        else:
+            return None
+        alts = {a + b for a in alts for b in nxt}
+        if len(alts) > _LIT_ALTS_MAX: return None
+    return alts
+
+
+def _better(a, b):
+    """两组“至少出现其一”的字面量里挑更有区分度的：最短的那个越长越好，其次写法越少越好"""
+    if a is None: return b
+    if b is None: return a
+    ka, kb = (min(map(len, a)), -len(a)), (min(map(len, b)), -len(b))
+    return a if ka >= kb else b
+
+
+def _required(items):
+    """
+    每个匹配都至少包含其中之一的字面量集合；推不出来返回 None。
+    顺序串里：连续的纯字面量段展开成写法集合，其余项各自递归，最后挑区分度最高的一组。
+    """
+    best, run = None, {""}
+
+    def flush(run):
+        return run if run != {""} and all(run) else None
+
+    for op, av in items:
+        if op in (_sre_c.LITERAL, _sre_c.IN, _sre_c.BRANCH, _sre_c.SUBPATTERN):
+            alts = _literal_alts([(op, av)])
+            if alts is not None:
+                joined = {a + b for a in run for b in alts}
+                if len(joined) <= _LIT_ALTS_MAX:
+                    run = joined
+                    continue
+        best = _better(best, flush(run))
+        run = {""}
+        if op is _sre_c.BRANCH:
+            subs = [_required(alt) for alt in av[1]]
+            sub = None if any(s is None for s in subs) else set().union(*subs)
+        elif op is _sre_c.SUBPATTERN and not (av[1] or av[2]):
+            sub = _required(av[3])
+        elif op in (_sre_c.MAX_REPEAT, _sre_c.MIN_REPEAT) and av[0] > 0:
+            sub = _required(av[2])
+        else:
+            sub = None
+        best = _better(best, sub)
+    return _better(best, flush(run))
+
+
+def required_literals(rx: re.Pattern):
+    """regex 的任一匹配都必含其一的字面量（frozenset）；推不出时返回 None，表示无法据此跳过"""
+    if isinstance(rx, SpanQuery):
+        return rx.literals()
+    try:
+        req = _required(_sre_parse.parse(rx.pattern, rx.flags))
+    except Exception:
+        return None
+    return frozenset(req) if req else None
+
+
+class KeywordAutomaton:
+    """
+    Aho–Corasick 关键词自动机：一遍扫描文本，返回出现过的关键词位集（第 i 个词 ↔ 1 << i）。
+    忽略大小写：词里出现的字母连同其大小写变体都映射到同一个转移字符上。
+    """
+
+    def __init__(self, words, *, ignorecase=True):
+        self.words = list(words)
+        self._canon = {}
+        if ignorecase:
+            for w in self.words:
+                for c in w:
+                    for v in _case_variants(c):
+                        self._canon[v] = c.lower()
+        goto, out = [{}], [0]
+        for i, w in enumerate(self.words):
+            s = 0
+            for c in w:
+                c = self._canon.get(c, c)
+                if c not in goto[s]:
+                    goto[s][c] = len(goto); goto.append({}); out.append(0)
+                s = goto[s][c]
+            out[s] |= 1 << i
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        while queue:
+            s = queue.pop(0)
+            for c, t in goto[s].items():
+                f = fail[s]
+                while f and c not in goto[f]:
+                    f = fail[f]
+                fail[t] = goto[f][c] if c in goto[f] and goto[f][c] != t else 0
+                out[t] |= out[fail[t]]
+                queue.append(t)
+        self._goto, self._fail, self._out = goto, fail, out
+
+    def scan(self, text: str) -> int:
+        goto, fail, out, canon = self._goto, self._fail, self._out, self._canon
+        s, found = 0, 0
+        for c in text:
+            c = canon.get(c, c)
+            while s and c not in goto[s]:
+                s = fail[s]
+            s = goto[s].get(c, 0)
+            found |= out[s]
+        return found
+
+
+class LiteralGate:
+    """给一组规则各自的必需字面量建一个自动机；found(text) 一遍扫出位集，may_fire(i, found) 判断规则 i 还有没有可能命中"""
+
+    def __init__(self, literal_sets):
+        words = sorted({w for ls in literal_sets if ls for w in ls})
+        bit = {w: 1 << i for i, w in enumerate(words)}
+        # None -> 无法判断，总要跑
+        self.masks = [None if not ls else sum(bit[w] for w in ls) for ls in literal_sets]
+        self.automaton = KeywordAutomaton(words)
+
+    def found(self, text: str) -> int:
+        return self.automaton.scan(text)
+
+    def may_fire(self, i: int, found: int) -> bool:
+        mask = self.masks[i]
+        return mask is None or bool(mask & found)
+
+
+class RouteScanner:
+    """Phase-1 路由规则：先用关键词自动机扫一遍，只对必需字面量出现了的规则跑完整 regex"""
+
+    def __init__(self, rules):
+        self.rules = [(re.compile(rx, STR_RULE_FLAGS) if isinstance(rx, str) else rx, fn) for rx, fn in rules]
+        self.literals = [required_literals(rx) for rx, _ in self.rules]
+        self.gate = LiteralGate(self.literals)
+
+    def scan(self, text: str):
+        """按注册顺序产出 (action, match)，与逐条 finditer 相同，只是跳过不可能命中的规则"""
+        found = self.gate.found(text)
+        for i, (rx, fn) in enumerate(self.rules):
+            if self.gate.may_fire(i, found):
+                for m in rx.finditer(text):
+                    yield fn, m
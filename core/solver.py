@@ -1,4 +1,8 @@
-from sympy import symbols, Eq, sympify, solve, floor, N, nsimplify
+import math, re
+from fractions import Fraction
+import numpy as np
+from sympy import solve, nsimplify, lambdify, Rational, Float
+import core.registry as R
 
 def normalize_units(value, unit):
     if unit in ("km","公里","千米"):  return value * 1000, "m"
@@ -10,61 +14,73 @@ def normalize_units(value, unit):
     if unit in ("s","秒"):            return value, "s"
     return value, unit
 
-def solve_equation(tpl, mapping, G):
+def _instantiate_text(tpl, given_by_id):
+    """不经 SymPy，直接把已知值写进公式文本（仅用于调试输出）"""
+    def sub(m):
+        name = m.group(0)
+        return str(given_by_id[name]) if name in given_by_id else name
+    return [re.sub(r"[A-Za-z_]\w*", sub, f) for f in tpl.get("formula", [])]
+
+def _eval_solved_form(form, given_by_id):
     """
-    tpl      : 子图模板 dict（不含任何 'cast' 字段）
-    mapping  : networkx 返回的模板节点 ➜ 题目节点 映射
-    G        : 构建好的题目图
+    代入预编译的闭式解；约束不成立 / 除零 / 非有限值时返回 None（回退 SymPy）。
+    结果类型与 SymPy 路径一致：已知量全是整数时用 Fraction 精确计算，得到 Rational / Integer
+    （算出无理数等非有理结果时回退 SymPy，保留精确形式）；有浮点已知量时得到 sympy Float。
     """
-    # ---------- 0. 映射方向标准化 ----------
+    try:
+        args = [given_by_id[g] for g in form["given"]]
+        exact = all(isinstance(a, int) and not isinstance(a, bool) for a in args)
+        if exact:
+            args = [Fraction(a) for a in args]
+        if form["check"] is not None:
+            for lhs, rhs in form["check"](*args):
+                if not math.isclose(lhs, rhs, rel_tol=1e-9, abs_tol=1e-12):
+                    return None
+        vals = form["fn"](*args)
+    except (KeyError, ZeroDivisionError, ValueError, OverflowError, TypeError):
+        return None
+
+    out = {}
+    for name, v in zip(form["unknowns"], vals):
+        if exact:
+            if not isinstance(v, (int, Fraction)) or isinstance(v, bool):
+                return None
+            out[name] = Rational(v.numerator, v.denominator)
+        else:
+            try:
+                v = float(v)
+            except (TypeError, ValueError):
+                return None
+            if not math.isfinite(v):
+                return None
+            out[name] = Float(v)
+    return out
+
+COUNT_TYPES = {"TreeCnt", "SegmentCnt", "Diff"}
+
+def _orient_mapping(tpl, mapping):
+    """映射方向标准化：统一成 模板节点 id ➜ 题目节点 id"""
     tpl_ids = {n["id"] for n in tpl["nodes"]}
     if not (set(mapping.keys()) & tpl_ids):
         mapping = {tpl_id: prob_id for prob_id, tpl_id in mapping.items()}
+    return mapping
 
-    # ---------- 1. 建符号表 ----------
-    symtab = {n["id"]: symbols(n["id"]) for n in tpl["nodes"]}
+def _coerce_num(val):
+    # 20.0 -> 20；其他浮点保留
+    if isinstance(val, float) and float(val).is_integer():
+        return int(val)
+    return val
 
-    # 补一个：模板节点 id -> 节点类型（用于结果后处理判断是否为计数类）
-    node_type_map = {n["id"]: n["type"] for n in tpl["nodes"]}
-
-    # ---------- 2. 收集已知值（整值浮点 -> 整数；避免把 Float 传播到方程里） ----------
-    def _coerce_num(val):
-        # 20.0 -> 20；其他浮点保留
-        if isinstance(val, float) and float(val).is_integer():
-            return int(val)
-        return val
-
-    given = {
-        symtab[tpl_id]: _coerce_num(G.nodes[prob_id]["value"])
+def _split_known(tpl, mapping, G, symtab):
+    """收集已知值 {tpl_id: 值} 与未知量 id 集合（题目图里值为 None 的映射点都算未知）"""
+    given_by_id = {
+        tpl_id: _coerce_num(G.nodes[prob_id]["value"])
         for tpl_id, prob_id in mapping.items()
         if G.nodes[prob_id].get("value") is not None and tpl_id in symtab
     }
 
-    # ---------- 3. 转换公式为 sympy 方程 ----------
-    eqs = [
-        Eq(*[sympify(side.strip(), locals=symtab) for side in f.split("=")])
-        for f in tpl["formula"]
-    ]
-
-    # ---------- 4. 解未知 ----------
-    # unknown_syms = [symtab[uid] for uid in tpl["unknowns"]]
-    # solved = solve([e.subs(given) for e in eqs], unknown_syms, dict=True)
-
-
-    
-    # === 新增：先把 givens 代入并打印便于调试 ===
-    eqs_sub = [e.subs(given) for e in eqs]
-    G.graph["__instantiated_eqs__"] = [str(e) for e in eqs_sub]
-    
-    print("【代入后方程】", " ; ".join(str(e) for e in eqs_sub))
-
-    # unknown_syms = [symtab[uid] for uid in tpl["unknowns"]]
-    # # 原先：solved = solve([e.subs(given) for e in eqs], unknown_syms, dict=True)
-    # solved = solve(eqs_sub, unknown_syms, dict=True)    
-    # === A. 自动识别未知量（忽略/越过模板里的 unknowns） ===
-    unknown_ids = set()
-
     # 1) 题目图中“值为 None”的映射点，一律视为未知量
+    unknown_ids = set()
     for tpl_id, prob_id in mapping.items():
         if prob_id in G.nodes and G.nodes[prob_id].get("value") is None:
             unknown_ids.add(tpl_id)
@@ -74,26 +90,60 @@ def solve_equation(tpl, mapping, G):
         pid = mapping.get(uid)
         if pid and G.nodes.get(pid, {}).get("value") is None:
             unknown_ids.add(uid)
+    return given_by_id, unknown_ids
+
+def solve_equation(tpl, mapping, G):
+    """
+    tpl      : 子图模板 dict（不含任何 'cast' 字段）
+    mapping  : networkx 返回的模板节点 ➜ 题目节点 映射
+    G        : 构建好的题目图
+    """
+    # ---------- 0. 映射方向标准化 ----------
+    mapping = _orient_mapping(tpl, mapping)
 
-    unknown_syms = [symtab[u] for u in unknown_ids]
+    # ---------- 1. 建符号表（registry 加载时已预编译） ----------
+    plan = R.compile_template(tpl)
+    symtab = plan.symtab
 
-    # === B. 求解（若 unknown_syms 为空先尝试直接解自由符号） ===
+    # ---------- 2. 收集已知值 + 自动识别未知量（忽略/越过模板里的 unknowns） ----------
+    given_by_id, unknown_ids = _split_known(tpl, mapping, G, symtab)
+    given = {symtab[tpl_id]: v for tpl_id, v in given_by_id.items()}
+
+    # ---------- 3. 快路径：预编译闭式解直接代值 ----------
     solved = []
-    if unknown_syms:
-        solved = solve(eqs_sub, unknown_syms, dict=True)
-
-    # 兜底 1：若还没解出来，且是单方程，尝试对“仍在方程里的符号”逐个求
-    if not solved and len(eqs_sub) == 1:
-        # 优先对题目里确实未知的符号求解；若没有，再对所有自由符号尝试
-        cand_syms = [symtab[u] for u in unknown_ids] or list(eqs_sub[0].free_symbols)
-        for u in cand_syms:
-            try:
-                v = solve(eqs_sub[0], u)
-                if v:
-                    solved = [{u: v[0]}]
-                    break
-            except Exception:
-                pass
+    form = R.solved_form(tpl, unknown_ids, given_by_id) if unknown_ids else None
+    fast = _eval_solved_form(form, given_by_id) if form else None
+    if fast is not None:
+        G.graph["__instantiated_eqs__"] = _instantiate_text(tpl, given_by_id)
+        print("【代入后方程】", " ; ".join(G.graph["__instantiated_eqs__"]))
+        solved = [fast]
+
+    # ---------- 4. 回退：SymPy 代入 + 求解 ----------
+    if not solved:
+        # === 新增：先把 givens 代入并打印便于调试 ===
+        eqs_sub = [e.subs(given) for e in plan.eqs]
+        G.graph["__instantiated_eqs__"] = [str(e) for e in eqs_sub]
+
+        print("【代入后方程】", " ; ".join(str(e) for e in eqs_sub))
+
+        unknown_syms = [symtab[u] for u in unknown_ids]
+
+        # === B. 求解（若 unknown_syms 为空先尝试直接解自由符号） ===
+        if unknown_syms:
+            solved = solve(eqs_sub, unknown_syms, dict=True)
+
+        # 兜底 1：若还没解出来，且是单方程，尝试对“仍在方程里的符号”逐个求
+        if not solved and len(eqs_sub) == 1:
+            # 优先对题目里确实未知的符号求解；若没有，再对所有自由符号尝试
+            cand_syms = [symtab[u] for u in unknown_ids] or list(eqs_sub[0].free_symbols)
+            for u in cand_syms:
+                try:
+                    v = solve(eqs_sub[0], u)
+                    if v:
+                        solved = [{u: v[0]}]
+                        break
+                except Exception:
+                    pass
 
     print(f"求解结果：{solved}")
 
@@ -124,7 +174,9 @@ def solve_equation(tpl, mapping, G):
         try:
             prob_id = mapping.get(tpl_id)
             ntype = G.nodes.get(prob_id, {}).get("type")
-            if ntype in {"TreeCnt", "SegmentCnt", "Diff"}:
+            if ntype in COUNT_TYPES:
+                if isinstance(val, (int, float)):
+                    return int(round(val))
                 try:
                     v_simpl = nsimplify(val)
                     return int(round(float(v_simpl)))
@@ -142,4 +194,76 @@ def solve_equation(tpl, mapping, G):
         tpl_id = str(sym_k)  # sympy.Symbol -> its name，如 'Z'
         post[tpl_id] = _intify_if_count(tpl_id, v)
 
-    return post
\ No newline at end of file
+    return post
+
+# ---------- 批量求解：按 (模板, 未知量划分) 分组，NumPy 整列代值 ----------
+def _vectorized(form):
+    """预编译闭式解的 NumPy 版本（首次用到时生成，缓存在 form 上）"""
+    if "vfn" not in form:
+        form["vfn"] = lambdify(form["args"], form["exprs"], modules="numpy")
+        form["vcheck"] = (lambdify(form["args"], [(e.lhs, e.rhs) for e in form["constraints"]], modules="numpy")
+                          if form["constraints"] else None)
+    return form["vfn"], form["vcheck"]
+
+def solve_batch(items):
+    """
+    items : [(tpl, mapping, G), …]，即 matcher 对一批题目的输出 + 各自的题目图
+    返回  : 与 items 对齐的 [solved dict, …]，数值与逐题调用 solve_equation 一致
+            （整列按 float 求值：非计数类结果是 float / 整数，不是 solve_equation 的精确 Rational）
+
+    同一模板、同一 (未知量, 已知量) 划分的题目归为一组，已知值按列拼成 NumPy 数组，
+    闭式解对整列一次求值；计数类（TreeCnt/SegmentCnt/Diff）整列四舍五入取整。
+    没有闭式解的组、以及约束不成立 / 除零 / 非有限值的行，逐题回退 solve_equation；
+    回退时抛异常的题目结果记为 None（同 run_main.extract_and_solve 的处理），不影响同批其它题。
+    批量路径不打印代入过程，也不写 G.graph["__instantiated_eqs__"]。
+    """
+    def _fallback(i):
+        try:
+            return solve_equation(*items[i])
+        except Exception:
+            return None
+
+    results = [None] * len(items)
+    groups = {}
+    for i, (tpl, mapping, G) in enumerate(items):
+        mapping = _orient_mapping(tpl, mapping)
+        given_by_id, unknown_ids = _split_known(tpl, mapping, G, R.compile_template(tpl).symtab)
+        key = (R.template_key(tpl), frozenset(unknown_ids), frozenset(given_by_id))
+        groups.setdefault(key, []).append((i, mapping, given_by_id))
+
+    for (_, unknown_ids, given_ids), rows in groups.items():
+        tpl = items[rows[0][0]][0]
+        form = R.solved_form(tpl, unknown_ids, given_ids) if unknown_ids else None
+        if form is None:
+            for i, _, _ in rows:
+                results[i] = _fallback(i)
+            continue
+
+        vfn, vcheck = _vectorized(form)
+        n = len(rows)
+        cols = [np.array([given[g] for _, _, given in rows], dtype=float) for g in form["given"]]
+        with np.errstate(all="ignore"):
+            ok = np.ones(n, dtype=bool)
+            if vcheck is not None:
+                for lhs, rhs in vcheck(*cols):
+                    ok &= np.isclose(np.broadcast_to(lhs, (n,)), np.broadcast_to(rhs, (n,)), rtol=1e-9, atol=1e-12)
+            vals = [np.broadcast_to(np.asarray(v, dtype=float), (n,)) for v in vfn(*cols)]
+        for v in vals:
+            ok &= np.isfinite(v)
+
+        # 计数类整数化（向量化版 _intify_if_count）：按映射到的题目节点类型逐列判定
+        for k, name in enumerate(form["unknowns"]):
+            is_count = np.array([
+                items[i][2].nodes.get(mapping.get(name), {}).get("type") in COUNT_TYPES
+                for i, mapping, _ in rows
+            ])
+            if is_count.any():
+                vals[k] = np.where(is_count & ok, np.round(np.where(ok, vals[k], 0)), vals[k])
+
+        for r, (i, _, _) in enumerate(rows):
+            if not ok[r]:
+                results[i] = _fallback(i)
+                continue
+            results[i] = {name: _coerce_num(float(vals[k][r])) for k, name in enumerate(form["unknowns"])}
+
+    return results
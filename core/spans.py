@@ -0,0 +1,127 @@
+"""
+题目文本的数值跨度表：preprocess 时把文本里的每个数连同单位、偏移、左右上下文切出来一次，
+各候选的抽取阶段共用同一张表；规则按“数 + 单位 + 前后关键词”查表，不必再对全文重扫。
+
+“关键词 + 数 + 单位”这类抽取规则直接写成 SpanQuery 注册（register_rule 的 regex 位置放 SpanQuery）：
+它对外像一个编译好的 regex（pattern / search / finditer），命中就是跨度表里那个数的 re.Match，
+组号固定：1 = 数字，2 = 单位，3 = 复合单位的分母（均为原文）。单位按集合精确比较，'m' 不会吃掉 'min' / 'mm'。
+"""
+import re
+from collections import namedtuple
+
+# text / value：数字原文与数值；unit：紧跟的单位（小写，无则 None）；per：复合单位的分母（如 米/秒 的 秒）
+# start / end：数字本身的偏移；left / right：数字之前、单位之后各 CONTEXT 个字符
+NumSpan = namedtuple("NumSpan", "text value unit per start end left right")
+
+CONTEXT = 8
+_UNITS = (r"千米|公里|厘米|毫米|km|cm|mm|min|米|m|小时|分钟|秒|h|s|"
+          r"棵|面|盏|根|盆|个|辆|只|位|人|列|段|天|岁|元")
+_PER = r"小时|分钟|秒|h|min|s"
+_NUM_RX = re.compile(r"(\d+(?:\.\d+)?)\s*(?:(" + _UNITS + r")(?:\s*/\s*(" + _PER + r"))?)?", re.I)
+
+
+def _value(s: str):
+    v = float(s)
+    return int(v) if v.is_integer() else v
+
+
+class SpanTable:
+    """一道题的全部数值跨度（按出现顺序）；query / first 按单位与前后关键词筛选"""
+    __slots__ = ("text", "spans", "_matches")
+
+    def __init__(self, text: str):
+        self.text = text
+        spans = []
+        self._matches = tuple(_NUM_RX.finditer(text))  # 与 spans 一一对应，SpanQuery 命中时原样交给 action
+        for m in self._matches:
+            unit, per = m.group(2), m.group(3)
+            spans.append(NumSpan(
+                m.group(1), _value(m.group(1)),
+                unit.lower() if unit else None, per.lower() if per else None,
+                m.start(1), m.end(1),
+                text[max(0, m.start() - CONTEXT):m.start()], text[m.end():m.end() + CONTEXT]))
+        self.spans = tuple(spans)
+
+    def __iter__(self): return iter(self.spans)
+    def __len__(self): return len(self.spans)
+    def __getitem__(self, i): return self.spans[i]
+    def __repr__(self): return f"SpanTable({[(s.text, s.unit) for s in self.spans]})"
+
+    def _preceded_by(self, sp: NumSpan, words) -> bool:
+        """数字前（跳过空白）紧挨着 words 之一"""
+        i = sp.start
+        while i and self.text[i - 1].isspace():
+            i -= 1
+        return any(self.text[max(0, i - len(w)):i].lower() == w.lower() for w in words)
+
+    def _followed_by(self, sp: NumSpan, words) -> bool:
+        """单位之后（跳过空白）紧接着 words 之一"""
+        rest = sp.right.lstrip().lower()
+        return any(rest.startswith(w.lower()) for w in words)
+
+    def _select(self, unit, before, after, per) -> list:
+        units, pers = _as_set(unit), _as_set(per)
+        before = (before,) if isinstance(before, str) else before
+        after = (after,) if isinstance(after, str) else after
+        return [i for i, sp in enumerate(self.spans)
+                if (units is None or sp.unit in units)
+                and (pers is None or sp.per in pers)
+                and (not before or self._preceded_by(sp, before))
+                and (not after or self._followed_by(sp, after))]
+
+    def query(self, unit=None, *, before=None, after=None, per=None) -> list:
+        """
+        unit / per：单位 / 分母单位（或集合，小写精确比较），None 不限；
+        before / after：数字前 / 单位后紧挨着的关键词（或集合）。
+        例：query("米", before=("每隔", "间隔")) ≈ r'(?:每隔|间隔)\\s*(\\d+(?:\\.\\d+)?)\\s*米'
+        """
+        return [self.spans[i] for i in self._select(unit, before, after, per)]
+
+    def first(self, unit=None, *, before=None, after=None, per=None):
+        hits = self.query(unit, before=before, after=after, per=per)
+        return hits[0] if hits else None
+
+    def matches(self, q) -> list:
+        """SpanQuery 在本表上的全部命中（re.Match，按出现顺序）"""
+        return [self._matches[i] for i in self._select(q.unit, q.before, q.after, q.per)]
+
+
+def _as_set(x):
+    return None if x is None else {x} if isinstance(x, str) else set(x)
+
+
+class SpanQuery(namedtuple("SpanQuery", "unit before after per", defaults=(None, None, None, None))):
+    """
+    按跨度表取数的抽取规则（字段同 SpanTable.query）。鸭子类型上当作编译好的 regex：
+    finditer(text, spans) 产出命中的 re.Match；只给 text 时现建一张表。
+    """
+    __slots__ = ()
+
+    @property
+    def pattern(self) -> str:
+        parts = [f"{k}={'|'.join(v) if isinstance(v, tuple) else v}"
+                 for k, v in zip(self._fields, self) if v is not None]
+        return "span(" + ", ".join(parts) + ")"
+
+    def finditer(self, text: str, spans: SpanTable = None):
+        tbl = spans if spans is not None and spans.text == text else SpanTable(text)
+        return iter(tbl.matches(self))
+
+    def search(self, text: str, spans: SpanTable = None):
+        return next(self.finditer(text, spans), None)
+
+    def literals(self):
+        """任一命中必含其一的字面量：有 before 取关键词，否则取单位；都没有返回 None（总要跑）"""
+        words = _as_set(self.before) or _as_set(self.unit)
+        return frozenset(words) if words else None
+
+
+def spans_of(G, text: str = None) -> SpanTable:
+    """
+    图上共享的跨度表（run_main.preprocess 建好后放在 G.graph["spans"]）；
+    没有时按 text（规则里传 m.string；不给则用 raw_text）现建一次并记在图上——run_demo 的图上两者都没有
+    """
+    tbl = G.graph.get("spans")
+    if tbl is None:
+        tbl = G.graph["spans"] = SpanTable(G.graph.get("raw_text", "") if text is None else text)
+    return tbl
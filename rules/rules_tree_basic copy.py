@@ -26,7 +26,7 @@ RULES = [
     # r(r'(?:每隔|间隔|相隔)\s*(\d+)\s*米', lambda m,g: (g.add_node(type="Interval", value=int(m[1])))), # 改成（若已存在 Interval1/2 就跳过）
     r(r'(?:每隔|间隔|相隔)\s*(\d+)\s*米',
     lambda m,g: (
-        None if any(d.get("type") in ("Interval1","Interval2") for _,d in g.G.nodes(data=True))
+        None if g.has_node(type="Interval1") or g.has_node(type="Interval2")
         else g.add_node(type="Interval", value=int(m[1]))
     )),
     
@@ -159,13 +159,13 @@ def _try_promote_to_multi_segment(g):
         return
 
     # 仅当真的是“原生多段”才升级：至少 2 个原生 Length 或 2 个原生 Interval
-    n_len = sum(1 for _,d in G.nodes(data=True) if d.get("type") == "Length")
-    n_int = sum(1 for _,d in G.nodes(data=True) if d.get("type") == "Interval")
+    n_len = len(g.nodes_of("Length"))
+    n_int = len(g.nodes_of("Interval"))
     if (n_len >= 2 or n_int >= 2) and mode in {"both_ends_quantity","both_ends_distance","one_end_quantity"}:
         G.graph["mode"] = "multi_segment"
         # 清理误连的 tree_relation
-        to_remove = [(u,v) for u,v,d in G.edges(data=True) if d.get("type")=="tree_relation"]
-        for u,v in to_remove: G.remove_edge(u,v)
+        for u,v in g.edges_of_type("tree_relation"):
+            while g.has_typed_edge(u, v, "tree_relation"): g.remove_edge(u, v, "tree_relation")
         print("[hook] 检测到多段，覆盖模式为 multi_segment，并移除误连 tree_relation")
 
 
@@ -174,31 +174,27 @@ def _patch_rectangle_closed(g):
     """矩形围场：Length/Width → Length1/Length2；补 L2–Interval 的 divides（模板已不要求 N1/N2）。"""
     G = g.G
     # 1) 重命名
-    lengths = [nid for nid, d in G.nodes(data=True) if d["type"] == "Length"]
-    widths  = [nid for nid, d in G.nodes(data=True) if d["type"] == "Width"]
+    lengths = list(g.nodes_of("Length"))
+    widths  = list(g.nodes_of("Width"))
 
     # 取一个 Length 作为 Length1
     if lengths:
-        G.nodes[lengths[0]]["type"] = "Length1"
+        g.retype(lengths[0], "Length1")
         # 若还有多余的 Length，用于 Length2（防止没有 Width 的文本）
-        if len(lengths) >= 2 and not any(d["type"] == "Length2" for _, d in G.nodes(data=True)):
-            G.nodes[lengths[1]]["type"] = "Length2"
+        if len(lengths) >= 2 and not g.nodes_of("Length2"):
+            g.retype(lengths[1], "Length2")
             print("[hook] rectangle_closed: Length → Length1, Length2 赋值")
     # 否则用 Width 作为 Length2
-    if not any(d["type"] == "Length2" for _, d in G.nodes(data=True)) and widths:
+    if not g.nodes_of("Length2") and widths:
         w = widths[0]
-        G.nodes[w]["type"] = "Length2"
+        g.retype(w, "Length2")
         print(f"[hook] rectangle_closed: Width → Length2 ({w})")
 
     # 2) 补 L2 – Interval divides
-    l2 = next((nid for nid, d in G.nodes(data=True) if d["type"] == "Length2"), None)
-    I  = next((nid for nid, d in G.nodes(data=True) if d["type"] == "Interval"), None)
+    l2 = next(iter(g.nodes_of("Length2")), None)
+    I  = next(iter(g.nodes_of("Interval")), None)
     if l2 and I:
-        has_div = any(
-            d.get("type") == "divides" and ((u == l2 and v == I) or (u == I and v == l2))
-            for u, v, d in G.edges(data=True)
-        )
-        if not has_div:
+        if not g.has_typed_edge(l2, I, "divides", undirected=True):
             g.add_edge(l2, I, type="divides", op=None)
             print("[hook] rectangle_closed: 添加 Length2 - Interval divides")
 
@@ -207,28 +203,24 @@ def _patch_multi_segment(g):
     """多段连接：Length/Interval 标号成 1/2；补成对 divides：L1–I1、L2–I2。"""
     G = g.G
     # 1) 标号
-    lens = [nid for nid, d in G.nodes(data=True) if d["type"] == "Length"]
-    ints = [nid for nid, d in G.nodes(data=True) if d["type"] == "Interval"]
+    lens = list(g.nodes_of("Length"))
+    ints = list(g.nodes_of("Interval"))
 
     for i, nid in enumerate(lens[:2]):
-        G.nodes[nid]["type"] = f"Length{i+1}"
+        g.retype(nid, f"Length{i+1}")
     for i, nid in enumerate(ints[:2]):
-        G.nodes[nid]["type"] = f"Interval{i+1}"
+        g.retype(nid, f"Interval{i+1}")
     print("[hook] multi_segment: Length/Interval 分段重命名完成")
 
     # 2) 成对 divides
     def last_of(t):
-        return next((nid for nid, d in G.nodes(data=True) if d["type"] == t), None)
+        return next(iter(g.nodes_of(t)), None)
 
     for k in (1, 2):
         Lk = last_of(f"Length{k}")
         Ik = last_of(f"Interval{k}")
         if Lk and Ik:
-            has_div = any(
-                d.get("type") == "divides" and ((u == Lk and v == Ik) or (u == Ik and v == Lk))
-                for u, v, d in G.edges(data=True)
-            )
-            if not has_div:
+            if not g.has_typed_edge(Lk, Ik, "divides", undirected=True):
                 g.add_edge(Lk, Ik, type="divides", op=None)
                 print(f"[hook] multi_segment: 添加 divides (Length{k}, Interval{k})")
 
@@ -236,30 +228,29 @@ def _patch_both_ends_compare(g):
     G = g.G
 
     # A) 清理裸 Interval（避免被其它模板误匹配）
-    rm = [nid for nid,d in G.nodes(data=True) if d.get("type") == "Interval"]
+    rm = list(g.nodes_of("Interval"))
     for nid in rm:
-        G.remove_node(nid)
+        g.remove_node(nid)
 
     # B) 对 Interval1/2 去重（同 value 合并）
     def _dedup(tname):
         seen = {}
         to_remove = []
-        for nid,d in list(G.nodes(data=True)):
-            if d.get("type") != tname: continue
-            k = (tname, d.get("value"))
+        for nid in list(g.nodes_of(tname)):
+            k = (tname, G.nodes[nid].get("value"))
             if k in seen:
                 keep = seen[k]
                 # 合并边
                 for u,v,data in list(G.edges(nid, data=True)):
                     other = v if u == nid else u
                     if not G.has_edge(keep, other):
-                        G.add_edge(keep, other, **{k:v for k,v in data.items()})
-                    G.remove_edge(u,v)
+                        g.add_edge(keep, other, **{k:v for k,v in data.items()})
+                    g.remove_edge(u, v, data.get("type"))
                 to_remove.append(nid)
             else:
                 seen[k] = nid
         for nid in to_remove:
-            G.remove_node(nid)
+            g.remove_node(nid)
 
     _dedup("Interval1")
     _dedup("Interval2")
@@ -271,9 +262,7 @@ def _patch_both_ends_compare(g):
 
     def ensure_div(u, v):
         if not u or not v: return
-        has = any(d.get("type")=="divides" and ((a==u and b==v) or (a==v and b==u))
-                  for a,b,d in G.edges(data=True))
-        if not has:
+        if not g.has_typed_edge(u, v, "divides", undirected=True):
             g.add_edge(u, v, type="divides", op=None)
 
     ensure_div(Y, X1)
@@ -297,10 +286,9 @@ def hook(g: gb.GraphBuilder):
 
     # ② 把 N = Length / Interval 的结果连到 SegmentCnt
     # 加入检查  是否已经有 Length / Interval 的关系
-    has_div = any(d["type"] == "divides" and
-                  g.G.nodes[u]["type"] == "Length" and
+    has_div = any(g.G.nodes[u]["type"] == "Length" and
                   g.G.nodes[v]["type"] == "Interval"
-                  for u, v, d in g.G.edges(data=True))
+                  for u, v in g.edges_of_type("divides"))
     if (not has_div and g.last_of("Length") and g.last_of("Interval")):
         g.add_edge("Length", "Interval", type="divides", op=None)
     
@@ -321,7 +309,7 @@ def hook(g: gb.GraphBuilder):
                 "loop_closed": "CUSTOM"
             }
     
-    if not any(d["type"] == "tree_relation" for _, _, d in G.edges(data=True)):
+    if not g.edges_of_type("tree_relation"):
         op = op_map.get(mode)
 
         if op in {"PLUS1", "MINUS1", "EQUAL"}:
@@ -1,11 +1,16 @@
 # -*- coding: utf-8 -*-
 import re, core.registry as R, core.builder as gb
 from core.registry import register_route, register_rule
+from core.rulespec import RuleSpec, NodeSpec
+from core.scanner import required_literals
+from core.spans import spans_of, SpanQuery
 
 FLAGS = re.S | re.I   # 跨行 + 忽略大小写
 
 def r(regex, action): return (re.compile(regex, FLAGS), action)
 
+_M = ("米", "m")  # 跨度表单位精确比较：不会把 min / mm 当成 m
+
 # ----------------- 通用工具 -----------------
 def _to_number(s: str):
     """把捕获到的数字串安全转为 int/float。"""
@@ -40,11 +45,18 @@ INTERVAL_PATTERNS = [
     re.compile(r'每[^，。；]*?(?:相距|相隔|间距)[是为]?\s*(?P<num>\d+(?:\.\d+)?)\s*米', FLAGS),
 ]
 
+def _cap_interval(g, text):
+    """INTERVAL_PATTERNS 依次取数；第一种写法（每隔/间隔/相隔 X 米）直接查共享的数值跨度表"""
+    sp = spans_of(g.G, text).first("米", before=("每隔", "间隔", "相隔"))
+    return _to_number(sp.text) if sp else _cap_number(INTERVAL_PATTERNS[1:], text)
+
 INTERVAL_RULE = r(r'.+', lambda m,g: (
-    (lambda v: g.add_node(type="Interval", value=v))(_cap_number(INTERVAL_PATTERNS, m.string))
-    if (not g.has_node(type="Interval") and _cap_number(INTERVAL_PATTERNS, m.string) is not None)
-    else None
+    None if g.has_node(type="Interval")
+    else (lambda v: g.add_node(type="Interval", value=v) if v is not None else None)(
+        _cap_interval(g, m.string))
 ))
+# r'.+' 推不出必需字面量；动作只在 INTERVAL_PATTERNS 之一命中时才生效，取它们的必需字面量之并
+INTERVAL_LITERALS = frozenset().union(*(required_literals(p) for p in INTERVAL_PATTERNS))
 
 # ================= 正则匹配规则库 =================
 # ------------- 数值节点（长度、宽度、树数） -------------
@@ -55,22 +67,22 @@ INTERVAL_RULE = r(r'.+', lambda m,g: (
 # ]
 # 1. Length 扩充：走了 X 米 / 从起点到终点 X 米
 LENGTH_RULES = [
-    r(r'长\s*(\d+(?:\.\d+)?)\s*(?:米|m)', lambda m,g: g.add_node(type="Length", value=_num(m.group(1)))),
-    r(r'宽\s*(\d+(?:\.\d+)?)\s*(?:米|m)', lambda m,g: g.add_node(type="Width",  value=_num(m.group(1)))),
-    r(r'周长[是为]?\s*(\d+(?:\.\d+)?)\s*(?:米|m)', lambda m,g: g.add_node(type="Length", value=_num(m.group(1)))),
+    (SpanQuery(_M, before="长"), lambda m,g: g.add_node(type="Length", value=_num(m.group(1)))),
+    (SpanQuery(_M, before="宽"), lambda m,g: g.add_node(type="Width",  value=_num(m.group(1)))),
+    (SpanQuery(_M, before=("周长", "周长是", "周长为")), lambda m,g: g.add_node(type="Length", value=_num(m.group(1)))),
     # “走了 X 米”
-    r(r'走了\s*(\d+(?:\.\d+)?)\s*(?:米|m)', lambda m,g: g.add_node(type="Length", value=_num(m.group(1)))),
+    (SpanQuery(_M, before="走了"), lambda m,g: g.add_node(type="Length", value=_num(m.group(1)))),
     # “这段路/这条路...总长/全长”
     r(r'(?:这条|这段|该|总)?(?:路|小道|跑道|城楼|绳子|队伍)(?:全长|总长|长)\s*(\d+(?:\.\d+)?)\s*(?:米|m)', 
       lambda m,g: g.add_node(type="Length", value=_num(m.group(1)))),
     # 距离 X 米
-    r(r'(?:相距|距离)\s*(\d+(?:\.\d+)?)\s*(?:米|m)', lambda m,g: g.add_node(type="Length", value=_num(m.group(1)))),
+    (SpanQuery(_M, before=("相距", "距离")), lambda m,g: g.add_node(type="Length", value=_num(m.group(1)))),
 ]
 
 # 2. Interval 扩充
 INTERVAL_RULES = [
-    r(r'(?:每隔|间隔|相隔|间距)\s*(\d+(?:\.\d+)?)\s*(?:米|m)', 
-      lambda m,g: g.add_node(type="Interval", value=_num(m.group(1)))),
+    (SpanQuery(_M, before=("每隔", "间隔", "相隔", "间距")),
+     lambda m,g: g.add_node(type="Interval", value=_num(m.group(1)))),
     r(r'(?:相邻|每两).*?(?:距离|间隔|相距)[是为]?\s*(\d+(?:\.\d+)?)\s*(?:米|m)',
       lambda m,g: g.add_node(type="Interval", value=_num(m.group(1)))),
 ]
@@ -129,7 +141,8 @@ MODE_RULES = [
 ]
 
 RULES = LENGTH_RULES + INTERVAL_RULES + TREECNT_RULES + MODE_RULES
-for rule in RULES: R.register_rule("tree", rule)
+for rule in RULES:
+    R.register_rule("tree", rule, literals=INTERVAL_LITERALS if rule is INTERVAL_RULE else None)
 
 # ------------- 模式判定（注意顺序） -------------
 TOPIC_MODE_RULES = [
@@ -202,6 +215,13 @@ def _num(s):
 # 定义一组强烈的“植树”关键词，用于在 Trip 路由中进行排除/降权
 TREE_STRONG_KEYWORDS = re.compile(r"(栽|种|植|每隔|间隔|树苗|杨树|柳树)", re.I)
 
+def _tree_strong(g):
+    """raw_text 里是否有强植树关键词；每道题只搜一次，结果记在图上"""
+    hit = g.G.graph.get("_tree_strong")
+    if hit is None:
+        hit = g.G.graph["_tree_strong"] = bool(TREE_STRONG_KEYWORDS.search(g.G.graph.get("raw_text", "")))
+    return hit
+
 # ==== Phase-1：路由 (修改版) ====
 
 # 1. 相遇/相向 (Join)
@@ -209,7 +229,7 @@ register_route("trip", (
     r"(相向|迎面|相对).*?(行|驶|走|跑)|相遇",
     lambda m, g: (
         # 【增强排除】：如果包含植树关键词，大概率是“环形植树反向走”的题，不应单纯视为 Trip
-        None if TREE_STRONG_KEYWORDS.search(g.G.graph.get("raw_text", ""))
+        None if _tree_strong(g)
         else g.add_candidate("trip", "join", confidence=0.9, source="kw")
     )
 ))
@@ -218,7 +238,7 @@ register_route("trip", (
 register_route("trip", (
     r"(同向|追及|追上|赶上)",
     lambda m, g: (
-        None if TREE_STRONG_KEYWORDS.search(g.G.graph.get("raw_text", ""))
+        None if _tree_strong(g)
         else g.add_candidate("trip", "chase", confidence=0.9, source="kw")
     )
 ))
@@ -234,7 +254,7 @@ register_route("trip", (
     r"(相距|距离).*(千?米|公里|km|米|m)",
     lambda m, g: (
         # 如果有“每隔”等词，这通常是植树的“间隔”或“全长”，而不是行程的“两地距离”
-        None if TREE_STRONG_KEYWORDS.search(g.G.graph.get("raw_text", ""))
+        None if _tree_strong(g)
         else g.add_candidate("trip", g.G.graph.get("mode") or None, confidence=0.5, source="dist")
     )
 ))
@@ -253,53 +273,33 @@ register_route("trip", (
 #     lambda m, g: g.add_node(type="Length", value=_num(m.group(1)))
 # ))
 # 修改为（新增：小道|步道|人行道|甬道|校道 等等）：
-R.register_rule("tree", (re.compile(
+R.register_rule("tree", RuleSpec(
     r'(\d+(?:\.\d+)?)\s*(?:米|m|千米|km)的[^，。；]*?(?:环形|圆形)?[^，。；]*?'
     r'(?:跑道|湖|水池|花园|道路|公路|操场|广场|花坛|围栏|栅栏|小道|步道|人行道|甬道|校道)',
-    FLAGS),
-    lambda m, g: g.add_node(type="Length", value=_num(m.group(1)))
+    FLAGS, nodes=(NodeSpec("Length", "$1"),)
 ))
-R.register_rule("tree", (re.compile(
-    r'(?:周长|全长|长度)[是为]?\s*(\d+(?:\.\d+)?)\s*(?:米|m|千米|km)', FLAGS),
-    lambda m, g: g.add_node(type="Length", value=_num(m.group(1)))
+R.register_rule("tree", RuleSpec(
+    SpanQuery(_M + ("千米", "km"), before=tuple(w + s for w in ("周长", "全长", "长度") for s in ("", "是", "为"))),
+    nodes=(NodeSpec("Length", "$1"),)
 ))
 # “两…之间相隔/相距/距离 X 米” → 更像总长（直线）
-R.register_rule("tree", (re.compile(
+R.register_rule("tree", RuleSpec(
     r'(?:两|俩|首尾|两端|两头|甲乙|东西|东|西|南|北|前后)[^，。；]{0,8}?(?:之间|相隔|相距|距离)[是为]?\s*(\d+(?:\.\d+)?)\s*(?:米|m|千米|km)',
-    FLAGS),
-    lambda m, g: g.add_node(type="Length", value=_num(m.group(1)))
+    FLAGS, nodes=(NodeSpec("Length", "$1"),)
 ))
-# 反向/相向而行，相遇 -> 周长 = 两人路程和
-R.register_rule("tree", (re.compile(
+# 反向/相向而行，相遇 -> 周长 = 两人路程和（已有 Length 节点则改它的值，否则新建），统一走闭环模板
+R.register_rule("tree", RuleSpec(
     r'(?:甲|A)[^，。；]*?走了\s*(\d+(?:\.\d+)?)\s*(?:米|m)'
     r'[^。；]*?(?:乙|B)[^，。；]*?走了\s*(\d+(?:\.\d+)?)\s*(?:米|m)'
-    r'[^。；]*?(?:相遇|相向而行|反向而行)', FLAGS),
-    lambda m, g: (
-        # 若已有 Length 节点，强制更新其值；否则新建
-        (g.G.nodes[g.last_of("Length")]["value"].__setitem__(slice(None), None),)  # 无操作占位
-        if False else None,  # 仅为占位，下面真的更新
-        (g.G.nodes.__setitem__(g.last_of("Length"), g.G.nodes[g.last_of("Length")])
-         if g.last_of("Length") else None),
-        (g.G.nodes[g.last_of("Length")].__setitem__("value",
-            _num(m.group(1)) + _num(m.group(2)))) if g.last_of("Length")
-        else g.add_node(type="Length", value=_num(m.group(1)) + _num(m.group(2))),
-        g.set_pattern("tree", "loop_closed")  # 统一走闭环模板
-    )
+    r'[^。；]*?(?:相遇|相向而行|反向而行)', FLAGS,
+    nodes=(NodeSpec("Length", ("$1", "$2"), how="last"),), set_pattern=("tree", "loop_closed")
 ))
 # === 补充“长度/周长”抽取的名词覆盖 ===
-R.register_rule("tree", (
-    re.compile(
-        r'(\d+(?:\.\d+)?)\s*(?:米|m|千米|km)的[^，。；]*?(?:环形|圆形)?[^，。；]*?'
-        r'(?:跑道|湖|水池|花园|道路|公路|操场|广场|花坛|围栏|栅栏|小道|步道|人行道|甬道|校道)',
-        re.I
-    ),
-    lambda m, g: (
-        # 若已有 Length 则保留较“长”的那个；没有则新建（你也可以改为直接覆盖）
-        (lambda val: (
-            g.G.nodes[g.last_of("Length")].update({"value": val})
-            if g.last_of("Length") else g.add_node(type="Length", value=val)
-        ))(_num(m.group(1)))
-    )
+# 若已有 Length 则改最近那个的值；没有则新建
+R.register_rule("tree", RuleSpec(
+    r'(\d+(?:\.\d+)?)\s*(?:米|m|千米|km)的[^，。；]*?(?:环形|圆形)?[^，。；]*?'
+    r'(?:跑道|湖|水池|花园|道路|公路|操场|广场|花坛|围栏|栅栏|小道|步道|人行道|甬道|校道)',
+    re.I, nodes=(NodeSpec("Length", "$1", how="last"),)
 ))
 # # 闭环相向/反向相遇：周长 = 两人走的距离和
 # R.register_rule("tree", (
@@ -313,9 +313,8 @@ R.register_rule("tree", (
 # ))
 
 # === A. 大类：闭环（周围/一圈/环形/圆形/周长/沿…一周）→ loop_closed ===
-R.register_rule("tree", (
-    re.compile(r'(周围|四周|一圈|沿[^。；]*?一周|环形|圆形|周长)', re.I),
-    lambda m, g: g.set_pattern("tree", "loop_closed")
+R.register_rule("tree", RuleSpec(
+    r'(周围|四周|一圈|沿[^。；]*?一周|环形|圆形|周长)', re.I, set_pattern=("tree", "loop_closed")
 ))
 # 矩形围一圈（四角、四周）→ 周长 = 2*(长+宽)
 R.register_rule("tree", (
@@ -343,61 +342,49 @@ R.register_rule("tree", (
 #     lambda m, g: g.G.graph.__setitem__("end_op", "PLUS1")
 # ))
 
-R.register_rule("tree", (
-    re.compile(r'(从头至尾|从头到尾|从一头开始|两端都栽|两头都栽|路的一侧|道路一侧|一侧栽|在.*一边.*栽)', re.I),
-    lambda m, g: g.set_pattern("tree", "both_ends_quantity")
+R.register_rule("tree", RuleSpec(
+    r'(从头至尾|从头到尾|从一头开始|两端都栽|两头都栽|路的一侧|道路一侧|一侧栽|在.*一边.*栽)', re.I,
+    set_pattern=("tree", "both_ends_quantity")
 ))
 
 # === C. 兜底：只要出现“栽/种/插 + 树/旗/垃圾桶/路灯”等对象，就把 topic 立起来 ===
-R.register_rule("tree", (
-    re.compile(r'(栽|种|插)[^。；]*?(树|柳树|杨树|旗|红旗|垃圾桶|路灯)', re.I),
-    lambda m, g: (g.G.graph.get("topic") or g.G.graph.__setitem__("topic","tree"))
+R.register_rule("tree", RuleSpec(
+    r'(栽|种|插)[^。；]*?(树|柳树|杨树|旗|红旗|垃圾桶|路灯)', re.I,
+    when=("!graph:topic",), graph=(("topic", "tree"),)
 ))
 # === 只要出现“相隔/每隔/间隔/相距/距离 X 米”，就抽 Interval=X
 # 同时若此前误把同一个数值抽成了 Length，则把该 Length 的 value 清空（避免 Length=8 的误判）
 R.register_rule("tree", (
-    re.compile(r'(?:每隔|相隔|间隔|相距|距离)\s*(\d+(?:\.\d+)?)\s*(?:米|m)', re.I),
+    SpanQuery(_M, before=("每隔", "相隔", "间隔", "相距", "距离")),
     lambda m, g: (
         # 1) 抽取间隔
         g.add_node(type="Interval", value=_num(m.group(1))),
         # 2) 若存在最近的 Length 且其值恰好等于该间隔，视作误判 -> 清空
-        (g.G.nodes[g.last_of("Length")].__setitem__("value", None)
+        (g.set_value(g.last_of("Length"), None)
             if g.last_of("Length") and g.G.nodes[g.last_of("Length")].get("value") == _num(m.group(1))
             else None)
     )
 ))
 # === “共/一共/总共 … 栽/种/插 … X 棵（树/柳树/杨树/树苗）” -> TreeCnt = X
-R.register_rule("tree", (
-    re.compile(
-        r'(?:共|一共|总共)?[^。；\n]*?(?:栽|种|插)[^。；\n]*?(\d+)\s*棵'
-        r'[^。；\n]*?(?:树|柳树|杨树|树苗)?',  # 名词可省略
-        re.I
-    ),
-    lambda m, g: (
-        # 若已有 TreeCnt 且为 None/未赋值，则覆盖；若不存在则新建
-        (g.G.nodes[g.last_of("TreeCnt")].__setitem__("value", _num(m.group(1)))
-            if g.last_of("TreeCnt") and g.G.nodes[g.last_of("TreeCnt")].get("value") in (None, )
-            else g.add_node(type="TreeCnt", value=_num(m.group(1))))
-    )
+# 若已有 TreeCnt 且为 None/未赋值，则覆盖；否则新建
+R.register_rule("tree", RuleSpec(
+    r'(?:共|一共|总共)?[^。；\n]*?(?:栽|种|插)[^。；\n]*?(\d+)\s*棵'
+    r'[^。；\n]*?(?:树|柳树|杨树|树苗)?',  # 名词可省略
+    re.I, nodes=(NodeSpec("TreeCnt", "$1", how="fill"),)
 ))
 
 # ---------- TreeCnt / 多少棵（更广量词与动词） ----------
 _OBJ = r'(?:棵|面|盏|个|根|只|株|辆|位|人|块|次|盆|支|杆)'
-R.register_rule("tree", (re.compile(
+R.register_rule("tree", RuleSpec(
     r'(?:连两端|连两头)?(?:共(?:有|计|用|装|插|放|栽)|一共|合计|共有|准备|需要|用了|共放|共插|共装|共立|共栽|共摆)[^0-9]{0,4}(\d+)\s*' + _OBJ,
-    FLAGS),
-    lambda m, g: g.add_node(type="TreeCnt", value=int(m.group(1)))
+    FLAGS, nodes=(NodeSpec("TreeCnt", "$1", conv="int"),)
 ))
-R.register_rule("tree", (re.compile(
+R.register_rule("tree", RuleSpec(
     r'(?:栽|插|放|挂|立|装|摆|安装|准备|需要)[^0-9]{0,3}(\d+)\s*' + _OBJ,
-    FLAGS),
-    lambda m, g: g.add_node(type="TreeCnt", value=int(m.group(1)))
+    FLAGS, nodes=(NodeSpec("TreeCnt", "$1", conv="int"),)
 ))
 # 问句型未知树数
-R.register_rule("tree", (re.compile(
-    r'(?:多少|几)\s*' + _OBJ, FLAGS),
-    lambda m, g: g.add_node(type="TreeCnt")
-))
+R.register_rule("tree", RuleSpec(r'(?:多少|几)\s*' + _OBJ, FLAGS, nodes=(NodeSpec("TreeCnt"),)))
 # # 人/同学/小朋友数量（避免“每隔…1个”误匹配）
 # R.register_rule("tree", (
 #     re.compile(r'(\d+)\s*(?:位|个)\s*(?:小朋友|同学|人)\b(?![^。；\n]*?每隔)', re.I),
@@ -414,7 +401,7 @@ R.register_rule("tree", (
         (lambda total, cols:
             g.add_node(type="TreeCnt", value= total // cols)
             if not g.last_of("TreeCnt")
-            else g.G.nodes[g.last_of("TreeCnt")].__setitem__("value", total // cols)
+            else g.set_value(g.last_of("TreeCnt"), total // cols)
         )(int(re.search(r'\d+', m.group(0)).group()),  # 总人数
           ({"两":2,"三":3,"四":4,"五":5,"六":6,"七":7,"八":8,"九":9,"十":10}.get(m.group(1), int(m.group(2) or 1))))
     )
@@ -422,88 +409,70 @@ R.register_rule("tree", (
 
 # ---------- Interval / 间隔 ----------
 # 典型“每隔/间隔/相隔 X 米”
-R.register_rule("tree", (re.compile(
-    r'(?:每隔|间隔|相隔)\s*(\d+(?:\.\d+)?)\s*(?:米|m|千米|km)', FLAGS),
-    lambda m, g: g.add_node(type="Interval", value=_num(m.group(1)))
+R.register_rule("tree", RuleSpec(
+    SpanQuery(_M + ("千米", "km"), before=("每隔", "间隔", "相隔")),
+    nodes=(NodeSpec("Interval", "$1"),)
 ))
 # “每…相距/间距…米”
-R.register_rule("tree", (re.compile(
-    r'每[^，。；]*?(?:相距|相隔|间距)[是为]?\s*(\d+(?:\.\d+)?)\s*(?:米|m|千米|km)', FLAGS),
-    lambda m, g: g.add_node(type="Interval", value=_num(m.group(1)))
+R.register_rule("tree", RuleSpec(
+    r'每[^，。；]*?(?:相距|相隔|间距)[是为]?\s*(\d+(?:\.\d+)?)\s*(?:米|m|千米|km)', FLAGS,
+    nodes=(NodeSpec("Interval", "$1"),)
 ))
 # “相邻/每两…之间…距离/间隔/相距 X 米”（相邻点间隔）
-R.register_rule("tree", (re.compile(
+R.register_rule("tree", RuleSpec(
     r'(?:相邻|每两(?:个|棵|面|盏|根)|两(?:个|棵|面|盏|根)[^，。；]*?之间)[^，。；]*?(?:距离|间隔|相距)[是为]?\s*(\d+(?:\.\d+)?)\s*(?:米|m|千米|km)',
-    FLAGS),
-    lambda m, g: g.add_node(type="Interval", value=_num(m.group(1)))
+    FLAGS, nodes=(NodeSpec("Interval", "$1"),)
 ))
 
 # ---------- 类植树题场景 ----------
 _num = lambda s: float(s) if '.' in s else int(s)
 
 # === A. 通用“数量”抽取：小朋友/同学/车辆/灯/旗/垃圾桶…… -> TreeCnt ===
-R.register_rule("tree", (
-    re.compile(
-        r'(?:共|一共|总共)?[^。；\n]*?(?:有|栽|种|插|站|排|安装|放置|设置|排列)'
-        r'[^。；\n]*?(\d+)\s*(?:棵|位|个|辆|盏|面)'
-        r'(?:[^。；\n]*?(?:树|柳树|杨树|树苗|小朋友|同学|车|车辆|灯|路灯|垃圾桶|红旗|旗))?',
-        re.I),
-    lambda m, g: (
-        g.add_node(type="TreeCnt", value=_num(m.group(1)))
-        if not g.last_of("TreeCnt")
-        else g.G.nodes[g.last_of("TreeCnt")].__setitem__("value", _num(m.group(1)))
-    )
+R.register_rule("tree", RuleSpec(
+    r'(?:共|一共|总共)?[^。；\n]*?(?:有|栽|种|插|站|排|安装|放置|设置|排列)'
+    r'[^。；\n]*?(\d+)\s*(?:棵|位|个|辆|盏|面)'
+    r'(?:[^。；\n]*?(?:树|柳树|杨树|树苗|小朋友|同学|车|车辆|灯|路灯|垃圾桶|红旗|旗))?',
+    re.I, nodes=(NodeSpec("TreeCnt", "$1", how="last"),)
 ))
 
 # === B. 直线一侧/队伍/排队 -> both_ends_quantity（让 hook 自动挂 PLUS1） ===
-R.register_rule("tree", (
-    re.compile(
-        r'(站成一列|排成一排|队伍|车队|从头至尾|从头到尾|从一头开始|路的一侧|道路一侧|一侧栽|在.*一边.*栽)',
-        re.I),
-    lambda m, g: g.set_pattern("tree", "both_ends_quantity")
+R.register_rule("tree", RuleSpec(
+    r'(站成一列|排成一排|队伍|车队|从头至尾|从头到尾|从一头开始|路的一侧|道路一侧|一侧栽|在.*一边.*栽)',
+    re.I, set_pattern=("tree", "both_ends_quantity")
 ))
 
 # === C. “平均每隔多少米 / 每隔几米” -> 创建未知 Interval 节点 ===
-R.register_rule("tree", (
-    re.compile(r'(平均)?每隔\s*(?:多少|几)\s*(?:米|m)?', re.I),
-    lambda m, g: (
-        g.add_node(type="Interval", value=None)
-        if not g.last_of("Interval") else None
-    )
+R.register_rule("tree", RuleSpec(
+    r'(平均)?每隔\s*(?:多少|几)\s*(?:米|m)?', re.I,
+    nodes=(NodeSpec("Interval", None),), when=("!last_of:Interval",)
 ))
 
 # === D. 两侧对比：原打算…Z1棵…每隔I1米；实际…Z2棵；问新间距 I2 ===
 # 公式：L 固定 -> (Z1-1)*I1 = (Z2-1)*I2
-R.register_rule("tree", (
-    re.compile(
-        r'(?:两侧|两边)[^。；\n]*?(?:原打算|原计划)[^。；\n]*?(\d+)\s*棵'
-        r'[^。；\n]*?每隔\s*(\d+(?:\.\d+)?)\s*(?:米|m)'
-        r'[^。；\n]*?(?:实际|后来|现在)[^。；\n]*?(\d+)\s*棵',
-        re.I),
-    lambda m, g: (
-        g.add_node(type="TreeCnt", value=_num(m.group(1))),  # Z1
-        g.add_node(type="Interval", value=_num(m.group(2))), # I1
-        g.add_node(type="TreeCnt", value=_num(m.group(3))),  # Z2
-        g.add_node(type="Interval", value=None),             # I2 (未知)
-        g.set_pattern("tree", "both_ends_compare")
-    )
+R.register_rule("tree", RuleSpec(
+    r'(?:两侧|两边)[^。；\n]*?(?:原打算|原计划)[^。；\n]*?(\d+)\s*棵'
+    r'[^。；\n]*?每隔\s*(\d+(?:\.\d+)?)\s*(?:米|m)'
+    r'[^。；\n]*?(?:实际|后来|现在)[^。；\n]*?(\d+)\s*棵',
+    re.I,
+    nodes=(NodeSpec("TreeCnt", "$1"),    # Z1
+           NodeSpec("Interval", "$2"),   # I1
+           NodeSpec("TreeCnt", "$3"),    # Z2
+           NodeSpec("Interval", None)),  # I2 (未知)
+    set_pattern=("tree", "both_ends_compare")
 ))
 
 # === E. 多段车队：每辆车长 a、前后相隔 b、共 Z 辆 -> 设 multi_segment，创建 L1/I1/Z，L2未知 ===
-R.register_rule("tree", (
-    re.compile(
-        r'(?:车|车辆|彩车|卡车|汽车)[^。；\n]*?(?:每辆|每台|每车)[^。；\n]*?长\s*'
-        r'(\d+(?:\.\d+)?)\s*(?:米|m)[^。；\n]*?(?:相隔|间隔|间距)\s*'
-        r'(\d+(?:\.\d+)?)\s*(?:米|m)[^。；\n]*?(?:共|一共|总共)\s*'
-        r'(\d+)\s*(?:辆)',
-        re.I),
-    lambda m, g: (
-        g.add_node(type="Length1", value=_num(m.group(1))),   # 车长
-        g.add_node(type="Interval1", value=_num(m.group(2))), # 车距
-        g.add_node(type="TreeCnt", value=_num(m.group(3))),   # 车辆数
-        g.add_node(type="Length2", value=None),               # 队伍总长
-        g.set_pattern("tree", "multi_segment")
-    )
+R.register_rule("tree", RuleSpec(
+    r'(?:车|车辆|彩车|卡车|汽车)[^。；\n]*?(?:每辆|每台|每车)[^。；\n]*?长\s*'
+    r'(\d+(?:\.\d+)?)\s*(?:米|m)[^。；\n]*?(?:相隔|间隔|间距)\s*'
+    r'(\d+(?:\.\d+)?)\s*(?:米|m)[^。；\n]*?(?:共|一共|总共)\s*'
+    r'(\d+)\s*(?:辆)',
+    re.I,
+    nodes=(NodeSpec("Length1", "$1"),    # 车长
+           NodeSpec("Interval1", "$2"),  # 车距
+           NodeSpec("TreeCnt", "$3"),    # 车辆数
+           NodeSpec("Length2", None)),   # 队伍总长
+    set_pattern=("tree", "multi_segment")
 ))
 # # 直线强提示 → 归类 linear
 # R.register_rule("tree", (
@@ -512,7 +481,8 @@ R.register_rule("tree", (
 # ))
 
 
-for rule in RULES: R.register_rule("tree", rule)
+for rule in RULES:
+    R.register_rule("tree", rule, literals=INTERVAL_LITERALS if rule is INTERVAL_RULE else None)
 
 
 def _try_promote_to_multi_segment(g):
@@ -524,74 +494,64 @@ def _try_promote_to_multi_segment(g):
         return
 
     # 仅当真的是“原生多段”才升级：至少 2 个原生 Length 或 2 个原生 Interval
-    n_len = sum(1 for _,d in G.nodes(data=True) if d.get("type") == "Length")
-    n_int = sum(1 for _,d in G.nodes(data=True) if d.get("type") == "Interval")
+    n_len = len(g.nodes_of("Length"))
+    n_int = len(g.nodes_of("Interval"))
     if (n_len >= 2 or n_int >= 2) and mode in {"both_ends_quantity","both_ends_distance","one_end_quantity"}:
         G.graph["mode"] = "multi_segment"
         # 清理误连的 tree_relation
-        to_remove = [(u,v) for u,v,d in G.edges(data=True) if d.get("type")=="tree_relation"]
-        for u,v in to_remove: G.remove_edge(u,v)
+        for u,v in g.edges_of_type("tree_relation"):
+            while g.has_typed_edge(u, v, "tree_relation"): g.remove_edge(u, v, "tree_relation")
         print("[hook] 检测到多段，覆盖模式为 multi_segment，并移除误连 tree_relation")
 
 def _patch_rectangle_closed(g):
     """矩形围场：Length/Width → Length1/Length2；补 L2–Interval 的 divides（模板已不要求 N1/N2）。"""
-    G = g.G
     # 1) 重命名
-    lengths = [nid for nid, d in G.nodes(data=True) if d["type"] == "Length"]
-    widths  = [nid for nid, d in G.nodes(data=True) if d["type"] == "Width"]
+    lengths = list(g.nodes_of("Length"))
+    widths  = list(g.nodes_of("Width"))
 
     # 取一个 Length 作为 Length1
     if lengths:
-        G.nodes[lengths[0]]["type"] = "Length1"
+        g.retype(lengths[0], "Length1")
         # 若还有多余的 Length，用于 Length2（防止没有 Width 的文本）
-        if len(lengths) >= 2 and not any(d["type"] == "Length2" for _, d in G.nodes(data=True)):
-            G.nodes[lengths[1]]["type"] = "Length2"
+        if len(lengths) >= 2 and not g.nodes_of("Length2"):
+            g.retype(lengths[1], "Length2")
             print("[hook] rectangle_closed: Length → Length1, Length2 赋值")
     # 否则用 Width 作为 Length2
-    if not any(d["type"] == "Length2" for _, d in G.nodes(data=True)) and widths:
+    if not g.nodes_of("Length2") and widths:
         w = widths[0]
-        G.nodes[w]["type"] = "Length2"
+        g.retype(w, "Length2")
         print(f"[hook] rectangle_closed: Width → Length2 ({w})")
 
     # 2) 补 L2 – Interval divides
-    l2 = next((nid for nid, d in G.nodes(data=True) if d["type"] == "Length2"), None)
-    I  = next((nid for nid, d in G.nodes(data=True) if d["type"] == "Interval"), None)
+    l2 = next(iter(g.nodes_of("Length2")), None)
+    I  = next(iter(g.nodes_of("Interval")), None)
     if l2 and I:
-        has_div = any(
-            d.get("type") == "divides" and ((u == l2 and v == I) or (u == I and v == l2))
-            for u, v, d in G.edges(data=True)
-        )
-        if not has_div:
+        if not g.has_typed_edge(l2, I, "divides", undirected=True):
             g.add_edge(l2, I, type="divides", op=None)
             print("[hook] rectangle_closed: 添加 Length2 - Interval divides")
 
 
 def _patch_multi_segment(g):
     """多段连接：Length/Interval 标号成 1/2；补成对 divides：L1–I1、L2–I2。"""
-    G = g.G
     # 1) 标号
-    lens = [nid for nid, d in G.nodes(data=True) if d["type"] == "Length"]
-    ints = [nid for nid, d in G.nodes(data=True) if d["type"] == "Interval"]
+    lens = list(g.nodes_of("Length"))
+    ints = list(g.nodes_of("Interval"))
 
     for i, nid in enumerate(lens[:2]):
-        G.nodes[nid]["type"] = f"Length{i+1}"
+        g.retype(nid, f"Length{i+1}")
     for i, nid in enumerate(ints[:2]):
-        G.nodes[nid]["type"] = f"Interval{i+1}"
+        g.retype(nid, f"Interval{i+1}")
     print("[hook] multi_segment: Length/Interval 分段重命名完成")
 
     # 2) 成对 divides
     def last_of(t):
-        return next((nid for nid, d in G.nodes(data=True) if d["type"] == t), None)
+        return next(iter(g.nodes_of(t)), None)
 
     for k in (1, 2):
         Lk = last_of(f"Length{k}")
         Ik = last_of(f"Interval{k}")
         if Lk and Ik:
-            has_div = any(
-                d.get("type") == "divides" and ((u == Lk and v == Ik) or (u == Ik and v == Lk))
-                for u, v, d in G.edges(data=True)
-            )
-            if not has_div:
+            if not g.has_typed_edge(Lk, Ik, "divides", undirected=True):
                 g.add_edge(Lk, Ik, type="divides", op=None)
                 print(f"[hook] multi_segment: 添加 divides (Length{k}, Interval{k})")
 
@@ -599,30 +559,29 @@ def _patch_both_ends_compare(g):
     G = g.G
 
     # A) 清理裸 Interval（避免被其它模板误匹配）
-    rm = [nid for nid,d in G.nodes(data=True) if d.get("type") == "Interval"]
+    rm = list(g.nodes_of("Interval"))
     for nid in rm:
-        G.remove_node(nid)
+        g.remove_node(nid)
 
     # B) 对 Interval1/2 去重（同 value 合并）
     def _dedup(tname):
         seen = {}
         to_remove = []
-        for nid,d in list(G.nodes(data=True)):
-            if d.get("type") != tname: continue
-            k = (tname, d.get("value"))
+        for nid in list(g.nodes_of(tname)):
+            k = (tname, G.nodes[nid].get("value"))
             if k in seen:
                 keep = seen[k]
                 # 合并边
                 for u,v,data in list(G.edges(nid, data=True)):
                     other = v if u == nid else u
                     if not G.has_edge(keep, other):
-                        G.add_edge(keep, other, **{k:v for k,v in data.items()})
-                    G.remove_edge(u,v)
+                        g.add_edge(keep, other, **{k:v for k,v in data.items()})
+                    g.remove_edge(u, v, data.get("type"))
                 to_remove.append(nid)
             else:
                 seen[k] = nid
         for nid in to_remove:
-            G.remove_node(nid)
+            g.remove_node(nid)
 
     _dedup("Interval1")
     _dedup("Interval2")
@@ -634,9 +593,7 @@ def _patch_both_ends_compare(g):
 
     def ensure_div(u, v):
         if not u or not v: return
-        has = any(d.get("type")=="divides" and ((a==u and b==v) or (a==v and b==u))
-                  for a,b,d in G.edges(data=True))
-        if not has:
+        if not g.has_typed_edge(u, v, "divides", undirected=True):
             g.add_edge(u, v, type="divides", op=None)
 
     ensure_div(Y, X1)
@@ -683,12 +640,7 @@ def hook(g: gb.GraphBuilder):
     L = g.last_of("Length")
     I = g.last_of("Interval")
     if L and I:
-        has_div = any(
-            d.get("type") == "divides" and 
-            ((u == L and v == I) or (u == I and v == L))
-            for u, v, d in G.edges(data=True)
-        )
-        if not has_div:
+        if not g.has_typed_edge(L, I, "divides", undirected=True):
             g.add_edge(L, I, type="divides", op=None)
 
     # 4. 尝试升级为“多段”模式 (检测是否有多组 L/I)    
@@ -765,7 +717,7 @@ def hook(g: gb.GraphBuilder):
     }
 
     # 仅当图中还没有 tree_relation 边时才添加 (防止重复 Hook 导致多条边)
-    has_tree_rel = any(d.get("type") == "tree_relation" for u, v, d in G.edges(data=True))
+    has_tree_rel = bool(g.edges_of_type("tree_relation"))
 
     # if not any(d["type"] == "tree_relation" for _, _, d in G.edges(data=True)):
     #     op = op_map.get(mode)
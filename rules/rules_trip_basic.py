@@ -36,6 +36,8 @@
 # R.register_rule("trip", ("__AUTO__", hook))
 import re
 from core.registry import register_route, register_rule
+from core.rulespec import RuleSpec, NodeSpec
+from core.spans import SpanQuery
 
 # ==== Phase-1：路由（只加候选，不写 pattern） ====
 register_route("trip", (
@@ -81,53 +83,53 @@ pat_dt2 = re.compile(r"(相隔|间隔)\s*(\d+(?:\.\d+)?)\s*(小时|h|分钟|min|
 
 
 # ==== Phase-2：抽取（节点） ====
+# 全部写成声明式 RuleSpec（可 pickle / 哈希），由 core.registry 编译成动作；
+# “关键词 + 数 + 单位”的直接查数值跨度表（SpanQuery，$1 数字 / $2 单位），单位集合精确比较
 # 速度
-register_rule("trip", (re.compile(r'(\d+(?:\.\d+)?)\s*(千?米|公里|km)\s*/\s*(小时|h)', re.I),
-    lambda m,g: g.add_node(type="Speed", value=float(m.group(1)), unit="km/h")))
-register_rule("trip", (re.compile(r'(\d+(?:\.\d+)?)\s*(米|m)\s*/\s*(秒|s)', re.I),
-    lambda m,g: g.add_node(type="Speed", value=float(m.group(1)), unit="m/s")))
+register_rule("trip", RuleSpec(SpanQuery(("千米", "米", "公里", "km"), per=("小时", "h")),
+    nodes=(NodeSpec("Speed", "$1", unit="km/h", conv="float"),)))
+register_rule("trip", RuleSpec(SpanQuery(("米", "m"), per=("秒", "s")),
+    nodes=(NodeSpec("Speed", "$1", unit="m/s", conv="float"),)))
 # 时间
-register_rule("trip", (re.compile(r'(\d+(?:\.\d+)?)\s*(小时|h)', re.I),
-    lambda m,g: g.add_node(type="Time", value=float(m.group(1)), unit="h")))
-register_rule("trip", (re.compile(r'(\d+(?:\.\d+)?)\s*(分钟|min)', re.I),
-    lambda m,g: g.add_node(type="Time", value=float(m.group(1)), unit="min")))
-register_rule("trip", (re.compile(r'(\d+(?:\.\d+)?)\s*(秒|s)', re.I),
-    lambda m,g: g.add_node(type="Time", value=float(m.group(1)), unit="s")))
-# 距离 & 初始间距
-register_rule("trip", (re.compile(r'(相距|距离)\s*(\d+(?:\.\d+)?)\s*(千?米|公里|km)', re.I),
-    lambda m,g: g.add_node(type="Length", value=float(m.group(2)), unit="km")))
-register_rule("trip", (re.compile(r'(相距|距离)\s*(\d+(?:\.\d+)?)\s*(米|m)', re.I),
-    lambda m,g: g.add_node(type="Length", value=float(m.group(2)), unit="m")))
-register_rule("trip", (re.compile(r'(领先|落后|相差|间隔)\s*(\d+(?:\.\d+)?)\s*(千?米|公里|km|米|m)', re.I),
-    lambda m,g: g.add_node(type="Length", value=float(m.group(2)), unit=m.group(3), role="gap")))
+register_rule("trip", RuleSpec(SpanQuery(("小时", "h")),
+    nodes=(NodeSpec("Time", "$1", unit="h", conv="float"),)))
+register_rule("trip", RuleSpec(SpanQuery(("分钟", "min")),
+    nodes=(NodeSpec("Time", "$1", unit="min", conv="float"),)))
+register_rule("trip", RuleSpec(SpanQuery(("秒", "s")),
+    nodes=(NodeSpec("Time", "$1", unit="s", conv="float"),)))
+# 距离 & 初始间距（“千?米”原本就含“米”，这里照旧）
+register_rule("trip", RuleSpec(SpanQuery(("千米", "米", "公里", "km"), before=("相距", "距离")),
+    nodes=(NodeSpec("Length", "$1", unit="km", conv="float"),)))
+register_rule("trip", RuleSpec(SpanQuery(("米", "m"), before=("相距", "距离")),
+    nodes=(NodeSpec("Length", "$1", unit="m", conv="float"),)))
+register_rule("trip", RuleSpec(SpanQuery(("千米", "米", "公里", "km", "m"), before=("领先", "落后", "相差", "间隔")),
+    nodes=(NodeSpec("Length", "$1", unit="$2", role="gap", conv="float"),)))
 # 出发时间差
-register_rule("trip", (re.compile(r'(早|晚).*?(\d+(?:\.\d+)?)\s*(小时|h|分钟|min|秒|s)', re.I|re.S),
-    lambda m,g: g.add_node(type="Time", value=float(m.group(2)), unit=m.group(3), role="delta_t")))
+register_rule("trip", RuleSpec(r'(早|晚).*?(\d+(?:\.\d+)?)\s*(小时|h|分钟|min|秒|s)', re.I|re.S,
+    nodes=(NodeSpec("Time", "$2", unit="$3", role="delta_t", conv="float"),)))
 # 目标量（问几小时/多少秒）
-register_rule("trip", (re.compile(r'(几|多少)\s*(小时|h|分钟|min|秒|s)', re.I),
-    lambda m,g: (g.add_node(type="Time", value=None, unit=m.group(2), role="target"),
-                 g.G.graph.__setitem__("target", "Time"))))
+register_rule("trip", RuleSpec(r'(几|多少)\s*(小时|h|分钟|min|秒|s)', re.I,
+    nodes=(NodeSpec("Time", None, unit="$2", role="target"),), graph=(("target", "Time"),)))
 
 # ====== 抽取：时间差 Δt ======
 # 先/后……出发……X 小时/分钟/秒（跨行也能匹配）
-register_rule("trip", (
-    re.compile(r"(先|后).*?出发.*?(\d+(?:\.\d+)?)\s*(小时|h|分钟|min|秒|s).*?(后)?", re.I|re.S),
-    lambda m,g: g.add_node(type="Time", value=float(m.group(2)), unit=m.group(3), role="delta_t")
+register_rule("trip", RuleSpec(
+    r"(先|后).*?出发.*?(\d+(?:\.\d+)?)\s*(小时|h|分钟|min|秒|s).*?(后)?", re.I|re.S,
+    nodes=(NodeSpec("Time", "$2", unit="$3", role="delta_t", conv="float"),)
 ))
 # 相隔/间隔 X 时间出发
-register_rule("trip", (
-    re.compile(r"(相隔|间隔)\s*(\d+(?:\.\d+)?)\s*(小时|h|分钟|min|秒|s).*?出发", re.I|re.S),
-    lambda m,g: g.add_node(type="Time", value=float(m.group(2)), unit=m.group(3), role="delta_t")
+register_rule("trip", RuleSpec(
+    r"(相隔|间隔)\s*(\d+(?:\.\d+)?)\s*(小时|h|分钟|min|秒|s).*?出发", re.I|re.S,
+    nodes=(NodeSpec("Time", "$2", unit="$3", role="delta_t", conv="float"),)
 ))
 # X 小时后出发（泛化）
-register_rule("trip", (
-    re.compile(r"(\d+(?:\.\d+)?)\s*(小时|h|分钟|min|秒|s)\s*后.*?出发", re.I|re.S),
-    lambda m,g: g.add_node(type="Time", value=float(m.group(1)), unit=m.group(2), role="delta_t")
+register_rule("trip", RuleSpec(
+    r"(\d+(?:\.\d+)?)\s*(小时|h|分钟|min|秒|s)\s*后.*?出发", re.I|re.S,
+    nodes=(NodeSpec("Time", "$1", unit="$2", role="delta_t", conv="float"),)
 ))
 
 # ====== 抽取：目标量（多久/多长时间） ======
-register_rule("trip", (
-    re.compile(r"(多(久|长时间))", re.I),
-    lambda m,g: (g.add_node(type="Time", value=None, unit=None, role="target"),
-                 g.G.graph.__setitem__("target", "Time"))
-))
\ No newline at end of file
+register_rule("trip", RuleSpec(
+    r"(多(久|长时间))", re.I,
+    nodes=(NodeSpec("Time", None, role="target", attrs=(("unit", None),)),), graph=(("target", "Time"),)
+))
@@ -21,12 +21,8 @@ def solve(question:str):
     gb = bd.GraphBuilder()
 
     # 1) regex 生成节点 / 边
-    for rx, fn in R.RULE_REGISTRY[topic]:
-        if rx == "__AUTO__":
-            continue
-        
-        for m in rx.finditer(question):
-            fn(m, gb)
+    for fn, m in R.rule_scanner(topic).scan(question):
+        fn(m, gb)
 
     # 2) hook 补漏
     for rx, fn in R.RULE_REGISTRY[topic]:
@@ -61,11 +57,8 @@ def solve_with_explain(question: str,
     gb = bd.GraphBuilder()
     
     # 1) 规则抽取
-    for rx, fn in R.RULE_REGISTRY[topic]:
-        if rx == "__AUTO__":
-            continue
-        for m in rx.finditer(question):
-            fn(m, gb)
+    for fn, m in R.rule_scanner(topic).scan(question):
+        fn(m, gb)
             
     # 2) hook 补漏/提模式
     for rx, fn in R.RULE_REGISTRY[topic]:
@@ -179,20 +179,22 @@
 # --- 2025-10-27版 ---
 from pathlib import Path
 import pandas as pd
-import re, json
+import json, math, numbers
 from core import builder as bd, registry as R
+from core.spans import SpanTable
 from core.matcher import match
 from core.solver  import solve_equation
 from core.explain_visualize import explain_equation
 
-def preprocess(text: str) -> str:
+def preprocess(text: str) -> tuple[str, SpanTable]:
+    """规范化文本，并把其中的数值跨度（数、单位、偏移、上下文）切成一张表，各候选抽取共用"""
     # 统一空白与常见中文标点
     t = (text or "")
     t = t.replace("\u3000", " ")          # 全角空格
     t = t.replace("\r", " ").replace("\n", " ") # 换行→空格
     t = t.replace("，", ",").replace("。", ".").replace("：", ":").replace("；", ";")
     t = " ".join(t.split()) # 压缩多空格
-    return t
+    return t, SpanTable(t)
 
 # 统一评分函数
 def score_solution(route_conf: float, tpl: dict | None, mapping: dict | None, solved_ok: bool, G):
@@ -237,10 +239,9 @@ def route_phase(text: str):
     gb.G.graph["raw_text"] = text
 
     hit_any = False
-    for topic, rules in R.ROUTE_REGISTRY.items():
-        for rx, fn in rules:
-            for m in re.finditer(rx, text, flags=re.I|re.S) if isinstance(rx, str) else rx.finditer(text):
-                fn(m, gb); hit_any = True
+    # 关键词自动机先扫一遍，只跑必需关键词出现了的路由规则
+    for fn, m in R.route_scanner().scan(text):
+        fn(m, gb); hit_any = True
 
     cands = gb.get_candidates()
     # 兜底：若没任何命中，给 tree 一个很低置信度候选，避免“未识别题型”
@@ -275,20 +276,20 @@ def canonicalize_trip_variables(tpl_id, mapping, G):
                 G.nodes[gid]["value"] = abs(gapv)
     return mapping
 
-def extract_and_solve(text: str, cand):
-    """Phase-2：对单一候选进行抽取→=匹配→求解，返回(分数,结果包,图)"""
+def extract(text: str, cand, spans: SpanTable = None, hits=None):
+    """Phase-2 抽取：对单一候选跑该 topic 的规则、定模式、跑 __AUTO__ hook，返回 GraphBuilder（不匹配、不求解）
+    spans：preprocess 切好的数值跨度表，各候选共用同一张
+    hits：该 topic 规则在 text 上的命中 [(action, match)]；与 mode 无关，同 topic 的候选共用一份，不给则现扫"""
     g = bd.GraphBuilder()
-    g.G.graph.update(raw_text=text)
+    g.G.graph.update(raw_text=text, spans=spans if spans is not None else SpanTable(text))
 
-    topic, mode, conf = cand["topic"], cand.get("mode"), cand.get("conf", 0.0)
+    topic, mode = cand["topic"], cand.get("mode")
 
-    # 抽取规则（Regex，仅跑该 topic 的 Phase-2 规则）
-    for rx, fn in R.RULE_REGISTRY.get(topic, []):
-        if rx == "__AUTO__":  # 兼容旧规则写法：忽略 __AUTO__
-            continue
-        it = re.finditer(rx, text, flags=re.I|re.S) if isinstance(rx, str) else rx.finditer(text)
-        for m in it:
-            fn(m, g)
+    # 抽取规则（Regex / 跨度表查询，仅跑该 topic 的 Phase-2 规则；单遍扫描，按规则顺序回调）
+    if hits is None:
+        hits = R.rule_scanner(topic).scan(text, g.G.graph["spans"])
+    for fn, m in hits:
+        fn(m, g)
 
     # 设定题型与模式（若路由阶段没给出 mode，可允许后续规范函数修正）
     if mode:
@@ -303,15 +304,42 @@ def extract_and_solve(text: str, cand):
     for rx, fn in R.RULE_REGISTRY.get(topic, []):
         if rx == "__AUTO__":
             fn(g)
+    return g
+
+def _fully_numeric(solved) -> bool:
+    """求解结果非空，且每个值都是有限的具体数（没有残留符号）"""
+    if not isinstance(solved, dict) or not solved:
+        return False
+    for v in solved.values():
+        if isinstance(v, bool) or not (isinstance(v, numbers.Number) or getattr(v, "is_number", False)):
+            return False
+        try:
+            if not math.isfinite(float(v)):
+                return False
+        except (TypeError, ValueError):
+            return False
+    return True
+
+def extract_and_solve(text: str, cand, mode_prior=None, spans: SpanTable = None, hits=None):
+    """Phase-2：对单一候选进行抽取→=匹配→求解，返回(分数,结果包,图)
+    mode_prior：{mode: 置信度}，模式没定下来时供 matcher 跨模式推测匹配排序用
+    spans / hits：见 extract"""
+    g = extract(text, cand, spans, hits)
+    topic, conf = cand["topic"], cand.get("conf", 0.0)
     
     # print("DEBUG all nodes:", [(nid, d.get("type"), d.get("role"), d.get("value"), d.get("unit")) for nid, d in g.G.nodes(data=True)])
 
     print(f"DEBUG [{topic}] nodes:", [(nid, d.get("type"), d.get("role"), d.get("value")) for nid, d in g.G.nodes(data=True)])
     
-    # 子图匹配
+    # 子图匹配（mode 仍为 None 时，matcher 在该 topic 全部模板里推测匹配，并记下胜出的 mode）
+    if g.G.graph.get("mode") is None and mode_prior:
+        g.G.graph["mode_prior"] = mode_prior
     tpl, mapping = match(g.G)
     if not tpl:
         return 0.0, {"error": "no_match", "topic": topic, "mode": g.G.graph.get("mode")}, g.G
+    speculative = g.G.graph.get("mode") is None and g.G.graph.get("matched_mode")
+    if speculative:
+        g.set_pattern(topic, g.G.graph["matched_mode"], override=True)
 
     # 规范化 Trip 变量（确保 Vf>Vs）
     mapping = canonicalize_trip_variables(tpl.get("id"), mapping, g.G)
@@ -323,6 +351,10 @@ def extract_and_solve(text: str, cand):
     except Exception:
         solved = None; ok = False
 
+    # 推测匹配的模板必须解出完整的具体数值，否则不如如实报 no_match
+    if speculative and not _fully_numeric(solved):
+        return 0.0, {"error": "no_match", "topic": topic, "mode": None}, g.G
+
     sc = score_solution(conf, tpl, mapping, ok, g.G)
     
     # 调试信息
@@ -331,7 +363,7 @@ def extract_and_solve(text: str, cand):
     return sc, {"template": tpl.get("id"), "mode": tpl.get("mode", g.G.graph.get("mode")), "solved": solved}, g.G
 
 def solve(question: str):
-    question = preprocess(question)
+    question, spans = preprocess(question)
     
     # Phase-1：路由
     gb, candidates = route_phase(question)
@@ -359,10 +391,21 @@ def solve(question: str):
     candidates.sort(key=lambda x: x.get("conf", 0.0), reverse=True)
     # --- 去重结束 ---
 
+    # 同 topic 各 mode 的路由置信度，作为 mode 未定时推测匹配的先验
+    priors = {}
+    for c in candidates:
+        if c.get("mode"):
+            p = priors.setdefault(c["topic"], {})
+            p[c["mode"]] = max(p.get(c["mode"], 0.0), c.get("conf", 0.0))
+
     # Phase-2：前 K 个候选逐一试解（K=3 可调）
-    tried = []
+    # 规则命中只与 topic 有关：同 topic 不同 mode 的候选共用一次扫描，只重放动作与 hook（它们依赖 mode）
+    tried, scans = [], {}
     for cand in candidates[:3]:
-        sc, res, g = extract_and_solve(question, cand)
+        topic = cand["topic"]
+        if topic not in scans:
+            scans[topic] = list(R.rule_scanner(topic).scan(question, spans))
+        sc, res, g = extract_and_solve(question, cand, priors.get(topic), spans, scans[topic])
         tried.append((sc, cand, res))
 
     if not tried:
@@ -387,5 +430,7 @@ if __name__=="__main__":
             print(f"\nQ{i}: {q}")
             print("----->", solve(q))
             print(f"数据集中标记的答案: {item.get('answer')}")
+        # 每条抽取规则被必需字面量门控跳过的次数
+        R.print_rule_skip_stats()
     else:
         print(f"Dataset not found: {dataset_path}")
\ No newline at end of file
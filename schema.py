@@ -32,7 +32,7 @@ OP_ENUM = {"ADD","SUB","PLUS1","MINUS1","EQUAL", "FLOOR_DIV", "X4_CORNERS"}
 
 PAT_TOPIC = {"tree","trip","work"}
 PAT_MODE  = {
-    "tree": {"none_end_quantity", "one_end_quantity", "both_ends_quantity", "both_ends_distance", "rectangle_closed", "linear", "both_ends_compare", "multi_segment", "loop_closed", "adjacent_share", "two_sides_wrap", "one_end_distance", "none_end_distance", "rectangle_nocorner","rectangle_diffI_closed", "rectangle_diffI_nocorner", "both_ends_two_sides", "one_end_from_segments", "none_end_from_segments", "multi_segment_dedup", "loop_closed_distance"},
+    "tree": {"none_end_quantity", "one_end_quantity", "both_ends_quantity", "both_ends_distance", "rectangle_closed", "linear", "both_ends_compare", "multi_segment", "loop_closed", "adjacent_share", "two_sides_wrap", "one_end_distance", "none_end_distance", "rectangle_nocorner","rectangle_diffI_closed", "rectangle_diffI_nocorner", "both_ends_two_sides", "both_ends_two_intervals", "one_end_from_segments", "none_end_from_segments", "multi_segment_dedup", "loop_closed_distance"},
     "trip": {"join","chase","round"},
     "work": {"coop","solo","split"}
 }
\ No newline at end of file
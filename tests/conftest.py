@@ -0,0 +1,71 @@
+import sys, pathlib, contextlib, io, json, functools
+import pytest
+
+# 仓库根目录没有打包配置，直接把它放到 sys.path 上，测试里照常 import core / run_main
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+with contextlib.redirect_stdout(io.StringIO()):  # registry / run_main 加载时会打印模板信息
+    import run_main
+    from core.matcher import match
+
+DATASET = ROOT / "dataset"
+JSON_SETS = ["tree_basic.json", "tree_upgrade.json", "PlantingTree1k.json"]
+XLSX_SETS = ["Trip_test.xlsx", "test_syntax.xlsx", "PlantingTree100.xlsx"]
+
+
+@functools.lru_cache(maxsize=None)
+def questions(name: str) -> tuple:
+    if name.endswith(".json"):
+        return tuple(q["question"] for q in json.load(open(DATASET / name, encoding="utf-8")))
+    import pandas as pd
+    return tuple(str(q) for q in pd.read_excel(DATASET / name)["question"])
+
+
+@functools.lru_cache(maxsize=None)
+def problem_graphs(name: str) -> tuple:
+    """每道题、每个路由候选（按 topic, mode 去重）抽取出的题目图"""
+    graphs = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for q in questions(name):
+            text, spans = run_main.preprocess(q)
+            _, cands = run_main.route_phase(text)
+            seen = set()
+            for cand in cands:
+                key = (cand["topic"], cand.get("mode"))
+                if key not in seen:
+                    seen.add(key)
+                    graphs.append(run_main.extract(text, cand, spans).G)
+    return tuple(graphs)
+
+
+@functools.lru_cache(maxsize=None)
+def matched(name: str) -> tuple:
+    """problem_graphs 里匹配到模板的 (tpl, mapping, G)"""
+    out = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for G in problem_graphs(name):
+            tpl, mapping = match(G)
+            if tpl:
+                out.append((tpl, mapping, G))
+    return tuple(out)
+
+
+@pytest.fixture(scope="module", params=JSON_SETS + XLSX_SETS)
+def dataset(request):
+    """数据集文件名；文件缺失时跳过"""
+    if not (DATASET / request.param).exists():
+        pytest.skip(f"数据集缺失：{request.param}")
+    return request.param
+
+
+@pytest.fixture(scope="module")
+def graphs(dataset):
+    gs = problem_graphs(dataset)
+    assert gs, f"{dataset} 没有建出任何题目图"
+    return gs
+
+
+@pytest.fixture(scope="module")
+def matches(dataset):
+    return matched(dataset)
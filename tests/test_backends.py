@@ -0,0 +1,17 @@
+"""
+生成匹配函数（codegen）与 VF2 参照实现的等价性：用自带数据集里的题目走一遍路由 + 抽取建图，
+两种后端在每张图上的结构命中（rank、变体、映射）必须完全相同。
+"""
+from core import registry as R
+from core.matcher import compare_backends
+
+
+def test_backends_agree_on_own_candidates(graphs):
+    bad = [(i, diff) for i, G in enumerate(graphs) if (diff := compare_backends(G))]
+    assert bad == []
+
+
+def test_backends_agree_on_all_templates(graphs):
+    every = R.all_candidates()
+    bad = [(i, diff) for i, G in enumerate(graphs) if (diff := compare_backends(G, every))]
+    assert bad == []
@@ -0,0 +1,150 @@
+"""
+声明式规则：改写成 RuleSpec 的规则与原来的 lambda 建出同样的图；SpecAction 经 pickle 往返后照常执行；
+规则哈希（spec_hash / legacy_hash）与 PYTHONHASHSEED 无关。
+"""
+import json, os, pickle, re, subprocess, sys
+import pytest
+from conftest import ROOT, DATASET, questions
+import core.builder as gb
+from core import registry as R
+from core.rulespec import RuleSpec, NodeSpec
+
+_num = lambda s: float(s) if '.' in s else int(s)  # 同 rules_tree_basic._num
+
+
+def _seed(*nodes, **graph):
+    """预置节点（(type, value)…）与图属性的构造函数，每个用例各建一份新图"""
+    def build():
+        g = gb.GraphBuilder()
+        for t, v in nodes:
+            g.add_node(type=t, value=v)
+        g.G.graph.update(graph)
+        return g
+    return build
+
+
+def _snapshot(g):
+    G = g.G
+    return (dict(G.nodes(data=True)), sorted(map(repr, G.edges(data=True))),
+            {k: v for k, v in G.graph.items() if k != "spans"})
+
+
+def _run(rx, fn, text, build):
+    g = build()
+    for m in rx.finditer(text):
+        fn(m, g)
+    return _snapshot(g)
+
+
+# (改写前的 lambda 规则, 改写后的 RuleSpec, 题目文本)，原样取自改写前的 rules_*.py
+CONVERTED = [
+    ((re.compile(r'(栽|种|插)[^。；]*?(树|柳树|杨树|旗|红旗|垃圾桶|路灯)', re.I),
+      lambda m, g: (g.G.graph.get("topic") or g.G.graph.__setitem__("topic", "tree"))),
+     RuleSpec(r'(栽|种|插)[^。；]*?(树|柳树|杨树|旗|红旗|垃圾桶|路灯)', re.I,
+              when=("!graph:topic",), graph=(("topic", "tree"),)),
+     "在路边栽柳树，又种杨树"),
+    ((re.compile(r'(?:共|一共|总共)?[^。；\n]*?(?:栽|种|插)[^。；\n]*?(\d+)\s*棵'
+                 r'[^。；\n]*?(?:树|柳树|杨树|树苗)?', re.I),
+      lambda m, g: (
+          (g.set_value(g.last_of("TreeCnt"), _num(m.group(1)))
+           if g.last_of("TreeCnt") and g.G.nodes[g.last_of("TreeCnt")].get("value") in (None, )
+           else g.add_node(type="TreeCnt", value=_num(m.group(1)))))),
+     RuleSpec(r'(?:共|一共|总共)?[^。；\n]*?(?:栽|种|插)[^。；\n]*?(\d+)\s*棵'
+              r'[^。；\n]*?(?:树|柳树|杨树|树苗)?', re.I,
+              nodes=(NodeSpec("TreeCnt", "$1", how="fill"),)),
+     "一共栽了25棵树。又种15棵"),
+    ((re.compile(r'(?:共|一共|总共)?[^。；\n]*?(?:有|栽|种|插|站|排|安装|放置|设置|排列)'
+                 r'[^。；\n]*?(\d+)\s*(?:棵|位|个|辆|盏|面)'
+                 r'(?:[^。；\n]*?(?:树|柳树|杨树|树苗|小朋友|同学|车|车辆|灯|路灯|垃圾桶|红旗|旗))?', re.I),
+      lambda m, g: (
+          g.add_node(type="TreeCnt", value=_num(m.group(1)))
+          if not g.last_of("TreeCnt")
+          else g.set_value(g.last_of("TreeCnt"), _num(m.group(1))))),
+     RuleSpec(r'(?:共|一共|总共)?[^。；\n]*?(?:有|栽|种|插|站|排|安装|放置|设置|排列)'
+              r'[^。；\n]*?(\d+)\s*(?:棵|位|个|辆|盏|面)'
+              r'(?:[^。；\n]*?(?:树|柳树|杨树|树苗|小朋友|同学|车|车辆|灯|路灯|垃圾桶|红旗|旗))?',
+              re.I, nodes=(NodeSpec("TreeCnt", "$1", how="last"),)),
+     "操场上站了30位同学。又排了12个"),
+    ((re.compile(r'(平均)?每隔\s*(?:多少|几)\s*(?:米|m)?', re.I),
+      lambda m, g: (g.add_node(type="Interval", value=None) if not g.last_of("Interval") else None)),
+     RuleSpec(r'(平均)?每隔\s*(?:多少|几)\s*(?:米|m)?', re.I,
+              nodes=(NodeSpec("Interval", None),), when=("!last_of:Interval",)),
+     "平均每隔多少米栽一棵？每隔几米"),
+    ((re.compile(r'(?:两侧|两边)[^。；\n]*?(?:原打算|原计划)[^。；\n]*?(\d+)\s*棵'
+                 r'[^。；\n]*?每隔\s*(\d+(?:\.\d+)?)\s*(?:米|m)'
+                 r'[^。；\n]*?(?:实际|后来|现在)[^。；\n]*?(\d+)\s*棵', re.I),
+      lambda m, g: (
+          g.add_node(type="TreeCnt", value=_num(m.group(1))),
+          g.add_node(type="Interval", value=_num(m.group(2))),
+          g.add_node(type="TreeCnt", value=_num(m.group(3))),
+          g.add_node(type="Interval", value=None),
+          g.set_pattern("tree", "both_ends_compare"))),
+     RuleSpec(r'(?:两侧|两边)[^。；\n]*?(?:原打算|原计划)[^。；\n]*?(\d+)\s*棵'
+              r'[^。；\n]*?每隔\s*(\d+(?:\.\d+)?)\s*(?:米|m)'
+              r'[^。；\n]*?(?:实际|后来|现在)[^。；\n]*?(\d+)\s*棵', re.I,
+              nodes=(NodeSpec("TreeCnt", "$1"), NodeSpec("Interval", "$2"),
+                     NodeSpec("TreeCnt", "$3"), NodeSpec("Interval", None)),
+              set_pattern=("tree", "both_ends_compare")),
+     "路两侧原计划栽41棵树，每隔2.5米一棵，实际只栽了21棵"),
+    ((re.compile(r'(领先|落后|相差|间隔)\s*(\d+(?:\.\d+)?)\s*(千?米|公里|km|米|m)', re.I),
+      lambda m, g: g.add_node(type="Length", value=float(m.group(2)), unit=m.group(3), role="gap")),
+     RuleSpec(r'(领先|落后|相差|间隔)\s*(\d+(?:\.\d+)?)\s*(千?米|公里|km|米|m)', re.I,
+              nodes=(NodeSpec("Length", "$2", unit="$3", role="gap", conv="float"),)),
+     "甲领先乙 300 米，后来落后 2KM"),
+    ((re.compile(r'(几|多少)\s*(小时|h|分钟|min|秒|s)', re.I),
+      lambda m, g: (g.add_node(type="Time", value=None, unit=m.group(2), role="target"),
+                    g.G.graph.__setitem__("target", "Time"))),
+     RuleSpec(r'(几|多少)\s*(小时|h|分钟|min|秒|s)', re.I,
+              nodes=(NodeSpec("Time", None, unit="$2", role="target"),), graph=(("target", "Time"),)),
+     "经过几小时两车相遇？"),
+]
+SEEDS = [_seed(), _seed(("TreeCnt", None), ("Interval", 5)), _seed(("TreeCnt", 8), topic="tree")]
+
+
+@pytest.mark.parametrize("old, spec, text", CONVERTED)
+@pytest.mark.parametrize("build", SEEDS)
+def test_spec_builds_same_graph_as_lambda(old, spec, text, build):
+    rx, fn = R.compile_rule_spec(spec)
+    assert rx.search(text)
+    assert _run(rx, fn, text, build) == _run(*old, text, build)
+
+
+@pytest.mark.parametrize("old, spec, text", CONVERTED)
+def test_spec_action_survives_pickle(old, spec, text):
+    rx, fn = R.compile_rule_spec(spec)
+    back = pickle.loads(pickle.dumps(fn))
+    assert back.spec == spec
+    assert _run(rx, back, text, _seed()) == _run(rx, fn, text, _seed())
+
+
+@pytest.mark.parametrize("topic, name", [("tree", "tree_basic.json"), ("trip", "Trip_test.xlsx")])
+def test_registered_spec_actions_survive_pickle(topic, name):
+    """注册表里每条声明式规则经 pickle 往返后，在整套题上与原动作建出同样的图"""
+    if not (DATASET / name).exists():
+        pytest.skip(f"数据集缺失：{name}")
+    rules = [(rx, fn) for (rx, fn), spec in zip(R.RULE_REGISTRY[topic], R.RULE_SPECS[topic])
+             if spec is not None]
+    assert rules
+    for rx, fn in rules:
+        back = pickle.loads(pickle.dumps(fn))
+        for q in questions(name):
+            if rx.search(q):
+                assert _run(rx, back, q, _seed()) == _run(rx, fn, q, _seed()), (rx.pattern, q)
+
+
+_DUMP_HASHES = ("import json, contextlib, io\n"
+                "with contextlib.redirect_stdout(io.StringIO()):\n"
+                "    from core import registry as R\n"
+                "print(json.dumps(R.RULE_HASHES, sort_keys=True))")
+
+
+def test_rule_hashes_ignore_hash_seed():
+    """spec_hash / legacy_hash 在不同 PYTHONHASHSEED 的进程里完全相同"""
+    out = []
+    for seed in ("0", "1", "12345"):
+        env = dict(os.environ, PYTHONHASHSEED=seed)
+        res = subprocess.run([sys.executable, "-c", _DUMP_HASHES], cwd=ROOT, env=env,
+                             capture_output=True, text=True, check=True)
+        out.append(json.loads(res.stdout.strip().splitlines()[-1]))
+    assert out[0] == out[1] == out[2]
+    assert out[0] == json.loads(json.dumps(R.RULE_HASHES, sort_keys=True))
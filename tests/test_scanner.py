@@ -0,0 +1,88 @@
+"""
+抽取规则扫描器：RuleScanner.matches 与逐条 rx.finditer 的命中完全一致；
+required_literals 在分支 / 可选重复 / 前后瞻 / 忽略大小写的写法上推出的字面量既不漏命中，也不过宽。
+"""
+import re
+import pytest
+from conftest import questions
+import run_main
+from core import registry as R
+from core.scanner import required_literals, LiteralGate
+from core.spans import SpanQuery
+from rules.rules_tree_basic import INTERVAL_LITERALS
+
+
+def _key(ms):
+    return [(m.span(), m.groups()) for m in ms]
+
+
+@pytest.mark.parametrize("topic", ["tree", "trip"])
+def test_scanner_matches_finditer(dataset, topic):
+    sc = R.rule_scanner(topic)
+    bad = []
+    for q in questions(dataset):
+        text, spans = run_main.preprocess(q)
+        for t, sp in ((q, None), (text, spans)):
+            for i, ((rx, _), got) in enumerate(zip(sc.rules, sc.matches(t, sp))):
+                want = list(rx.finditer(t, sp) if isinstance(rx, SpanQuery) else rx.finditer(t))
+                if _key(got) == _key(want):
+                    continue
+                # 唯一允许的差别：r'.+' 的 INTERVAL_RULE 手工指定了字面量，文本里没有时整条跳过
+                if not got and sc.literals[i] == INTERVAL_LITERALS and rx.pattern == ".+" \
+                        and not any(w in t for w in INTERVAL_LITERALS):
+                    continue
+                bad.append((topic, i, rx.pattern, t))
+    assert bad == []
+
+
+@pytest.mark.parametrize("pattern, flags, literals, hit", [
+    # 分支：每个分支各出一个字面量
+    (r"(?:每隔|间隔)(\d+)米", 0, {"每隔", "间隔"}, "间隔5米"),
+    (r"(\d+)?米|(\d+)千米", 0, {"米", "千米"}, "3千米"),
+    (r"甲|乙地", 0, {"甲", "乙地"}, "到乙地"),
+    # 可选 / 任意次重复的部分不是必需的
+    (r"共(?:有)?(\d+)棵", 0, {"共"}, "共12棵"),
+    (r"(?:的)?(\d+)棵", 0, {"棵"}, "12棵"),
+    (r"(?:一共)*(\d+)辆", 0, {"辆"}, "8辆"),
+    # 前后瞻不计入
+    (r"(?<=每)(\d+)米", 0, {"米"}, "每5米"),
+    (r"(?<!不)相距(\d+)", 0, {"相距"}, "相距40"),
+    (r"(?=.*米)(\d+)", 0, None, "5米"),
+    # 忽略大小写：字面量照原样记，自动机按大小写变体去找
+    (r"km(\d+)", re.I, {"km"}, "KM30"),
+    (r".+", 0, None, "任意"),
+])
+def test_required_literals(pattern, flags, literals, hit):
+    rx = re.compile(pattern, flags)
+    lits = required_literals(rx)
+    assert lits == (frozenset(literals) if literals else None)
+    assert rx.search(hit)
+    gate = LiteralGate([lits])
+    assert gate.may_fire(0, gate.found(hit))
+
+
+def test_matches_builds_one_span_table(monkeypatch):
+    """不给 spans 时 matches() 只建一张跨度表，所有 SpanQuery 规则共用"""
+    import core.spans, core.scanner
+    built = []
+
+    class Counting(core.spans.SpanTable):
+        def __init__(self, text):
+            built.append(text)
+            super().__init__(text)
+
+    monkeypatch.setattr(core.spans, "SpanTable", Counting)
+    monkeypatch.setattr(core.scanner, "SpanTable", Counting)
+    text = "一条路长100米，宽8米，每隔5米栽一棵树"
+    sc = R.rule_scanner("tree")
+    hits = sc.matches(text)
+    assert sum(1 for i in sc._span if hits[i]) >= 2
+    assert built == [text]
+
+
+def test_cap_interval_without_graph_spans():
+    """run_demo 的图上没有 raw_text / spans：间隔按命中文本本身的跨度表取"""
+    import core.builder as gb
+    from rules.rules_tree_basic import _cap_interval
+    g = gb.GraphBuilder()
+    assert _cap_interval(g, "路的一边每隔5米栽一棵树") == 5
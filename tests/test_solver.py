@@ -0,0 +1,70 @@
+"""
+求解器：预编译闭式解的快路径与 SymPy 回退路径在每个匹配结果上给出同样的值、同样的类型
+（整数已知量得到精确的 Integer / Rational，而不是有损的 float）。
+"""
+import contextlib, io, math
+from sympy import Rational
+from core import solver
+
+
+def _slow(tpl, mapping, G, monkeypatch):
+    with monkeypatch.context() as mp:
+        mp.setattr(solver, "_eval_solved_form", lambda form, given: None)
+        return solver.solve_equation(tpl, mapping, G)
+
+
+def test_fast_path_matches_sympy(matches, monkeypatch):
+    bad = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for k, (tpl, mapping, G) in enumerate(matches):
+            try:
+                fast = solver.solve_equation(tpl, mapping, G)
+                slow = _slow(tpl, mapping, G, monkeypatch)
+            except Exception:  # 如含 floor 的方程 SymPy 解不了（run_main 同样按求解失败处理）
+                continue
+            same = fast.keys() == slow.keys() and all(
+                type(fast[n]) is type(slow[n]) and fast[n] == slow[n] for n in fast)
+            if not same:
+                bad.append((k, tpl["id"], fast, slow))
+    assert bad == []
+
+
+def test_fast_path_keeps_fractions_exact():
+    form = {"given": ("D", "V"), "unknowns": ("T",), "check": None, "fn": lambda d, v: [d / v]}
+    assert solver._eval_solved_form(form, {"D": 9, "V": 5}) == {"T": Rational(9, 5)}
+    assert solver._eval_solved_form(form, {"D": 1, "V": 3})["T"] == Rational(1, 3)
+    assert solver._eval_solved_form(form, {"D": 1, "V": 0}) is None
+
+
+def _close(a, b) -> bool:
+    if a is None or b is None:
+        return a is b
+    try:
+        return math.isclose(float(a), float(b), rel_tol=1e-9, abs_tol=1e-9)
+    except TypeError:  # 非数值结果（符号表达式等）原样比较
+        return a == b
+
+
+def test_solve_batch_matches_solve_equation(matches):
+    """
+    solve_batch 逐题与 solve_equation 数值一致（前者按 float 求值，后者给精确 Rational，故按容差比较）；
+    solve_equation 经 _intify_if_count 整数化成 int 的计数类结果，批量也得是 int。solve_equation 抛异常的题，批量结果为 None
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        batch = solver.solve_batch(list(matches))
+    assert len(batch) == len(matches)
+    bad = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for k, ((tpl, mapping, G), got) in enumerate(zip(matches, batch)):
+            try:
+                want = solver.solve_equation(tpl, mapping, G)
+            except Exception:
+                if got is not None:
+                    bad.append((k, tpl["id"], got, "raised"))
+                continue
+            same = got is not None and got.keys() == want.keys() and all(
+                _close(got[n], want[n]) and (isinstance(got[n], int) or not isinstance(want[n], int))
+                for n in want)
+            if not same:
+                bad.append((k, tpl["id"], got, want))
+    assert bad == []